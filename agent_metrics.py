@@ -0,0 +1,364 @@
+"""
+📈 AutoCred Agent Metrics - Estatísticas dos agentes em contadores por janela de tempo
+
+Cada agente tem três séries de buckets (minuto, hora, dia) num array contíguo de
+floats usado como anel: o bucket de um instante é `(instante // largura) % tamanho` e
+um vetor paralelo guarda qual período ocupa cada bucket (o de um período antigo é
+zerado na escrita e ignorado na leitura). Registrar um evento custa O(1) e perguntas
+como "conversas na semana" ou "tempo médio de resposta na última hora" somam no
+máximo os buckets da janela - o histórico de mensagens não é lido.
+
+Cada bucket tem os contadores (conversas, conversões, mensagens, respostas, soma dos
+tempos de resposta) e o histograma dos tempos de resposta em faixas fixas.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from database import AgentMetricsRepository
+
+AGENT_METRICS_SAVE_INTERVAL = float(os.getenv("AGENT_METRICS_SAVE_INTERVAL", "60"))
+# Conversa no WhatsApp: nova quando o contato volta depois de 24h sem mensagens
+AGENT_CONVERSATION_GAP = float(os.getenv("AGENT_CONVERSATION_GAP", str(24 * 3600)))
+AGENT_METRICS_MAX_CONTACTS = int(os.getenv("AGENT_METRICS_MAX_CONTACTS", "100000"))
+
+# Campos de cada bucket
+CONVERSATIONS, CONVERSIONS, MESSAGES, RESPONSES, RESPONSE_TIME = range(5)
+HISTOGRAM = 5
+# Limites superiores (segundos) das faixas do histograma; a última faixa é "acima de 300s"
+RESPONSE_TIME_BOUNDS = (0.5, 1, 2, 5, 15, 60, 300)
+FIELDS = HISTOGRAM + len(RESPONSE_TIME_BOUNDS) + 1
+
+# (nome, largura do bucket em segundos, quantidade de buckets)
+SERIES = (
+    ("minute", 60, 60),
+    ("hour", 3600, 48),
+    ("day", 86400, 92),
+)
+SERIES_BY_NAME = {name: (width, size) for name, width, size in SERIES}
+
+
+def histogram_bin(seconds: float) -> int:
+    for index, bound in enumerate(RESPONSE_TIME_BOUNDS):
+        if seconds <= bound:
+            return index
+    return len(RESPONSE_TIME_BOUNDS)
+
+
+class BucketSeries:
+    """Anel de `size` buckets de `width` segundos, FIELDS contadores por bucket"""
+
+    __slots__ = ("width", "size", "periods", "values")
+
+    _zero_row = array("d", bytes(8 * FIELDS))
+
+    def __init__(self, width: int, size: int):
+        self.width = width
+        self.size = size
+        self.periods = array("d", [-1.0]) * size
+        self.values = array("d", bytes(8 * size * FIELDS))
+
+    def _offset(self, period: int) -> Optional[int]:
+        slot = period % self.size
+        current = self.periods[slot]
+        if current != period:
+            if current > period:
+                return None  # evento mais antigo que o anel
+            self.values[slot * FIELDS:(slot + 1) * FIELDS] = self._zero_row
+            self.periods[slot] = period
+        return slot * FIELDS
+
+    def add(self, when: float, field: int, amount: float = 1.0):
+        offset = self._offset(int(when // self.width))
+        if offset is not None:
+            self.values[offset + field] += amount
+
+    def totals(self, periods: int, now: float) -> List[float]:
+        """Soma dos últimos `periods` buckets (o atual incluso): O(periods)"""
+        result = [0.0] * FIELDS
+        last = int(now // self.width)
+        values = self.values
+        for period in range(last - min(periods, self.size) + 1, last + 1):
+            slot = period % self.size
+            if self.periods[slot] == period:
+                offset = slot * FIELDS
+                for field in range(FIELDS):
+                    result[field] += values[offset + field]
+        return result
+
+
+class AgentMetrics:
+    """Séries de um agente + totais desde o início"""
+
+    __slots__ = ("series", "lifetime", "last_activity")
+
+    def __init__(self):
+        self.series = {name: BucketSeries(width, size) for name, width, size in SERIES}
+        self.lifetime = array("d", bytes(8 * FIELDS))
+        self.last_activity = 0.0
+
+    def add(self, when: float, field: int, amount: float = 1.0):
+        for series in self.series.values():
+            series.add(when, field, amount)
+        self.lifetime[field] += amount
+        self.last_activity = max(self.last_activity, when)
+
+    def to_bytes(self) -> bytes:
+        data = array("d")
+        for series in self.series.values():
+            data.extend(series.periods)
+            data.extend(series.values)
+        data.extend(self.lifetime)
+        data.append(self.last_activity)
+        return data.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> Optional["AgentMetrics"]:
+        """None quando o layout gravado não bate com a configuração atual das séries"""
+        data = array("d")
+        data.frombytes(blob)
+        metrics = cls()
+        expected = sum(size * (FIELDS + 1) for _, _, size in SERIES) + FIELDS + 1
+        if len(data) != expected:
+            return None
+        position = 0
+        for series in metrics.series.values():
+            series.periods = data[position:position + series.size]
+            position += series.size
+            series.values = data[position:position + series.size * FIELDS]
+            position += series.size * FIELDS
+        metrics.lifetime = data[position:position + FIELDS]
+        metrics.last_activity = data[-1]
+        return metrics
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    conversations = values[CONVERSATIONS]
+    responses = values[RESPONSES]
+    return {
+        "conversations": int(conversations),
+        "conversions": int(values[CONVERSIONS]),
+        "messages": int(values[MESSAGES]),
+        "responses": int(responses),
+        "average_response_time": round(values[RESPONSE_TIME] / responses, 2) if responses else 0,
+        "conversion_rate": round(values[CONVERSIONS] / conversations * 100, 1) if conversations else 0
+    }
+
+
+def histogram(values: List[float]) -> Dict[str, int]:
+    labels = [f"<={bound}s" for bound in RESPONSE_TIME_BOUNDS] + [f">{RESPONSE_TIME_BOUNDS[-1]}s"]
+    return {label: int(values[HISTOGRAM + index]) for index, label in enumerate(labels)}
+
+
+class AgentMetricsStore:
+    """Contadores por agente, atualizados pelo chat e pelos eventos do webhook"""
+
+    def __init__(self, repository: Optional[AgentMetricsRepository] = None,
+                 on_save: Optional[Callable[[Dict[str, Dict[str, Any]]], None]] = None,
+                 save_interval: float = AGENT_METRICS_SAVE_INTERVAL,
+                 conversation_gap: float = AGENT_CONVERSATION_GAP,
+                 max_contacts: int = AGENT_METRICS_MAX_CONTACTS):
+        self.repository = repository
+        self.on_save = on_save
+        self.save_interval = save_interval
+        self.conversation_gap = conversation_gap
+        self.max_contacts = max_contacts
+        self._agents: Dict[str, AgentMetrics] = {}
+        self._dirty = set()
+        # (agente, contato) -> [última mensagem, primeira mensagem sem resposta, converteu]
+        self._contacts: "OrderedDict[tuple, list]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.events = 0
+        self.saves = 0
+
+    def load(self) -> int:
+        """Recarrega os contadores gravados (layout incompatível é descartado)"""
+        if self.repository is None:
+            return 0
+        loaded = 0
+        with self._lock:
+            for record in self.repository.list_all():
+                metrics = AgentMetrics.from_bytes(record["buckets"])
+                if metrics is not None:
+                    self._agents[record["id"]] = metrics
+                    loaded += 1
+        return loaded
+
+    def _add(self, agent_id: str, field: int, when: Optional[float], amount: float = 1.0):
+        metrics = self._agents.get(agent_id)
+        if metrics is None:
+            metrics = self._agents[agent_id] = AgentMetrics()
+        metrics.add(time.time() if when is None else when, field, amount)
+        self._dirty.add(agent_id)
+        self.events += 1
+
+    def record_conversation(self, agent_id: str, when: Optional[float] = None):
+        with self._lock:
+            self._add(agent_id, CONVERSATIONS, when)
+
+    def record_conversion(self, agent_id: str, when: Optional[float] = None):
+        with self._lock:
+            self._add(agent_id, CONVERSIONS, when)
+
+    def record_message(self, agent_id: str, when: Optional[float] = None):
+        with self._lock:
+            self._add(agent_id, MESSAGES, when)
+
+    def record_response(self, agent_id: str, seconds: float, when: Optional[float] = None):
+        seconds = max(0.0, seconds)
+        with self._lock:
+            self._add(agent_id, RESPONSES, when)
+            self._add(agent_id, RESPONSE_TIME, when, seconds)
+            self._add(agent_id, HISTOGRAM + histogram_bin(seconds), when)
+
+    def record_inbound(self, agent_id: str, contact: str, when: float, conversion: bool = False):
+        """Mensagem do contato (webhook): abre conversa depois do intervalo, marca a espera pela resposta"""
+        key = (agent_id, contact)
+        with self._lock:
+            entry = self._contacts.get(key)
+            if entry is None or when - entry[0] > self.conversation_gap:
+                entry = [when, None, False]
+                self._add(agent_id, CONVERSATIONS, when)
+            self._contacts[key] = entry
+            self._contacts.move_to_end(key)
+            while len(self._contacts) > self.max_contacts:
+                self._contacts.popitem(last=False)
+            entry[0] = max(entry[0], when)
+            if entry[1] is None:
+                entry[1] = when
+            self._add(agent_id, MESSAGES, when)
+            if conversion and not entry[2]:
+                entry[2] = True
+                self._add(agent_id, CONVERSIONS, when)
+
+    def record_outbound(self, agent_id: str, contact: str, when: float):
+        """Mensagem enviada pela instância: fecha a espera e conta o tempo de resposta"""
+        with self._lock:
+            entry = self._contacts.get((agent_id, contact))
+            if entry is None or entry[1] is None or when < entry[1]:
+                return
+            waited = when - entry[1]
+            entry[1] = None
+            self.record_response(agent_id, waited, when)
+
+    def window(self, agent_id: str, series: str, periods: int, now: Optional[float] = None) -> List[float]:
+        """Contadores somados nos últimos `periods` buckets da série (minute/hour/day)"""
+        with self._lock:
+            metrics = self._agents.get(agent_id)
+            if metrics is None:
+                return [0.0] * FIELDS
+            return metrics.series[series].totals(periods, time.time() if now is None else now)
+
+    def summary(self, agent_id: str, now: Optional[float] = None) -> Dict[str, Any]:
+        """Totais, última hora, últimas 24h e últimos 7 dias - O(buckets)"""
+        with self._lock:
+            metrics = self._agents.get(agent_id)
+            lifetime = list(metrics.lifetime) if metrics is not None else [0.0] * FIELDS
+            last_activity = metrics.last_activity if metrics is not None else 0.0
+            return {
+                "total": summarize(lifetime),
+                "last_hour": summarize(self.window(agent_id, "minute", 60, now)),
+                "last_24h": summarize(self.window(agent_id, "hour", 24, now)),
+                "last_7_days": summarize(self.window(agent_id, "day", 7, now)),
+                "response_time_histogram": histogram(lifetime),
+                "last_activity": datetime.fromtimestamp(last_activity).isoformat() if last_activity else None
+            }
+
+    def performance_stats(self, agent_id: str) -> Dict[str, Any]:
+        """Totais no formato de CustomAgent.performance_stats"""
+        with self._lock:
+            metrics = self._agents.get(agent_id)
+            total = summarize(list(metrics.lifetime) if metrics is not None else [0.0] * FIELDS)
+        return {
+            "total_conversations": total["conversations"],
+            "successful_conversions": total["conversions"],
+            "average_response_time": total["average_response_time"]
+        }
+
+    def overview(self, agent_ids: Iterable[str], active_within: float = 86400,
+                 now: Optional[float] = None) -> Dict[str, Any]:
+        """Totais somados dos agentes e quantos tiveram atividade nos últimos `active_within` segundos"""
+        now = time.time() if now is None else now
+        lifetime = [0.0] * FIELDS
+        last_24h = [0.0] * FIELDS
+        active = 0
+        with self._lock:
+            for agent_id in agent_ids:
+                metrics = self._agents.get(agent_id)
+                if metrics is None:
+                    continue
+                if metrics.last_activity >= now - active_within:
+                    active += 1
+                for index, value in enumerate(metrics.lifetime):
+                    lifetime[index] += value
+                for index, value in enumerate(metrics.series["hour"].totals(24, now)):
+                    last_24h[index] += value
+        return {"active": active, "total": summarize(lifetime), "last_24h": summarize(last_24h)}
+
+    def forget(self, agent_id: str):
+        """Agente excluído: contadores saem da memória e do banco"""
+        with self._lock:
+            self._agents.pop(agent_id, None)
+            self._dirty.discard(agent_id)
+            for key in [key for key in self._contacts if key[0] == agent_id]:
+                del self._contacts[key]
+        if self.repository is not None:
+            self.repository.delete(agent_id)
+
+    def save(self) -> int:
+        """Grava os agentes alterados desde a última gravação (um BLOB por agente)"""
+        with self._lock:
+            dirty = list(self._dirty)
+            self._dirty.clear()
+            now = datetime.now().isoformat()
+            records = [{"id": agent_id, "buckets": self._agents[agent_id].to_bytes(), "updatedAt": now}
+                       for agent_id in dirty if agent_id in self._agents]
+        if not records:
+            return 0
+        if self.repository is not None:
+            self.repository.save_many(records)
+        if self.on_save is not None:
+            self.on_save({record["id"]: self.performance_stats(record["id"]) for record in records})
+        self.saves += 1
+        return len(records)
+
+    def start(self):
+        """Cria a gravação periódica no event loop atual (idempotente)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        self._loop = loop
+        self._task = loop.create_task(self._run(), name="agent-metrics")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            try:
+                await asyncio.to_thread(self.save)
+            except Exception as e:
+                print(f"❌ Erro ao gravar estatísticas dos agentes: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "agents": len(self._agents),
+                "contacts": len(self._contacts),
+                "pending_save": len(self._dirty),
+                "events": self.events,
+                "saves": self.saves
+            }
+
+    async def close(self) -> int:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        return await asyncio.to_thread(self.save)
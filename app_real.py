@@ -17,6 +17,8 @@ from pathlib import Path
 import uvicorn
 from typing import Optional
 
+from phones import parse_phone, to_whatsapp_jid
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -114,16 +116,18 @@ async def api_send_whatsapp(request: Request):
     """📤 API: Enviar mensagem WhatsApp"""
     try:
         data = await request.json()
-        phone = data.get("phone", "").replace("+", "").replace("-", "").replace("(", "").replace(")", "").replace(" ", "")
+        phone = data.get("phone", "")
         message = data.get("message", "")
         instance_name = data.get("instance", "autocred-main")
         
         if not phone or not message:
             return {"success": False, "error": "Phone e message são obrigatórios"}
         
-        # Garantir formato correto do telefone
-        if not phone.endswith("@s.whatsapp.net"):
-            phone = f"{phone}@s.whatsapp.net"
+        # Garantir formato correto do telefone (55 + DDD + número@s.whatsapp.net)
+        jid = to_whatsapp_jid(phone)
+        if jid is None:
+            return {"success": False, "error": f"Telefone inválido: {parse_phone(phone).error}"}
+        phone = jid
         
         result = await send_whatsapp_message(phone, message, instance_name)
         return result
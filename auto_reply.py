@@ -0,0 +1,189 @@
+"""
+🤖 AutoCred Auto Reply - Resposta automática dos agentes às mensagens do WhatsApp
+
+Mensagem recebida (MESSAGES_UPSERT) -> agente dono da instância -> resposta gerada
+-> /message/sendText da Evolution. Cada instância tem `concurrency` filas limitadas;
+o contato cai sempre na mesma fila (respostas de uma conversa saem na ordem) e cada
+fila tem no máximo um worker, criado quando chega trabalho e encerrado quando ela
+esvazia. Uma instância nunca envia mais que `concurrency` respostas ao mesmo tempo e,
+com a fila cheia, a mensagem fica sem resposta automática (contada em `rejected`) em
+vez de acumular atraso. As filas de uma instância saem da memória quando todas esvaziam.
+
+Resposta simulada do cliente da Evolution (API fora do ar ou sem autenticação, em
+desenvolvimento) não foi entregue: conta em `simulated`, não em `sent` nem na latência.
+
+A latência de ponta a ponta (webhook recebido -> resposta aceita pela Evolution) é
+medida por etapa: espera na fila, geração da resposta e envio.
+"""
+
+import asyncio
+import os
+import time
+import zlib
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+AUTO_REPLY_CONCURRENCY = int(os.getenv("AUTO_REPLY_CONCURRENCY", "2"))
+AUTO_REPLY_QUEUE_SIZE = int(os.getenv("AUTO_REPLY_QUEUE_SIZE", "200"))
+AUTO_REPLY_LATENCY_SAMPLES = int(os.getenv("AUTO_REPLY_LATENCY_SAMPLES", "1000"))
+# Mensagens mais antigas que isso (histórico sincronizado, reenvios atrasados) não são respondidas
+AUTO_REPLY_MAX_AGE = float(os.getenv("AUTO_REPLY_MAX_AGE", "300"))
+
+STAGES = ("queue", "generate", "send", "total")
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class AutoReplyPipeline:
+    """Filas por instância (sharding pelo contato) com workers sob demanda"""
+
+    def __init__(self, generate: Callable[[Dict[str, Any]], Awaitable[Optional[str]]],
+                 send: Callable[[str, str, str], Awaitable[Dict[str, Any]]],
+                 concurrency: int = AUTO_REPLY_CONCURRENCY, queue_size: int = AUTO_REPLY_QUEUE_SIZE,
+                 samples: int = AUTO_REPLY_LATENCY_SAMPLES):
+        self.generate = generate
+        self.send = send
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self._queues: Dict[str, List[deque]] = {}
+        self._workers: Dict[tuple, asyncio.Task] = {}
+        self._latency: Dict[str, Deque[float]] = {stage: deque(maxlen=samples) for stage in STAGES}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.submitted = 0
+        self.rejected = 0
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self.simulated = 0
+
+    def submit(self, instance: str, agent_id: str, contact: str, text: str,
+               received_at: Optional[float] = None) -> bool:
+        """Enfileira sem esperar - False quando a fila do contato nesta instância está cheia"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Event loop novo (restart/testes): workers do loop antigo não existem mais
+            self._loop = loop
+            self._queues.clear()
+            self._workers.clear()
+        shards = self._queues.get(instance)
+        if shards is None:
+            shards = self._queues[instance] = [deque() for _ in range(self.concurrency)]
+        shard = zlib.crc32(contact.encode("utf-8")) % self.concurrency
+        queue = shards[shard]
+        if len(queue) >= self.queue_size:
+            self.rejected += 1
+            return False
+        queue.append({
+            "instance": instance,
+            "agent_id": agent_id,
+            "contact": contact,
+            "text": text,
+            "received_at": received_at or time.time(),
+            "queued_at": time.perf_counter()
+        })
+        self.submitted += 1
+        key = (instance, shard)
+        worker = self._workers.get(key)
+        if worker is None or worker.done():
+            self._workers[key] = loop.create_task(self._worker(key, queue), name=f"auto-reply-{instance}-{shard}")
+        return True
+
+    async def _worker(self, key: tuple, queue: deque):
+        try:
+            while queue:
+                await self._process(queue.popleft())
+        finally:
+            if self._workers.get(key) is asyncio.current_task():
+                del self._workers[key]
+            self._prune(key[0])
+
+    def _prune(self, instance: str):
+        """Remove as filas da instância quando todas estão vazias e sem worker"""
+        shards = self._queues.get(instance)
+        if shards is None or any(shards):
+            return
+        if any((instance, shard) in self._workers for shard in range(len(shards))):
+            return
+        del self._queues[instance]
+
+    async def _process(self, job: Dict[str, Any]):
+        started = time.perf_counter()
+        try:
+            reply = await self.generate(job)
+            generated = time.perf_counter()
+            if not reply:
+                self.skipped += 1
+                return
+            result = await self.send(job["instance"], job["contact"], reply)
+        except Exception as e:
+            self.failed += 1
+            print(f"❌ Erro na resposta automática ({job['instance']} {job['contact']}): {e}")
+            return
+        if not result.get("success"):
+            self.failed += 1
+            print(f"⚠️ Resposta automática não enviada ({job['instance']}): {result.get('error')}")
+            return
+        data = result.get("data")
+        if isinstance(data, dict) and data.get("simulated"):
+            self.simulated += 1
+            return
+        finished = time.perf_counter()
+        self.sent += 1
+        self._latency["queue"].append(started - job["queued_at"])
+        self._latency["generate"].append(generated - started)
+        self._latency["send"].append(finished - generated)
+        self._latency["total"].append(max(0.0, time.time() - job["received_at"]))
+
+    async def drain(self, timeout: float = 10):
+        """Aguarda as respostas pendentes (desligamento e testes)"""
+        deadline = time.monotonic() + timeout
+        while self._workers and time.monotonic() < deadline:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+    async def close(self, timeout: float = 10):
+        try:
+            await asyncio.wait_for(self.drain(timeout), timeout)
+        except asyncio.TimeoutError:
+            pass
+        pending = sum(len(queue) for shards in self._queues.values() for queue in shards)
+        if pending:
+            print(f"⚠️ {pending} respostas automáticas descartadas no desligamento")
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+
+    def latency(self) -> Dict[str, Dict[str, float]]:
+        """p50/p95/máximo (ms) das últimas respostas enviadas, por etapa"""
+        result = {}
+        for stage, values in self._latency.items():
+            samples = list(values)
+            result[stage] = {
+                "p50_ms": round(percentile(samples, 0.5) * 1000, 1),
+                "p95_ms": round(percentile(samples, 0.95) * 1000, 1),
+                "max_ms": round(max(samples, default=0.0) * 1000, 1),
+                "samples": len(samples)
+            }
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "instances": len(self._queues),
+            "active_workers": len(self._workers),
+            "pending": sum(len(queue) for shards in self._queues.values() for queue in shards),
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "simulated": self.simulated,
+            "latency": self.latency()
+        }
@@ -0,0 +1,261 @@
+"""
+💬 AutoCred Chat Sessions - Histórico limitado das conversas com os agentes
+
+Cada sessão guarda só os últimos turnos (deque com tamanho fixo - ring buffer), o
+texto de cada turno é cortado num limite e o número de sessões em memória tem teto
+global: a memória fica estável mesmo com dezenas de milhares de conversas.
+
+As sessões ficam numa ordem LRU; as paradas há mais tempo que o TTL (ou as mais
+antigas, quando o teto é atingido) saem da memória. Com um repositório configurado
+elas vão para o SQLite em lote (sessões frias) e voltam se a conversa continuar.
+Com o banco fora, as despejadas esperam numa fila limitada em turnos: a gravação é
+tentada de novo com espera crescente e, com a fila cheia, as mais antigas são
+descartadas (contadas em `dropped`).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from database import ChatSessionRepository
+
+CHAT_SESSION_TURNS = int(os.getenv("CHAT_SESSION_TURNS", "20"))
+CHAT_SESSION_IDLE_TTL = float(os.getenv("CHAT_SESSION_IDLE_TTL", "1800"))
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "50000"))
+CHAT_TURN_MAX_CHARS = int(os.getenv("CHAT_TURN_MAX_CHARS", "2000"))
+CHAT_SESSION_SPILL_BATCH = int(os.getenv("CHAT_SESSION_SPILL_BATCH", "200"))
+CHAT_SESSION_SPILL_DAYS = int(os.getenv("CHAT_SESSION_SPILL_DAYS", "7"))
+CHAT_SESSION_SPILL_MAX_TURNS = int(os.getenv("CHAT_SESSION_SPILL_MAX_TURNS", "20000"))
+CHAT_SESSION_SPILL_RETRY_MAX = 60.0
+
+
+class ChatSession:
+    """Sessão em memória: últimos turnos + contadores"""
+
+    __slots__ = ("id", "agent_id", "turns", "turn_count", "created_at", "last_seen")
+
+    def __init__(self, session_id: str, agent_id: str, max_turns: int,
+                 turns: Optional[List[Dict[str, Any]]] = None, turn_count: int = 0,
+                 created_at: Optional[str] = None):
+        self.id = session_id
+        self.agent_id = agent_id
+        self.turns: Deque[Dict[str, Any]] = deque(turns or (), maxlen=max_turns)
+        self.turn_count = turn_count
+        self.created_at = created_at or datetime.now().isoformat()
+        self.last_seen = time.monotonic()
+
+    def to_record(self, key: str) -> Dict[str, Any]:
+        return {
+            "id": key,
+            "agentId": self.agent_id,
+            "turns": list(self.turns),
+            "turnCount": self.turn_count,
+            "createdAt": self.created_at,
+            "updatedAt": datetime.now().isoformat()
+        }
+
+
+class ChatSessionStore:
+    """Sessões por (agente, sessão) em ordem LRU, com TTL de inatividade e teto global"""
+
+    def __init__(self, repository: Optional[ChatSessionRepository] = None, max_turns: int = CHAT_SESSION_TURNS,
+                 idle_ttl: float = CHAT_SESSION_IDLE_TTL, max_sessions: int = CHAT_SESSION_MAX,
+                 max_chars: int = CHAT_TURN_MAX_CHARS, spill_batch: int = CHAT_SESSION_SPILL_BATCH,
+                 spill_max_turns: int = CHAT_SESSION_SPILL_MAX_TURNS):
+        self.repository = repository
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.max_chars = max_chars
+        self.spill_batch = spill_batch
+        self.spill_max_turns = spill_max_turns
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._spilling: Dict[str, Dict[str, Any]] = {}  # despejadas ainda não gravadas
+        self._spilling_turns = 0
+        self._retry_delay = 0.0
+        self._retry_at = 0.0
+        self._lock = threading.RLock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.spilled = 0
+        self.restored = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _key(agent_id: str, session_id: str) -> str:
+        return f"{agent_id}:{session_id}"
+
+    def get(self, agent_id: str, session_id: str) -> Optional[ChatSession]:
+        """Sessão em memória ou relida do SQLite (None se não existe)"""
+        key = self._key(agent_id, session_id)
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                session.last_seen = time.monotonic()
+                return session
+            record = self._pending_pop(key)
+            if record is None and self.repository is not None:
+                record = self.repository.get(key)
+            if record is None:
+                return None
+            self.restored += 1
+            session = ChatSession(session_id, agent_id, self.max_turns, record["turns"],
+                                  record["turnCount"] or 0, record["createdAt"])
+            self._put(key, session)
+            return session
+
+    def get_or_create(self, agent_id: str, session_id: str) -> ChatSession:
+        with self._lock:
+            session = self.get(agent_id, session_id)
+            if session is None:
+                session = ChatSession(session_id, agent_id, self.max_turns)
+                self._put(self._key(agent_id, session_id), session)
+                self.created += 1
+            return session
+
+    def append(self, session: ChatSession, role: str, text: str, **extra: Any) -> Dict[str, Any]:
+        """Acrescenta um turno (o mais antigo sai quando o buffer está cheio)"""
+        turn = {"role": role, "text": (text or "")[:self.max_chars], "timestamp": datetime.now().isoformat(), **extra}
+        with self._lock:
+            session.turns.append(turn)
+            session.turn_count += 1
+            session.last_seen = time.monotonic()
+        return turn
+
+    def exchange(self, session: ChatSession, text: str,
+                 respond: Callable[[bool], Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """Turno do usuário + resposta num passo só (sob o lock): `respond(first_turn)` devolve o
+        texto e os campos extras da resposta. Duas mensagens simultâneas na mesma sessão não veem
+        as duas o primeiro turno nem contam a mesma conversão duas vezes"""
+        with self._lock:
+            first_turn = not session.turns
+            converted_before = any(turn.get("conversion") for turn in session.turns)
+            self.append(session, "user", text)
+            reply_text, extra = respond(first_turn)
+            reply = self.append(session, "agent", reply_text, **extra)
+            return {
+                "turn": reply,
+                "turn_count": session.turn_count,
+                "first_turn": first_turn,
+                "new_conversion": bool(extra.get("conversion")) and not converted_before
+            }
+
+    def history(self, agent_id: str, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        session = self.get(agent_id, session_id)
+        return list(session.turns) if session is not None else None
+
+    def _put(self, key: str, session: ChatSession):
+        self._sessions[key] = session
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_sessions:
+            old_key, old_session = self._sessions.popitem(last=False)
+            self.evicted += 1
+            self._spill(old_key, old_session)
+
+    def _expire(self):
+        """Tira da memória as sessões paradas há mais que o TTL (começo da ordem LRU)"""
+        limit = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if session.last_seen > limit:
+                break
+            del self._sessions[key]
+            self.expired += 1
+            self._spill(key, session)
+
+    def _pending_pop(self, key: str) -> Optional[Dict[str, Any]]:
+        record = self._spilling.pop(key, None)
+        if record is not None:
+            self._spilling_turns -= len(record["turns"])
+        return record
+
+    def _spill(self, key: str, session: ChatSession):
+        if self.repository is None or not session.turns:
+            return
+        self._pending_pop(key)
+        record = self._spilling[key] = session.to_record(key)
+        self._spilling_turns += len(record["turns"])
+        if len(self._spilling) >= self.spill_batch and time.monotonic() >= self._retry_at:
+            try:
+                self.flush_spilled()
+                self._retry_delay = 0.0
+            except Exception as e:
+                # Banco fora: nova tentativa só depois de uma espera crescente (1s, 2s, ... 60s)
+                self._retry_delay = min(CHAT_SESSION_SPILL_RETRY_MAX, max(1.0, self._retry_delay * 2))
+                self._retry_at = time.monotonic() + self._retry_delay
+                print(f"❌ Erro ao gravar {len(self._spilling)} sessões de chat (nova tentativa em "
+                      f"{self._retry_delay:.0f}s): {e}")
+        dropped = 0
+        while self._spilling_turns > self.spill_max_turns and len(self._spilling) > 1:
+            self._pending_pop(next(iter(self._spilling)))
+            dropped += 1
+        if dropped:
+            self.dropped += dropped
+            print(f"⚠️ Fila de gravação das sessões de chat cheia: {dropped} sessões antigas descartadas")
+
+    def flush_spilled(self) -> int:
+        """Grava em lote as sessões despejadas - ficam na fila até o banco confirmar (relidas dali
+        enquanto isso; numa falha continuam pendentes para a próxima gravação)"""
+        with self._lock:
+            if not self._spilling or self.repository is None:
+                return 0
+            records = list(self._spilling.values())
+        self.repository.save_many(records)
+        with self._lock:
+            for record in records:
+                # Sessão retomada (e despejada de novo) durante a gravação fica para a próxima
+                if self._spilling.get(record["id"]) is record:
+                    self._pending_pop(record["id"])
+        self.spilled += len(records)
+        return len(records)
+
+    def close(self, spill_days: int = CHAT_SESSION_SPILL_DAYS) -> int:
+        """Desligamento: grava todas as sessões em memória e apaga as frias antigas"""
+        with self._lock:
+            for key, session in self._sessions.items():
+                self._spill(key, session)
+            self._sessions.clear()
+        saved = self.flush_spilled()
+        if self.repository is not None:
+            self.repository.purge_before((datetime.now() - timedelta(days=spill_days)).isoformat())
+        return saved
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expirable(self) -> int:
+        """Sessões já vencidas pelo TTL que ainda não saíram da memória (sem despejar nada)"""
+        limit = time.monotonic() - self.idle_ttl
+        count = 0
+        for session in self._sessions.values():
+            if session.last_seen > limit:
+                break
+            count += 1
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """Só leitura: não despeja nem grava (a expiração acontece no acesso às sessões)"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "expirable": self._expirable(),
+                "max_sessions": self.max_sessions,
+                "max_turns": self.max_turns,
+                "idle_ttl": self.idle_ttl,
+                "turns_in_memory": sum(len(session.turns) for session in self._sessions.values()),
+                "pending_spill": len(self._spilling),
+                "pending_spill_turns": self._spilling_turns,
+                "spill_max_turns": self.spill_max_turns,
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "spilled": self.spilled,
+                "restored": self.restored,
+                "dropped": self.dropped
+            }
@@ -0,0 +1,1436 @@
+#!/usr/bin/env python3
+"""
+🗄️ AutoCred Database - Camada de repositórios SQLite
+Persiste leads, clientes, contratos, agentes, campanhas SMS e mensagens WhatsApp no autocred.db
+"""
+
+import os
+import json
+import base64
+import queue
+import re
+import sqlite3
+import threading
+import unicodedata
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Iterable
+
+from phones import normalize_phone  # noqa: F401 - chave de deduplicação de telefone (reexportada)
+
+# Configuração
+DATABASE_PATH = os.getenv(
+    "AUTOCRED_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "autocred.db")
+)
+DATABASE_POOL_SIZE = int(os.getenv("AUTOCRED_DB_POOL_SIZE", "8"))
+DATABASE_TIMEOUT = float(os.getenv("AUTOCRED_DB_TIMEOUT", "30"))
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Statements preparados mantidos em cache por conexão (sqlite3 reaproveita pelo texto SQL)
+STATEMENT_CACHE_SIZE = 256
+GET_MANY_CHUNK_SIZE = 500  # ids por consulta IN (...) - abaixo do limite de variáveis do SQLite
+
+# As tabelas legadas (leads, clients, contracts...) usam id INTEGER e email NOT NULL,
+# incompatíveis com os modelos da API - por isso usamos tabelas próprias no mesmo arquivo.
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS crm_leads (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        cpf TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        source TEXT,
+        modality TEXT,
+        status TEXT,
+        assigned_to TEXT,
+        created_at TEXT NOT NULL,
+        installment TEXT,
+        outstanding_balance TEXT,
+        observations TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS crm_clients (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        cpf TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        status TEXT,
+        contracts_count INTEGER DEFAULT 0,
+        total_value REAL DEFAULT 0,
+        last_activity TEXT,
+        notes TEXT,
+        installment TEXT,
+        outstanding_balance TEXT,
+        source TEXT,
+        modality TEXT,
+        assigned_to TEXT,
+        created_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS crm_contracts (
+        id TEXT PRIMARY KEY,
+        client_name TEXT NOT NULL,
+        client_id TEXT,
+        client_cpf TEXT,
+        client_phone TEXT,
+        plan_id TEXT,
+        plan_name TEXT,
+        modality TEXT,
+        value REAL DEFAULT 0,
+        status TEXT,
+        start_date TEXT,
+        end_date TEXT,
+        created_by TEXT,
+        created_at TEXT NOT NULL,
+        installments INTEGER DEFAULT 12
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS custom_agents (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        description TEXT,
+        personality_id TEXT,
+        custom_prompt TEXT,
+        superagentes_id TEXT,
+        status TEXT,
+        created_at TEXT NOT NULL,
+        created_by TEXT,
+        performance_stats TEXT,
+        configuration TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sms_campaigns (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        message TEXT NOT NULL,
+        contacts TEXT,
+        scheduled_date TEXT,
+        scheduled_time TEXT,
+        status TEXT,
+        created_at TEXT NOT NULL,
+        sent_count INTEGER DEFAULT 0,
+        total_count INTEGER DEFAULT 0,
+        provider_campaign_id TEXT,
+        send_window TEXT,
+        send_rate INTEGER
+    )
+    """,
+    # Mensagens WhatsApp recebidas pelo webhook: tabela rowid (linhas novas vão para o fim),
+    # id = "instância:id da mensagem" para deduplicar reenvios
+    """
+    CREATE TABLE IF NOT EXISTS whatsapp_messages (
+        id TEXT PRIMARY KEY,
+        instance TEXT NOT NULL,
+        remote_jid TEXT NOT NULL,
+        message_id TEXT NOT NULL,
+        from_me INTEGER NOT NULL DEFAULT 0,
+        message_type TEXT,
+        text TEXT,
+        status TEXT,
+        status_rank INTEGER NOT NULL DEFAULT 0,
+        push_name TEXT,
+        timestamp INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_whatsapp_messages_chat ON whatsapp_messages (instance, remote_jid, timestamp, id)",
+    # Lotes de envio das campanhas SMS: faixa de contatos, resultado e tentativas de cada lote
+    """
+    CREATE TABLE IF NOT EXISTS sms_dispatch_chunks (
+        id TEXT PRIMARY KEY,
+        campaign_id TEXT NOT NULL,
+        chunk_index INTEGER NOT NULL,
+        start_offset INTEGER NOT NULL,
+        end_offset INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        provider_id TEXT,
+        response TEXT,
+        error TEXT,
+        updated_at TEXT,
+        sent_groups INTEGER NOT NULL DEFAULT 0,
+        release_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_sms_dispatch_chunks_campaign ON sms_dispatch_chunks (campaign_id, chunk_index)",
+    # Contatos das campanhas SMS (e listas importadas ainda sem campanha), na ordem do arquivo
+    """
+    CREATE TABLE IF NOT EXISTS sms_campaign_contacts (
+        campaign_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        name TEXT,
+        phone TEXT NOT NULL,
+        custom_fields TEXT,
+        PRIMARY KEY (campaign_id, position)
+    ) WITHOUT ROWID
+    """,
+    # Listas de contatos enviadas por upload e ainda não adotadas por uma campanha
+    """
+    CREATE TABLE IF NOT EXISTS sms_contact_lists (
+        id TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL
+    )
+    """,
+    # Índices para paginação por cursor (keyset) e filtros das listagens
+    "CREATE INDEX IF NOT EXISTS ix_crm_leads_created ON crm_leads (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_leads_name ON crm_leads (name, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_leads_status ON crm_leads (status, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_leads_modality ON crm_leads (modality, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_leads_assigned ON crm_leads (assigned_to, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_clients_created ON crm_clients (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_clients_name ON crm_clients (name, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_clients_status ON crm_clients (status, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_clients_modality ON crm_clients (modality, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_clients_assigned ON crm_clients (assigned_to, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_contracts_created ON crm_contracts (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_contracts_value ON crm_contracts (value, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_contracts_status ON crm_contracts (status, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_contracts_modality ON crm_contracts (modality, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_crm_contracts_created_by ON crm_contracts (created_by, created_at, id)",
+    # Sessões de chat com agentes tiradas da memória (frias) - id = "agente:sessão"
+    """
+    CREATE TABLE IF NOT EXISTS chat_sessions (
+        id TEXT PRIMARY KEY,
+        agent_id TEXT NOT NULL,
+        turns TEXT NOT NULL,
+        turn_count INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT,
+        updated_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_chat_sessions_updated ON chat_sessions (updated_at)",
+    # Contadores por janela de tempo dos agentes - buckets serializados num BLOB por agente
+    """
+    CREATE TABLE IF NOT EXISTS agent_metrics (
+        id TEXT PRIMARY KEY,
+        buckets BLOB NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_sms_campaigns_created ON sms_campaigns (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_sms_campaigns_status ON sms_campaigns (status, created_at, id)",
+]
+
+# Colunas normalizadas de CPF/telefone (adicionadas por migração em bancos já existentes)
+NORMALIZED_COLUMNS = [
+    ("crm_leads", "cpf_normalized"),
+    ("crm_leads", "phone_normalized"),
+    ("crm_clients", "cpf_normalized"),
+    ("crm_clients", "phone_normalized"),
+]
+
+# Colunas acrescentadas depois da criação da tabela: (tabela, coluna, definição)
+ADDED_COLUMNS = [
+    ("sms_dispatch_chunks", "sent_groups", "INTEGER NOT NULL DEFAULT 0"),
+    ("sms_dispatch_chunks", "release_at", "TEXT"),
+    ("sms_campaigns", "send_window", "TEXT"),
+    ("sms_campaigns", "send_rate", "INTEGER"),
+]
+
+# Índices únicos de deduplicação - valores vazios ficam de fora
+UNIQUE_INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_crm_leads_cpf ON crm_leads (cpf_normalized) WHERE cpf_normalized <> ''",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_crm_leads_phone ON crm_leads (phone_normalized) WHERE phone_normalized <> ''",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_crm_clients_cpf ON crm_clients (cpf_normalized) WHERE cpf_normalized <> ''",
+    "CREATE INDEX IF NOT EXISTS ix_crm_clients_phone ON crm_clients (phone_normalized)",
+]
+
+
+# Agregados do dashboard mantidos na escrita: contagem e soma por entidade, dimensão e bucket
+# (status, modalidade, responsável, mês, trimestre, ano). O dashboard só lê algumas linhas.
+AGGREGATES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS dashboard_counters (
+        entity TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (entity, dimension, bucket)
+    ) WITHOUT ROWID
+"""
+# Datas ISO válidas para os buckets de calendário (mesma regra em Python e no SQL de reconstrução)
+CALENDAR_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]*"
+
+
+def calendar_buckets(value: Any) -> Dict[str, str]:
+    """Buckets de mês, trimestre e ano de uma data ISO ('2025-06-01...')"""
+    text = str(value or "")
+    if len(text) < 7 or not text[:4].isdigit() or text[4] != "-" or not text[5:7].isdigit():
+        return {}
+    quarter = (int(text[5:7]) + 2) // 3
+    return {"month": text[:7], "quarter": f"{text[:4]}-Q{quarter}", "year": text[:4]}
+
+
+# Busca textual: documentos de leads, clientes e contratos num único índice FTS5 (trigram).
+# search_documents dá um rowid estável (INTEGER PRIMARY KEY) para cada registro indexado.
+SEARCH_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS search_documents (
+        doc_id INTEGER PRIMARY KEY,
+        entity TEXT NOT NULL,
+        entity_id TEXT NOT NULL,
+        UNIQUE (entity, entity_id)
+    )
+    """,
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(name, document, tokenize='trigram')",
+]
+SEARCH_MIN_TERM_LENGTH = 3  # o tokenizer trigram só encontra termos com 3+ caracteres
+search_available = True
+
+
+NON_DIGITS = re.compile(r"\D")
+
+
+def only_digits(value: Any) -> str:
+    return NON_DIGITS.sub("", str(value or ""))
+
+
+def fold_text(value: Any) -> str:
+    """Remove acentos e converte para minúsculas"""
+    text = str(value or "")
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def build_search_query(text: str) -> str:
+    """Converte o texto digitado numa expressão MATCH (todos os termos, como substrings)"""
+    terms = []
+    for raw in fold_text(text).split():
+        term = raw
+        # CPF/telefone parciais: compara só os dígitos ("456.789" encontra "12345678901")
+        if any(ch.isdigit() for ch in raw) and not any(ch.isalpha() for ch in raw):
+            term = only_digits(raw)
+        if len(term) >= SEARCH_MIN_TERM_LENGTH:
+            terms.append('"' + term.replace('"', '""') + '"')
+    return " ".join(terms)
+
+
+def normalize_cpf(cpf: Optional[str]) -> str:
+    """Mantém só os dígitos do CPF, recompondo zeros à esquerda perdidos em planilhas"""
+    digits = only_digits(cpf)
+    if not digits or len(digits) > 11:
+        return digits
+    return digits.zfill(11)
+
+
+# Ordem do ciclo de vida de uma mensagem na Evolution - status só avança
+MESSAGE_STATUS_RANK = {
+    "ERROR": 0,
+    "PENDING": 1,
+    "SERVER_ACK": 2,
+    "DELIVERY_ACK": 3,
+    "READ": 4,
+    "PLAYED": 5,
+}
+
+
+def message_status_rank(status: Optional[str]) -> int:
+    return MESSAGE_STATUS_RANK.get(str(status or "").upper(), 0)
+
+
+def encode_cursor(sort_value: Any, record_id: str) -> str:
+    """Codifica a posição (valor de ordenação, id) do último item da página"""
+    raw = json.dumps([sort_value, record_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decodifica um cursor gerado por encode_cursor (ValueError se inválido)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, record_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Cursor inválido")
+    return sort_value, record_id
+
+
+class ConnectionPool:
+    """Pool de conexões SQLite reutilizáveis em modo WAL"""
+
+    def __init__(self, path: str, size: int = DATABASE_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._after_commit: Dict[int, list] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DATABASE_TIMEOUT,
+            check_same_thread=False,
+            isolation_level=None,  # autocommit - transações explícitas via transaction()
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        return self._idle.get(timeout=DATABASE_TIMEOUT)
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão do pool"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Empresta uma conexão dentro de uma transação de escrita"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._after_commit[id(conn)] = []
+            try:
+                yield conn
+            except Exception:
+                self._after_commit.pop(id(conn), None)
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            for callback in self._after_commit.pop(id(conn), []):
+                callback()
+
+    def on_commit(self, conn: sqlite3.Connection, callback):
+        """Executa o callback quando a transação da conexão for confirmada (descartado em rollback)"""
+        pending = self._after_commit.get(id(conn))
+        if pending is None:
+            callback()
+        else:
+            pending.append(callback)
+
+    def close_all(self):
+        """Fecha todas as conexões ociosas"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+class Repository:
+    """Repositório genérico: mapeia campos da API (camelCase) para colunas SQL"""
+
+    table = ""
+    fields: Dict[str, str] = {}
+    json_fields: tuple = ()
+    order_by = "created_at, id"
+    # Filtros e ordenações aceitos na paginação: campo da API -> coluna indexada
+    filter_fields: Dict[str, str] = {}
+    sort_fields: Dict[str, str] = {"createdAt": "created_at"}
+    # Colunas derivadas: coluna -> (campo de origem, função de normalização)
+    computed_columns: Dict[str, tuple] = {}
+    # Colunas derivadas com índice em memória (valor normalizado -> id)
+    lookup_columns: tuple = ()
+    # Busca textual: nome da entidade no índice, campos indexados (o primeiro é o nome)
+    # e campos que também são indexados só com dígitos (CPF, telefone)
+    entity: Optional[str] = None
+    search_fields: tuple = ()
+    search_digit_fields: tuple = ()
+    # Agregados do dashboard: dimensão -> campo, campo de data dos buckets e campo somado
+    aggregate_fields: Dict[str, str] = {}
+    aggregate_date_field = "createdAt"
+    aggregate_value_field: Optional[str] = None
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self._columns = {column: field for field, column in self.fields.items()}
+        self._lookup: Dict[str, Dict[str, str]] = {column: {} for column in self.lookup_columns}
+        self._lookup_lock = threading.Lock()
+        columns = list(self.fields.values()) + list(self.computed_columns)
+        placeholders = ", ".join("?" for _ in columns)
+
+        # SQL montado uma única vez - o texto idêntico reaproveita o statement preparado
+        self._insert_sql = f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({placeholders})"
+        self._insert_ignore_sql = f"INSERT OR IGNORE INTO {self.table} ({', '.join(columns)}) VALUES ({placeholders})"
+        self._get_sql = f"SELECT * FROM {self.table} WHERE id = ?"
+        self._delete_sql = f"DELETE FROM {self.table} WHERE id = ?"
+        self._list_sql = f"SELECT * FROM {self.table} ORDER BY {self.order_by}"
+        self._count_sql = f"SELECT COUNT(*) FROM {self.table}"
+        self._update_sql_cache: Dict[tuple, str] = {}
+
+    @contextmanager
+    def _reading(self, conn: Optional[sqlite3.Connection] = None):
+        if conn is not None:
+            yield conn
+        else:
+            with self.pool.connection() as pooled:
+                yield pooled
+
+    @contextmanager
+    def _writing(self, conn: Optional[sqlite3.Connection] = None):
+        if conn is not None:
+            yield conn
+        else:
+            with self.pool.transaction() as pooled:
+                yield pooled
+
+    def _encode(self, field: str, value: Any) -> Any:
+        if field in self.json_fields and value is not None:
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    def _to_row(self, record: Dict[str, Any]) -> tuple:
+        values = [self._encode(field, record.get(field)) for field in self.fields]
+        values.extend(normalize(record.get(source)) for source, normalize in self.computed_columns.values())
+        return tuple(values)
+
+    def _lookup_values(self, record: Dict[str, Any]) -> Dict[str, str]:
+        return {
+            column: self.computed_columns[column][1](record.get(self.computed_columns[column][0]))
+            for column in self.lookup_columns
+        }
+
+    def _index_add(self, record_id: str, values: Dict[str, str]):
+        with self._lookup_lock:
+            for column, value in values.items():
+                if value:
+                    self._lookup[column][value] = record_id
+
+    def _index_remove(self, record_id: str, values: Dict[str, str]):
+        with self._lookup_lock:
+            for column, value in values.items():
+                if value and self._lookup[column].get(value) == record_id:
+                    del self._lookup[column][value]
+
+    def load_lookup_indexes(self):
+        """Carrega os índices em memória a partir do banco (chamado na inicialização)"""
+        if not self.lookup_columns:
+            return
+        sql = f"SELECT id, {', '.join(self.lookup_columns)} FROM {self.table}"
+        lookup = {column: {} for column in self.lookup_columns}
+        with self._reading() as c:
+            for row in c.execute(sql):
+                for column in self.lookup_columns:
+                    if row[column]:
+                        lookup[column][row[column]] = row["id"]
+        with self._lookup_lock:
+            self._lookup = lookup
+
+    def find_id_by(self, column: str, value: str) -> Optional[str]:
+        """Busca O(1) no índice em memória pelo valor já normalizado"""
+        return self._lookup[column].get(value) if value else None
+
+    def find_by(self, column: str, value: str, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        """Com `conn` (dentro de uma transação) consulta o banco, não o índice em memória -
+        o índice só é atualizado depois do commit de outras transações"""
+        if conn is not None:
+            if column not in self.lookup_columns or not value:
+                return None
+            # "<> ''" repete a condição dos índices únicos parciais: sem ela o SQLite varre a tabela
+            row = conn.execute(
+                f"SELECT * FROM {self.table} WHERE {column} = ? AND {column} <> '' LIMIT 1", (value,)
+            ).fetchone()
+            return self._from_row(row)
+        record_id = self.find_id_by(column, value)
+        return self.get(record_id) if record_id else None
+
+    def find_many_by(self, column: str, values: Iterable[str], conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+        """Como find_by(conn=...) para vários valores (IN em lotes) - retorna {valor: registro}"""
+        if column not in self.lookup_columns:
+            return {}
+        keys = list(dict.fromkeys(value for value in values if value))
+        found = {}
+        for start in range(0, len(keys), GET_MANY_CHUNK_SIZE):
+            chunk = keys[start:start + GET_MANY_CHUNK_SIZE]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = conn.execute(
+                f"SELECT * FROM {self.table} WHERE {column} IN ({placeholders}) AND {column} <> ''", chunk
+            )
+            for row in rows:
+                found.setdefault(row[column], self._from_row(row))
+        return found
+
+    @property
+    def searchable(self) -> bool:
+        return bool(self.entity and self.search_fields and search_available)
+
+    def _search_document(self, record: Dict[str, Any]) -> tuple:
+        name = fold_text(record.get(self.search_fields[0]))
+        parts = [fold_text(record.get(field)) for field in self.search_fields[1:]]
+        parts.extend(only_digits(record.get(field)) for field in self.search_digit_fields)
+        return name, " ".join(part for part in parts if part)
+
+    def _index_search(self, conn: sqlite3.Connection, record: Dict[str, Any]):
+        conn.execute(
+            "INSERT OR IGNORE INTO search_documents (entity, entity_id) VALUES (?, ?)",
+            (self.entity, str(record["id"]))
+        )
+        doc_id = conn.execute(
+            "SELECT doc_id FROM search_documents WHERE entity = ? AND entity_id = ?",
+            (self.entity, str(record["id"]))
+        ).fetchone()[0]
+        name, document = self._search_document(record)
+        conn.execute(
+            "INSERT OR REPLACE INTO search_index (rowid, name, document) VALUES (?, ?, ?)",
+            (doc_id, name, document)
+        )
+
+    def _unindex_search(self, conn: sqlite3.Connection, record_id: str):
+        row = conn.execute(
+            "SELECT doc_id FROM search_documents WHERE entity = ? AND entity_id = ?",
+            (self.entity, str(record_id))
+        ).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM search_index WHERE rowid = ?", (row[0],))
+            conn.execute("DELETE FROM search_documents WHERE doc_id = ?", (row[0],))
+
+    def backfill_search_index(self):
+        """Indexa registros existentes quando o índice de busca desta entidade está vazio"""
+        if not self.searchable:
+            return
+        with self.pool.transaction() as c:
+            indexed = c.execute(
+                "SELECT 1 FROM search_documents WHERE entity = ? LIMIT 1", (self.entity,)
+            ).fetchone()
+            if indexed is not None:
+                return
+            for row in c.execute(self._list_sql).fetchall():
+                self._index_search(c, self._from_row(row))
+
+    @property
+    def aggregated(self) -> bool:
+        return bool(self.entity and self.aggregate_fields)
+
+    def _aggregate_deltas(self, record: Dict[str, Any], sign: int, deltas: Dict[tuple, list]):
+        """Acumula +1/-1 (e o valor) em cada bucket do registro"""
+        value = 0.0
+        if self.aggregate_value_field:
+            value = float(record.get(self.aggregate_value_field) or 0)
+        buckets = [("total", "")]
+        buckets.extend((dimension, str(record.get(field) or "")) for dimension, field in self.aggregate_fields.items())
+        buckets.extend(calendar_buckets(record.get(self.aggregate_date_field)).items())
+        for bucket in buckets:
+            delta = deltas.setdefault(bucket, [0, 0.0])
+            delta[0] += sign
+            delta[1] += sign * value
+
+    def _apply_aggregates(self, conn: sqlite3.Connection, deltas: Dict[tuple, list]):
+        conn.executemany(
+            "INSERT INTO dashboard_counters (entity, dimension, bucket, count, total) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (entity, dimension, bucket) DO UPDATE SET "
+            "count = count + excluded.count, total = total + excluded.total",
+            [
+                (self.entity, dimension, bucket, count, total)
+                for (dimension, bucket), (count, total) in deltas.items()
+                if count or total
+            ]
+        )
+
+    def rebuild_aggregates(self, conn: Optional[sqlite3.Connection] = None):
+        """Recalcula os agregados desta entidade direto no SQL (bancos antigos ou reparo)"""
+        if not self.aggregated:
+            return
+        value = f"COALESCE(SUM({self.fields[self.aggregate_value_field]}), 0)" if self.aggregate_value_field else "0"
+        date = self.fields[self.aggregate_date_field]
+        buckets = {"total": "''"}
+        buckets.update(
+            (dimension, f"COALESCE({self.fields[field]}, '')") for dimension, field in self.aggregate_fields.items()
+        )
+        calendar = {
+            "month": f"substr({date}, 1, 7)",
+            "quarter": f"substr({date}, 1, 4) || '-Q' || ((CAST(substr({date}, 6, 2) AS INTEGER) + 2) / 3)",
+            "year": f"substr({date}, 1, 4)",
+        }
+        with self._writing(conn) as c:
+            c.execute("DELETE FROM dashboard_counters WHERE entity = ?", (self.entity,))
+            for dimension, expression in list(buckets.items()) + list(calendar.items()):
+                where = f"WHERE {date} GLOB '{CALENDAR_GLOB}'" if dimension in calendar else ""
+                c.execute(
+                    "INSERT INTO dashboard_counters (entity, dimension, bucket, count, total) "
+                    f"SELECT ?, ?, {expression}, COUNT(*), {value} FROM {self.table} {where} GROUP BY 3",
+                    (self.entity, dimension)
+                )
+
+    def aggregates(self, dimension: str, conn: Optional[sqlite3.Connection] = None) -> Dict[str, Dict[str, Any]]:
+        """Contagem e soma por bucket de uma dimensão (ex.: 'status')"""
+        with self._reading(conn) as c:
+            rows = c.execute(
+                "SELECT bucket, count, total FROM dashboard_counters "
+                "WHERE entity = ? AND dimension = ? AND count <> 0",
+                (self.entity, dimension)
+            ).fetchall()
+        return {row["bucket"]: {"count": row["count"], "total": row["total"]} for row in rows}
+
+    def aggregate(self, dimension: str, bucket: str, conn: Optional[sqlite3.Connection] = None) -> Dict[str, Any]:
+        """Contagem e soma de um único bucket (busca pela chave primária)"""
+        with self._reading(conn) as c:
+            row = c.execute(
+                "SELECT count, total FROM dashboard_counters WHERE entity = ? AND dimension = ? AND bucket = ?",
+                (self.entity, dimension, bucket)
+            ).fetchone()
+        return {"count": row["count"], "total": row["total"]} if row else {"count": 0, "total": 0.0}
+
+    def _from_row(self, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        record = {}
+        for column in row.keys():
+            field = self._columns.get(column)
+            if field is None:
+                continue
+            value = row[column]
+            if field in self.json_fields and value is not None:
+                value = json.loads(value)
+            record[field] = value
+        return record
+
+    def insert(self, record: Dict[str, Any], conn: Optional[sqlite3.Connection] = None) -> Dict[str, Any]:
+        with self._writing(conn) as c:
+            c.execute(self._insert_sql, self._to_row(record))
+            if self.searchable:
+                self._index_search(c, record)
+            if self.aggregated:
+                deltas: Dict[tuple, list] = {}
+                self._aggregate_deltas(record, 1, deltas)
+                self._apply_aggregates(c, deltas)
+            if self.lookup_columns:
+                values = self._lookup_values(record)
+                self.pool.on_commit(c, lambda: self._index_add(record["id"], values))
+        return record
+
+    def insert_many(self, records: Iterable[Dict[str, Any]], conn: Optional[sqlite3.Connection] = None,
+                    ignore_existing: bool = False) -> int:
+        sql = self._insert_ignore_sql if ignore_existing else self._insert_sql
+        with self._writing(conn) as c:
+            if not self.lookup_columns and not self.searchable and not self.aggregated:
+                return c.executemany(sql, (self._to_row(record) for record in records)).rowcount
+
+            # Com índices derivados, precisamos saber quais linhas entraram de fato
+            inserted_count = 0
+            inserted = []
+            deltas: Dict[tuple, list] = {}
+            for record in records:
+                if c.execute(sql, self._to_row(record)).rowcount:
+                    inserted_count += 1
+                    if self.searchable:
+                        self._index_search(c, record)
+                    if self.aggregated:
+                        self._aggregate_deltas(record, 1, deltas)
+                    if self.lookup_columns:
+                        inserted.append((record["id"], self._lookup_values(record)))
+            if deltas:
+                self._apply_aggregates(c, deltas)
+
+            def index_inserted():
+                for record_id, values in inserted:
+                    self._index_add(record_id, values)
+
+            if inserted:
+                self.pool.on_commit(c, index_inserted)
+            return inserted_count
+
+    def get(self, record_id: str, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with self._reading(conn) as c:
+            return self._from_row(c.execute(self._get_sql, (str(record_id),)).fetchone())
+
+    def get_many(self, record_ids: Iterable[str], conn: Optional[sqlite3.Connection] = None) -> Dict[str, Dict[str, Any]]:
+        """Busca vários registros pela chave primária (IN em lotes) - retorna {id: registro}"""
+        ids = list(dict.fromkeys(str(record_id) for record_id in record_ids))
+        found = {}
+        with self._reading(conn) as c:
+            for start in range(0, len(ids), GET_MANY_CHUNK_SIZE):
+                chunk = ids[start:start + GET_MANY_CHUNK_SIZE]
+                placeholders = ", ".join("?" for _ in chunk)
+                rows = c.execute(f"SELECT * FROM {self.table} WHERE id IN ({placeholders})", chunk)
+                for row in rows:
+                    found[row["id"]] = self._from_row(row)
+        return found
+
+    def update(self, record_id: str, changes: Dict[str, Any],
+               conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        """Atualiza os campos informados e retorna o registro atualizado (None se não existir)"""
+        changed_fields = tuple(field for field in changes if field in self.fields and field != "id")
+        if not changed_fields:
+            return self.get(record_id, conn)
+
+        changed_computed = tuple(
+            column for column, (source, _) in self.computed_columns.items() if source in changed_fields
+        )
+
+        sql = self._update_sql_cache.get(changed_fields)
+        if sql is None:
+            assignments = [f"{self.fields[field]} = ?" for field in changed_fields]
+            assignments.extend(f"{column} = ?" for column in changed_computed)
+            sql = f"UPDATE {self.table} SET {', '.join(assignments)} WHERE id = ?"
+            self._update_sql_cache[changed_fields] = sql
+
+        params = [self._encode(field, changes[field]) for field in changed_fields]
+        for column in changed_computed:
+            source, normalize = self.computed_columns[column]
+            params.append(normalize(changes[source]))
+        params.append(str(record_id))
+        with self._writing(conn) as c:
+            reindex = self.lookup_columns and changed_computed
+            reaggregate = self.aggregated and any(
+                field in changed_fields
+                for field in (*self.aggregate_fields.values(), self.aggregate_date_field, self.aggregate_value_field)
+            )
+            previous = None
+            if reindex or reaggregate:
+                previous = self._from_row(c.execute(self._get_sql, (str(record_id),)).fetchone())
+            cursor = c.execute(sql, params)
+            if cursor.rowcount == 0:
+                return None
+            updated = self._from_row(c.execute(self._get_sql, (str(record_id),)).fetchone())
+            if self.searchable and any(field in self.search_fields for field in changed_fields):
+                self._index_search(c, updated)
+            if reaggregate:
+                deltas: Dict[tuple, list] = {}
+                self._aggregate_deltas(previous, -1, deltas)
+                self._aggregate_deltas(updated, 1, deltas)
+                self._apply_aggregates(c, deltas)
+            if reindex:
+                old_values = self._lookup_values(previous)
+                new_values = self._lookup_values(updated)
+
+                def reindex_record():
+                    self._index_remove(str(record_id), old_values)
+                    self._index_add(str(record_id), new_values)
+
+                self.pool.on_commit(c, reindex_record)
+            return updated
+
+    def delete(self, record_id: str, conn: Optional[sqlite3.Connection] = None) -> bool:
+        with self._writing(conn) as c:
+            previous = None
+            if self.lookup_columns or self.aggregated:
+                previous = self._from_row(c.execute(self._get_sql, (str(record_id),)).fetchone())
+            deleted = c.execute(self._delete_sql, (str(record_id),)).rowcount > 0
+            if deleted and self.searchable:
+                self._unindex_search(c, record_id)
+            if deleted and self.aggregated:
+                deltas: Dict[tuple, list] = {}
+                self._aggregate_deltas(previous, -1, deltas)
+                self._apply_aggregates(c, deltas)
+            if deleted and self.lookup_columns:
+                values = self._lookup_values(previous)
+                self.pool.on_commit(c, lambda: self._index_remove(str(record_id), values))
+            return deleted
+
+    def list_all(self) -> List[Dict[str, Any]]:
+        with self._reading() as c:
+            return [self._from_row(row) for row in c.execute(self._list_sql)]
+
+    def count(self) -> int:
+        with self._reading() as c:
+            return c.execute(self._count_sql).fetchone()[0]
+
+    def paginate(self, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                 filters: Optional[Dict[str, Any]] = None, created_from: Optional[str] = None,
+                 created_to: Optional[str] = None, sort: str = "createdAt",
+                 descending: bool = True) -> tuple:
+        """Página ordenada por (sort, id) usando keyset - retorna (itens, próximo cursor)"""
+        sort_column = self.sort_fields.get(sort)
+        if sort_column is None:
+            raise ValueError(f"Ordenação não suportada: {sort}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        conditions = []
+        params: List[Any] = []
+        for field, value in (filters or {}).items():
+            if value is None:
+                continue
+            column = self.filter_fields.get(field)
+            if column is None:
+                raise ValueError(f"Filtro não suportado: {field}")
+            conditions.append(f"{column} = ?")
+            params.append(value)
+        if created_from:
+            conditions.append("created_at >= ?")
+            params.append(created_from)
+        if created_to:
+            conditions.append("created_at <= ?")
+            params.append(created_to)
+        if cursor:
+            last_value, last_id = decode_cursor(cursor)
+            conditions.append(f"({sort_column}, id) {'<' if descending else '>'} (?, ?)")
+            params.extend([last_value, last_id])
+
+        direction = "DESC" if descending else "ASC"
+        sql = f"SELECT * FROM {self.table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {sort_column} {direction}, id {direction} LIMIT ?"
+        params.append(limit + 1)
+
+        with self._reading() as c:
+            rows = c.execute(sql, params).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last[sort_column], last["id"])
+        return [self._from_row(row) for row in rows], next_cursor
+
+
+class LeadRepository(Repository):
+    table = "crm_leads"
+    fields = {
+        "id": "id",
+        "name": "name",
+        "cpf": "cpf",
+        "phone": "phone",
+        "source": "source",
+        "modality": "modality",
+        "status": "status",
+        "assignedTo": "assigned_to",
+        "createdAt": "created_at",
+        "installment": "installment",
+        "outstandingBalance": "outstanding_balance",
+        "observations": "observations",
+    }
+    filter_fields = {"status": "status", "modality": "modality", "assignedTo": "assigned_to"}
+    sort_fields = {"createdAt": "created_at", "name": "name"}
+    computed_columns = {
+        "cpf_normalized": ("cpf", normalize_cpf),
+        "phone_normalized": ("phone", normalize_phone),
+    }
+    lookup_columns = ("cpf_normalized", "phone_normalized")
+    entity = "lead"
+    search_fields = ("name", "cpf", "phone", "observations")
+    aggregate_fields = {"status": "status", "modality": "modality", "assignee": "assignedTo"}
+    search_digit_fields = ("cpf", "phone")
+
+
+class ClientRepository(Repository):
+    table = "crm_clients"
+    fields = {
+        "id": "id",
+        "name": "name",
+        "cpf": "cpf",
+        "phone": "phone",
+        "status": "status",
+        "contractsCount": "contracts_count",
+        "totalValue": "total_value",
+        "lastActivity": "last_activity",
+        "notes": "notes",
+        "installment": "installment",
+        "outstandingBalance": "outstanding_balance",
+        "source": "source",
+        "modality": "modality",
+        "assignedTo": "assigned_to",
+        "createdAt": "created_at",
+    }
+    filter_fields = {"status": "status", "modality": "modality", "assignedTo": "assigned_to"}
+    sort_fields = {"createdAt": "created_at", "name": "name"}
+    computed_columns = {
+        "cpf_normalized": ("cpf", normalize_cpf),
+        "phone_normalized": ("phone", normalize_phone),
+    }
+    lookup_columns = ("cpf_normalized", "phone_normalized")
+    entity = "client"
+    search_fields = ("name", "cpf", "phone", "notes")
+    aggregate_fields = {"status": "status", "modality": "modality", "assignee": "assignedTo"}
+    search_digit_fields = ("cpf", "phone")
+
+
+class ContractRepository(Repository):
+    table = "crm_contracts"
+    fields = {
+        "id": "id",
+        "clientName": "client_name",
+        "clientId": "client_id",
+        "clientCPF": "client_cpf",
+        "clientPhone": "client_phone",
+        "planId": "plan_id",
+        "planName": "plan_name",
+        "modality": "modality",
+        "value": "value",
+        "status": "status",
+        "startDate": "start_date",
+        "endDate": "end_date",
+        "createdBy": "created_by",
+        "createdAt": "created_at",
+        "installments": "installments",
+    }
+    # Em contratos o responsável é quem criou o contrato
+    filter_fields = {"status": "status", "modality": "modality", "assignedTo": "created_by"}
+    sort_fields = {"createdAt": "created_at", "value": "value"}
+    entity = "contract"
+    search_fields = ("clientName", "clientCPF", "clientPhone", "planName")
+    aggregate_fields = {"status": "status", "modality": "modality", "assignee": "createdBy"}
+    aggregate_value_field = "value"
+    search_digit_fields = ("clientCPF", "clientPhone")
+
+
+class AgentRepository(Repository):
+    table = "custom_agents"
+    fields = {
+        "id": "id",
+        "name": "name",
+        "description": "description",
+        "personality_id": "personality_id",
+        "custom_prompt": "custom_prompt",
+        "superagentes_id": "superagentes_id",
+        "status": "status",
+        "created_at": "created_at",
+        "created_by": "created_by",
+        "performance_stats": "performance_stats",
+        "configuration": "configuration",
+    }
+    json_fields = ("performance_stats", "configuration")
+
+
+class CampaignRepository(Repository):
+    table = "sms_campaigns"
+    fields = {
+        "id": "id",
+        "name": "name",
+        "message": "message",
+        "contacts": "contacts",
+        "scheduled_date": "scheduled_date",
+        "scheduled_time": "scheduled_time",
+        "status": "status",
+        "created_at": "created_at",
+        "sent_count": "sent_count",
+        "total_count": "total_count",
+        "campaign_id": "provider_campaign_id",
+        "send_window": "send_window",
+        "send_rate": "send_rate",
+    }
+    json_fields = ("contacts", "send_window")
+    filter_fields = {"status": "status"}
+    sort_fields = {"created_at": "created_at"}
+
+
+class MessageRepository(Repository):
+    """Histórico de conversas WhatsApp - leitura por (instância, contato) do mais novo para o mais antigo"""
+
+    table = "whatsapp_messages"
+    fields = {
+        "id": "id",
+        "instance": "instance",
+        "remoteJid": "remote_jid",
+        "messageId": "message_id",
+        "fromMe": "from_me",
+        "messageType": "message_type",
+        "text": "text",
+        "status": "status",
+        "pushName": "push_name",
+        "timestamp": "timestamp",
+    }
+    order_by = "timestamp, id"
+    computed_columns = {"status_rank": ("status", message_status_rank)}
+
+    _status_sql = (
+        "UPDATE whatsapp_messages SET status = ?, status_rank = ? "
+        "WHERE id = ? AND status_rank < ?"
+    )
+    _history_sql = (
+        "SELECT * FROM whatsapp_messages WHERE instance = ? AND remote_jid = ? "
+        "AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?"
+    )
+
+    def _from_row(self, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        record = super()._from_row(row)
+        if record is not None:
+            record["fromMe"] = bool(record["fromMe"])
+        return record
+
+    def store_batch(self, messages: List[Dict[str, Any]], statuses: List[tuple],
+                    conn: Optional[sqlite3.Connection] = None) -> tuple:
+        """Grava um lote do webhook numa transação: mensagens novas e depois as mudanças de status
+
+        statuses: (id, status) - só aplicado quando o status avança (reenvio atrasado não regride).
+        Retorna (mensagens inseridas, status atualizados).
+        """
+        with self._writing(conn) as c:
+            inserted = self.insert_many(messages, conn=c, ignore_existing=True) if messages else 0
+            updated = 0
+            if statuses:
+                params = []
+                for record_id, status in statuses:
+                    rank = message_status_rank(status)
+                    params.append((status, rank, record_id, rank))
+                updated = c.executemany(self._status_sql, params).rowcount
+            return inserted, updated
+
+    def history(self, instance: str, remote_jid: str, limit: int = DEFAULT_PAGE_SIZE,
+                before: Optional[str] = None) -> tuple:
+        """Página de mensagens anteriores ao cursor (keyset no índice do chat) - retorna (itens, cursor)
+
+        `before` aceita o cursor devolvido pela página anterior ou um timestamp (epoch em segundos).
+        Os itens voltam em ordem cronológica, prontos para exibir.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        if not before:
+            last_timestamp, last_id = 2 ** 62, ""
+        elif before.isdigit():
+            last_timestamp, last_id = int(before), ""
+        else:
+            last_timestamp, last_id = decode_cursor(before)
+
+        with self._reading() as c:
+            rows = c.execute(
+                self._history_sql, (instance, remote_jid, last_timestamp, last_id, limit + 1)
+            ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+        return [self._from_row(row) for row in reversed(rows)], next_cursor
+
+
+class DispatchChunkRepository(Repository):
+    """Lotes de envio de campanhas SMS - permitem retomar o disparo a partir do último lote enviado"""
+
+    table = "sms_dispatch_chunks"
+    fields = {
+        "id": "id",
+        "campaignId": "campaign_id",
+        "chunkIndex": "chunk_index",
+        "start": "start_offset",
+        "end": "end_offset",
+        "status": "status",
+        "attempts": "attempts",
+        "providerId": "provider_id",
+        "response": "response",
+        "error": "error",
+        "updatedAt": "updated_at",
+        "sentGroups": "sent_groups",
+        "releaseAt": "release_at",
+    }
+    order_by = "campaign_id, chunk_index"
+
+    _campaign_sql = "SELECT * FROM sms_dispatch_chunks WHERE campaign_id = ? ORDER BY chunk_index"
+    _summary_sql = (
+        "SELECT status, COUNT(*) AS chunks, SUM(end_offset - start_offset) AS contacts "
+        "FROM sms_dispatch_chunks WHERE campaign_id = ? GROUP BY status"
+    )
+    _delete_campaign_sql = "DELETE FROM sms_dispatch_chunks WHERE campaign_id = ?"
+    _release_sql = "UPDATE sms_dispatch_chunks SET release_at = ? WHERE id = ?"
+
+    def for_campaign(self, campaign_id: str, conn: Optional[sqlite3.Connection] = None) -> List[Dict[str, Any]]:
+        with self._reading(conn) as c:
+            return [self._from_row(row) for row in c.execute(self._campaign_sql, (campaign_id,))]
+
+    def summary(self, campaign_id: str) -> Dict[str, Dict[str, int]]:
+        """{status: {chunks, contacts}} da campanha, agregado no SQLite"""
+        with self._reading() as c:
+            return {
+                row["status"]: {"chunks": row["chunks"], "contacts": row["contacts"] or 0}
+                for row in c.execute(self._summary_sql, (campaign_id,))
+            }
+
+    def set_release_times(self, times: Dict[str, str], conn: Optional[sqlite3.Connection] = None):
+        """Grava o momento planejado de liberação de cada lote ({id: ISO}) numa única transação"""
+        with self._writing(conn) as c:
+            c.executemany(self._release_sql, [(moment, chunk_id) for chunk_id, moment in times.items()])
+
+    def delete_campaign(self, campaign_id: str, conn: Optional[sqlite3.Connection] = None) -> int:
+        with self._writing(conn) as c:
+            return c.execute(self._delete_campaign_sql, (campaign_id,)).rowcount
+
+
+# Prefixo dos ids de listas de contatos enviadas por upload (os de campanha começam com "sms_")
+CONTACT_LIST_PREFIX = "contacts_"
+
+
+class CampaignContactRepository(Repository):
+    """Contatos de campanha SMS por posição - lidos em faixas pelo disparo, nunca a lista inteira"""
+
+    table = "sms_campaign_contacts"
+    fields = {
+        "campaignId": "campaign_id",
+        "position": "position",
+        "name": "name",
+        "phone": "phone",
+        "customFields": "custom_fields",
+    }
+    json_fields = ("customFields",)
+    order_by = "campaign_id, position"
+
+    _count_campaign_sql = "SELECT COUNT(*) FROM sms_campaign_contacts WHERE campaign_id = ?"
+    _next_position_sql = "SELECT COALESCE(MAX(position) + 1, 0) FROM sms_campaign_contacts WHERE campaign_id = ?"
+    _range_sql = (
+        "SELECT * FROM sms_campaign_contacts WHERE campaign_id = ? "
+        "AND position >= ? AND position < ? ORDER BY position"
+    )
+    _phones_sql = (
+        "SELECT phone FROM sms_campaign_contacts WHERE campaign_id = ? "
+        "AND position >= ? AND position < ? ORDER BY position"
+    )
+    _adopt_sql = "UPDATE sms_campaign_contacts SET campaign_id = ? WHERE campaign_id = ?"
+    _delete_campaign_sql = "DELETE FROM sms_campaign_contacts WHERE campaign_id = ?"
+    _register_list_sql = "INSERT OR REPLACE INTO sms_contact_lists (id, created_at) VALUES (?, ?)"
+    _list_exists_sql = "SELECT 1 FROM sms_contact_lists WHERE id = ?"
+    _delete_list_sql = "DELETE FROM sms_contact_lists WHERE id = ?"
+    # Faixa de ids "contacts_*" (usa a chave primária; '`' vem logo depois de '_')
+    _purge_contacts_sql = (
+        "DELETE FROM sms_campaign_contacts WHERE campaign_id >= 'contacts_' AND campaign_id < 'contacts`' "
+        "AND campaign_id NOT IN (SELECT id FROM sms_contact_lists WHERE created_at >= ?)"
+    )
+    _purge_lists_sql = "DELETE FROM sms_contact_lists WHERE created_at < ?"
+
+    def append(self, campaign_id: str, contacts: List[Dict[str, Any]],
+               conn: Optional[sqlite3.Connection] = None) -> int:
+        """Acrescenta um lote no fim da lista (posições contínuas) numa transação"""
+        with self._writing(conn) as c:
+            position = c.execute(self._next_position_sql, (campaign_id,)).fetchone()[0]
+            rows = (
+                self._to_row({**contact, "campaignId": campaign_id, "position": position + offset})
+                for offset, contact in enumerate(contacts)
+            )
+            return c.executemany(self._insert_sql, rows).rowcount
+
+    def count_for(self, campaign_id: str) -> int:
+        with self._reading() as c:
+            return c.execute(self._count_campaign_sql, (campaign_id,)).fetchone()[0]
+
+    def contacts(self, campaign_id: str, start: int, end: int) -> List[Dict[str, Any]]:
+        with self._reading() as c:
+            return [self._from_row(row) for row in c.execute(self._range_sql, (campaign_id, start, end))]
+
+    def phones(self, campaign_id: str, start: int, end: int) -> List[str]:
+        with self._reading() as c:
+            return [row[0] for row in c.execute(self._phones_sql, (campaign_id, start, end))]
+
+    def register_list(self, list_id: str, created_at: str):
+        """Registra uma lista enviada por upload (adotada depois ou apagada por purge_lists_before)"""
+        with self._writing() as c:
+            c.execute(self._register_list_sql, (list_id, created_at))
+
+    def adopt(self, list_id: str, campaign_id: str) -> int:
+        """Transfere uma lista importada para a campanha criada com ela - só listas de upload
+        registradas (nunca os contatos de outra campanha)"""
+        if not list_id.startswith(CONTACT_LIST_PREFIX):
+            return 0
+        with self._writing() as c:
+            if c.execute(self._list_exists_sql, (list_id,)).fetchone() is None:
+                return 0
+            c.execute(self._delete_list_sql, (list_id,))
+            return c.execute(self._adopt_sql, (campaign_id, list_id)).rowcount
+
+    def delete_campaign(self, campaign_id: str, conn: Optional[sqlite3.Connection] = None) -> int:
+        with self._writing(conn) as c:
+            c.execute(self._delete_list_sql, (campaign_id,))
+            return c.execute(self._delete_campaign_sql, (campaign_id,)).rowcount
+
+    def purge_lists_before(self, created_at: str) -> int:
+        """Apaga as listas de upload não adotadas desde `created_at` (e as sem registro) - contatos apagados"""
+        with self._writing() as c:
+            deleted = c.execute(self._purge_contacts_sql, (created_at,)).rowcount
+            c.execute(self._purge_lists_sql, (created_at,))
+            return deleted
+
+
+class ChatSessionRepository(Repository):
+    """Sessões de chat despejadas da memória - gravadas em lote e relidas quando a conversa volta"""
+
+    table = "chat_sessions"
+    fields = {
+        "id": "id",
+        "agentId": "agent_id",
+        "turns": "turns",
+        "turnCount": "turn_count",
+        "createdAt": "created_at",
+        "updatedAt": "updated_at",
+    }
+    json_fields = ("turns",)
+    order_by = "updated_at"
+
+    _purge_sql = "DELETE FROM chat_sessions WHERE updated_at < ?"
+
+    def __init__(self, pool: ConnectionPool):
+        super().__init__(pool)
+        self._replace_sql = self._insert_sql.replace("INSERT INTO", "INSERT OR REPLACE INTO", 1)
+
+    def save_many(self, sessions: Iterable[Dict[str, Any]], conn: Optional[sqlite3.Connection] = None) -> int:
+        """Grava (ou substitui) as sessões numa única transação"""
+        with self._writing(conn) as c:
+            return c.executemany(self._replace_sql, (self._to_row(session) for session in sessions)).rowcount
+
+    def purge_before(self, updated_at: str, conn: Optional[sqlite3.Connection] = None) -> int:
+        """Apaga as sessões frias sem atividade desde `updated_at` (ISO)"""
+        with self._writing(conn) as c:
+            return c.execute(self._purge_sql, (updated_at,)).rowcount
+
+
+class AgentMetricsRepository(Repository):
+    """Buckets de estatísticas dos agentes (arrays serializados) - um registro por agente"""
+
+    table = "agent_metrics"
+    fields = {
+        "id": "id",
+        "buckets": "buckets",
+        "updatedAt": "updated_at",
+    }
+    order_by = "updated_at"
+
+    def __init__(self, pool: ConnectionPool):
+        super().__init__(pool)
+        self._replace_sql = self._insert_sql.replace("INSERT INTO", "INSERT OR REPLACE INTO", 1)
+
+    def save_many(self, records: Iterable[Dict[str, Any]], conn: Optional[sqlite3.Connection] = None) -> int:
+        """Grava (ou substitui) os buckets numa única transação"""
+        with self._writing(conn) as c:
+            return c.executemany(self._replace_sql, (self._to_row(record) for record in records)).rowcount
+
+
+# Instâncias globais
+db_pool = ConnectionPool(DATABASE_PATH)
+leads_repo = LeadRepository(db_pool)
+clients_repo = ClientRepository(db_pool)
+contracts_repo = ContractRepository(db_pool)
+agents_repo = AgentRepository(db_pool)
+campaigns_repo = CampaignRepository(db_pool)
+messages_repo = MessageRepository(db_pool)
+dispatch_chunks_repo = DispatchChunkRepository(db_pool)
+campaign_contacts_repo = CampaignContactRepository(db_pool)
+chat_sessions_repo = ChatSessionRepository(db_pool)
+agent_metrics_repo = AgentMetricsRepository(db_pool)
+searchable_repositories = {
+    repository.entity: repository for repository in (leads_repo, clients_repo, contracts_repo)
+}
+
+
+def _migrate_normalized_columns(conn: sqlite3.Connection):
+    """Adiciona e preenche as colunas normalizadas em bancos criados antes delas"""
+    for table, column in NORMALIZED_COLUMNS:
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column in existing:
+            continue
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+        source = column.replace("_normalized", "")
+        normalize = normalize_cpf if source == "cpf" else normalize_phone
+        rows = conn.execute(f"SELECT id, {source} FROM {table}").fetchall()
+        conn.executemany(
+            f"UPDATE {table} SET {column} = ? WHERE id = ?",
+            ((normalize(row[source]), row["id"]) for row in rows)
+        )
+
+    for statement in UNIQUE_INDEXES:
+        try:
+            conn.execute(statement)
+        except sqlite3.IntegrityError as e:
+            # Dados antigos duplicados: mantém índice comum até a limpeza manual
+            print(f"⚠️ Índice único não criado ({e}) - usando índice comum")
+            conn.execute(statement.replace("CREATE UNIQUE INDEX", "CREATE INDEX"))
+
+
+def _migrate_added_columns(conn: sqlite3.Connection):
+    for table, column, definition in ADDED_COLUMNS:
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _create_search_schema(conn: sqlite3.Connection):
+    global search_available
+    try:
+        for statement in SEARCH_SCHEMA:
+            conn.execute(statement)
+    except sqlite3.OperationalError as e:
+        # SQLite sem FTS5/trigram (< 3.34): a aplicação segue sem a busca textual
+        search_available = False
+        print(f"⚠️ Busca textual indisponível: {e}")
+
+
+def create_schema(conn: sqlite3.Connection):
+    """Cria tabelas, índices e migrações pendentes (idempotente)"""
+    for statement in SCHEMA:
+        conn.execute(statement)
+    _migrate_normalized_columns(conn)
+    _migrate_added_columns(conn)
+    conn.execute(AGGREGATES_SCHEMA)
+    _create_search_schema(conn)
+
+
+def init_database():
+    """Cria as tabelas da aplicação e carrega os índices em memória"""
+    with db_pool.transaction() as conn:
+        create_schema(conn)
+    for repository in (leads_repo, clients_repo):
+        repository.load_lookup_indexes()
+    for repository in searchable_repositories.values():
+        repository.backfill_search_index()
+    with db_pool.transaction() as conn:
+        for repository in searchable_repositories.values():
+            has_counters = conn.execute(
+                "SELECT 1 FROM dashboard_counters WHERE entity = ? LIMIT 1", (repository.entity,)
+            ).fetchone()
+            if has_counters is None:
+                repository.rebuild_aggregates(conn)
+    print(f"🗄️ Banco de dados pronto: {DATABASE_PATH}")
+
+
+def search_records(text: str, entities: Optional[List[str]] = None, limit: int = 20,
+                   offset: int = 0, repositories: Optional[Dict[str, Repository]] = None) -> tuple:
+    """Busca ranqueada (bm25, nome com peso maior) - retorna (resultados, há mais páginas)"""
+    if not search_available:
+        raise RuntimeError("Busca textual indisponível neste servidor")
+    repositories = repositories or searchable_repositories
+    query = build_search_query(text)
+    if not query:
+        raise ValueError(f"Informe ao menos um termo com {SEARCH_MIN_TERM_LENGTH} caracteres")
+    entities = [entity for entity in (entities or list(repositories)) if entity in repositories]
+    if not entities:
+        raise ValueError("Nenhum tipo de registro válido para busca")
+
+    placeholders = ", ".join("?" for _ in entities)
+    sql = (
+        "SELECT d.entity, d.entity_id, bm25(search_index, 2.0, 1.0) AS score "
+        "FROM search_index JOIN search_documents d ON d.doc_id = search_index.rowid "
+        f"WHERE search_index MATCH ? AND d.entity IN ({placeholders}) "
+        "ORDER BY score LIMIT ? OFFSET ?"
+    )
+    pool = next(iter(repositories.values())).pool
+    with pool.connection() as c:
+        hits = c.execute(sql, [query, *entities, limit + 1, offset]).fetchall()
+
+        results = []
+        for hit in hits[:limit]:
+            record = repositories[hit["entity"]].get(hit["entity_id"], conn=c)
+            if record is not None:
+                results.append({
+                    "type": hit["entity"],
+                    "id": hit["entity_id"],
+                    "score": round(-hit["score"], 6),
+                    "record": record
+                })
+    return results, len(hits) > limit
+
+
+def seed_records(repository: Repository, records: List[Dict[str, Any]]) -> int:
+    """Insere registros de demonstração apenas quando a tabela está vazia"""
+    if repository.count() > 0:
+        return 0
+    return repository.insert_many(records, ignore_existing=True)
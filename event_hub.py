@@ -0,0 +1,69 @@
+"""
+📡 AutoCred Event Hub - Publicação de eventos em tempo real (SSE/WebSocket)
+
+Os eventos que chegam pelo webhook da Evolution API (QR Code, estado da conexão)
+são entregues na hora a quem está assinando a instância, sem polling.
+Cada assinante tem uma fila limitada: se o navegador não acompanhar, o evento
+mais antigo é descartado (para QR Code só o mais recente importa).
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Set
+
+EVENT_QUEUE_SIZE = 16
+
+
+class EventHub:
+    """Pub/sub em memória por chave (nome da instância) - usado dentro do event loop"""
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, key: str, event: Dict[str, Any]) -> int:
+        """Entrega o evento a todos os assinantes da chave - retorna quantos receberam"""
+        self.published += 1
+        subscribers = self._subscribers.get(key, ())
+        for queue in list(subscribers):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(event)
+        return len(subscribers)
+
+    @asynccontextmanager
+    async def subscribe(self, key: str):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(key, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(key)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[key]
+
+    async def wait_for(self, key: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Aguarda (sem bloquear o event loop) o próximo evento da chave, até `timeout` segundos"""
+        async with self.subscribe(key) as queue:
+            try:
+                return await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+    def subscriber_count(self, key: Optional[str] = None) -> int:
+        if key is not None:
+            return len(self._subscribers.get(key, ()))
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channels": len(self._subscribers),
+            "subscribers": self.subscriber_count(),
+            "published": self.published,
+            "dropped": self.dropped
+        }
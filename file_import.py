@@ -0,0 +1,230 @@
+"""
+📥 AutoCred Import - Leitura em streaming de planilhas CSV/XLSX
+
+Os arquivos dos fornecedores de leads chegam com 50k-500k linhas: as linhas são
+lidas uma a uma (sem carregar o arquivo inteiro em memória) e entregues como
+dicionários com os cabeçalhos normalizados (minúsculos, sem acento).
+
+Exceção no XLSX: a tabela de textos compartilhados (sharedStrings.xml) é
+referenciada por índice de qualquer linha, então fica inteira em memória. Ela é
+limitada por XLSX_MAX_SHARED_STRINGS / XLSX_MAX_SHARED_CHARS - acima disso o
+arquivo é recusado (ImportFileError) e deve ser enviado como CSV. Arquivo
+corrompido no meio da leitura também vira ImportFileError.
+"""
+
+import codecs
+import csv
+import io
+import os
+import re
+import zlib
+import zipfile
+from decimal import Decimal, InvalidOperation
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+from xml.etree.ElementTree import ParseError, iterparse
+
+from database import fold_text
+
+SNIFF_SIZE = 64 * 1024
+CSV_DELIMITERS = ";,\t|"
+XLSX_MAGIC = b"PK\x03\x04"
+XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+# Teto da tabela de textos compartilhados do XLSX (a única parte lida inteira)
+XLSX_MAX_SHARED_STRINGS = int(os.getenv("XLSX_MAX_SHARED_STRINGS", "1000000"))
+XLSX_MAX_SHARED_CHARS = int(os.getenv("XLSX_MAX_SHARED_CHARS", str(64 * 1024 * 1024)))
+
+
+class ImportFileError(ValueError):
+    """Arquivo ilegível ou em formato não suportado"""
+
+
+def normalize_header(value: Any) -> str:
+    """'Saldo_Devedor ' -> 'saldo devedor'"""
+    return " ".join(fold_text(value).replace("_", " ").replace("-", " ").split())
+
+
+def sniff_encoding(sample: bytes) -> str:
+    """UTF-8 (com ou sem BOM) quando decodifica, senão cp1252 (Excel em português)"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Amostra cortada no meio de um caractere multibyte ainda é UTF-8
+        if e.start < len(sample) - 3:
+            return "cp1252"
+    return "utf-8"
+
+
+def iter_csv_rows(stream: BinaryIO) -> Iterator[Dict[str, str]]:
+    """Linhas de um CSV com encoding e delimitador detectados pela amostra inicial"""
+    sample = stream.read(SNIFF_SIZE)
+    stream.seek(0)
+    encoding = sniff_encoding(sample)
+    text_sample = sample.decode(encoding, errors="ignore")
+    try:
+        delimiter = csv.Sniffer().sniff(text_sample.split("\n", 1)[0], delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ","
+
+    text = io.TextIOWrapper(stream, encoding=encoding, errors="replace", newline="")
+    try:
+        reader = csv.reader(text, delimiter=delimiter)
+        header = next(reader, None)
+        if not header:
+            return
+        columns = [normalize_header(column) for column in header]
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            yield dict(zip(columns, (cell.strip() for cell in row)))
+    finally:
+        text.detach()
+
+
+def _xlsx_first_sheet(archive: zipfile.ZipFile) -> str:
+    """Caminho da primeira aba do workbook (ordem das abas, não do nome do arquivo)"""
+    try:
+        with archive.open("xl/workbook.xml") as workbook:
+            sheet = next(
+                element for _, element in iterparse(workbook) if element.tag == f"{XLSX_NS}sheet"
+            )
+        rel_id = sheet.get(f"{REL_NS}id")
+        with archive.open("xl/_rels/workbook.xml.rels") as rels:
+            for _, element in iterparse(rels):
+                if element.get("Id") == rel_id:
+                    target = element.get("Target").lstrip("/")
+                    return target if target.startswith("xl/") else f"xl/{target}"
+    except (KeyError, StopIteration):
+        pass
+    return "xl/worksheets/sheet1.xml"
+
+
+def _xlsx_shared_strings(archive: zipfile.ZipFile) -> List[str]:
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    chars = 0
+    with archive.open("xl/sharedStrings.xml") as shared:
+        for _, element in iterparse(shared):
+            if element.tag == f"{XLSX_NS}si":
+                text = "".join(part.text or "" for part in element.iter(f"{XLSX_NS}t"))
+                element.clear()
+                strings.append(text)
+                chars += len(text)
+                if len(strings) > XLSX_MAX_SHARED_STRINGS or chars > XLSX_MAX_SHARED_CHARS:
+                    raise ImportFileError("Planilha XLSX com textos demais para importar - salve como .csv")
+    return strings
+
+
+def _xlsx_column_index(reference: str) -> int:
+    """'C12' -> 2"""
+    index = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        index = index * 26 + (ord(char.upper()) - 64)
+    return index - 1
+
+
+def _xlsx_number(value: str) -> str:
+    """Números do Excel vêm como float ('1.2345678901E10'): inteiros voltam sem casas decimais"""
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        return value
+    if number == number.to_integral_value():
+        return str(int(number))
+    return format(number.normalize(), "f")
+
+
+def iter_xlsx_rows(stream: BinaryIO) -> Iterator[Dict[str, str]]:
+    """Linhas da primeira aba de um XLSX, lidas com iterparse (memória constante por linha)"""
+    try:
+        yield from _iter_xlsx_rows(stream)
+    except (zipfile.BadZipFile, zlib.error, ParseError, EOFError) as e:
+        raise ImportFileError(f"Arquivo XLSX inválido: {e}")
+
+
+def _iter_xlsx_rows(stream: BinaryIO) -> Iterator[Dict[str, str]]:
+    archive = zipfile.ZipFile(stream)
+
+    with archive:
+        shared_strings = _xlsx_shared_strings(archive)
+        columns: Optional[List[str]] = None
+        try:
+            sheet = archive.open(_xlsx_first_sheet(archive))
+        except KeyError:
+            raise ImportFileError("Planilha XLSX sem abas")
+
+        with sheet:
+            for _, element in iterparse(sheet):
+                if element.tag != f"{XLSX_NS}row":
+                    continue
+                cells: Dict[int, str] = {}
+                for position, cell in enumerate(element.iter(f"{XLSX_NS}c")):
+                    reference = cell.get("r")
+                    index = _xlsx_column_index(reference) if reference else position
+                    cell_type = cell.get("t")
+                    if cell_type == "inlineStr":
+                        value = "".join(text.text or "" for text in cell.iter(f"{XLSX_NS}t"))
+                    else:
+                        raw = cell.find(f"{XLSX_NS}v")
+                        value = raw.text if raw is not None and raw.text else ""
+                        if cell_type == "s" and value:
+                            try:
+                                value = shared_strings[int(value)]
+                            except (IndexError, ValueError):
+                                raise ImportFileError(f"Texto compartilhado inexistente na célula {reference}")
+                        elif cell_type in (None, "n") and value:
+                            value = _xlsx_number(value)
+                    cells[index] = value.strip()
+                element.clear()
+
+                if columns is None:
+                    if cells:
+                        width = max(cells) + 1
+                        columns = [normalize_header(cells.get(i, "")) for i in range(width)]
+                    continue
+                if not any(cells.values()):
+                    continue
+                yield {column: cells.get(i, "") for i, column in enumerate(columns) if column}
+
+
+def iter_rows(filename: str, stream: BinaryIO) -> Iterator[Dict[str, str]]:
+    """Escolhe o leitor pelo conteúdo (assinatura ZIP) ou pela extensão do arquivo"""
+    head = stream.read(len(XLSX_MAGIC))
+    stream.seek(0)
+    name = (filename or "").lower()
+    if head == XLSX_MAGIC or name.endswith(".xlsx"):
+        return iter_xlsx_rows(stream)
+    if name.endswith(".xls"):
+        raise ImportFileError("Formato .xls não suportado - salve a planilha como .xlsx ou .csv")
+    return iter_csv_rows(stream)
+
+
+def parse_brl(value: Any) -> Optional[Decimal]:
+    """'R$ 1.234,56', '1234.56', '1234,5' -> Decimal; vazio -> None; inválido -> ValueError"""
+    text = str(value or "").replace("R$", "").replace(" ", "").replace("\xa0", "")
+    if not text:
+        return None
+    if "," in text:
+        # Formato brasileiro: ponto de milhar, vírgula decimal
+        text = text.replace(".", "").replace(",", ".")
+    elif re.fullmatch(r"-?\d{1,3}(\.\d{3})+", text):
+        # '1.234' / '1.234.567' sem vírgula: pontos de milhar
+        text = text.replace(".", "")
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Valor monetário inválido: {value}")
+    if not amount.is_finite():
+        raise ValueError(f"Valor monetário inválido: {value}")
+    return amount.quantize(Decimal("0.01"))
+
+
+def format_brl(amount: Decimal) -> str:
+    """Decimal('1234.5') -> 'R$ 1.234,50'"""
+    formatted = f"{amount:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+    return f"R$ {formatted}"
@@ -0,0 +1,111 @@
+"""
+🎯 AutoCred Intents - Classificação das mensagens recebidas pelos agentes
+
+Cada personalidade/template declara intenções com palavras-chave; o conjunto é
+compilado uma única vez numa regex combinada (as palavras-chave numa trie, os
+prefixos comuns fatorados) sobre o texto sem acento e em minúsculas. A mensagem é lida uma
+vez só, não importa quantas intenções existam no catálogo.
+
+Palavras-chave terminadas em * valem como prefixo ("empresti*" casa com
+"empréstimo" e "emprestimos"); as demais precisam casar a palavra inteira.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from database import fold_text
+
+
+class IntentMatcher:
+    """Autômato (regex combinada) das palavras-chave -> intenção, na ordem de prioridade"""
+
+    def __init__(self, intents: Iterable[Dict[str, Any]]):
+        self.intents: List[Dict[str, Any]] = []
+        self._keyword_intent: Dict[str, int] = {}
+        exact: List[str] = []
+        prefixes: List[str] = []
+        declared = set()
+        for intent in intents:
+            if intent["id"] in declared:
+                continue  # a primeira declaração (mais específica) vence
+            declared.add(intent["id"])
+            position = len(self.intents)
+            self.intents.append(intent)
+            for keyword in intent.get("keywords", ()):
+                folded = " ".join(fold_text(keyword).split())
+                if folded.endswith("*"):
+                    stem = folded.rstrip("*")
+                    if stem and stem not in self._keyword_intent:
+                        self._keyword_intent[stem] = position
+                        prefixes.append(stem)
+                elif folded and folded not in self._keyword_intent:
+                    self._keyword_intent[folded] = position
+                    exact.append(folded)
+
+        alternatives = []
+        if exact:
+            alternatives.append(rf"(?P<word>{self._alternation(exact)})(?!\w)")
+        if prefixes:
+            alternatives.append(rf"(?P<stem>{self._alternation(prefixes)})\w*")
+        self._pattern = re.compile(rf"(?<!\w)(?:{'|'.join(alternatives)})") if alternatives else None
+
+    @staticmethod
+    def _alternation(keywords: List[str]) -> str:
+        """Alternância em forma de trie (prefixos comuns fatorados): o regex não testa
+        cada palavra-chave em cada posição - o custo segue o tamanho da palavra, como no Aho-Corasick"""
+        trie: Dict[str, Any] = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = True
+
+        def render(node: Dict[str, Any]) -> str:
+            branches = []
+            for char in sorted(key for key in node if key):
+                atom = r"\s+" if char == " " else re.escape(char)
+                branches.append(atom + render(node[char]))
+            if not branches:
+                return ""
+            body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+            # Fim de palavra-chave no meio do caminho: o resto é opcional (guloso - a mais longa ganha)
+            if "" in node:
+                return f"(?:{body})?"
+            return body
+
+        return render(trie)
+
+    def scores(self, message: str) -> Dict[str, int]:
+        """Quantas palavras-chave de cada intenção aparecem na mensagem"""
+        counts = [0] * len(self.intents)
+        if self._pattern is not None:
+            for match in self._pattern.finditer(fold_text(message)):
+                keyword = match.group(match.lastgroup)
+                counts[self._keyword_intent[" ".join(keyword.split())]] += 1
+        return {self.intents[i]["id"]: count for i, count in enumerate(counts) if count}
+
+    def classify(self, message: str) -> Optional[Dict[str, Any]]:
+        """Intenção com mais palavras-chave na mensagem (empate: a declarada antes) - None se nenhuma"""
+        counts = self.scores(message)
+        if not counts:
+            return None
+        best = max(counts.values())
+        return next(intent for intent in self.intents if counts.get(intent["id"]) == best)
+
+
+_matchers: Dict[tuple, IntentMatcher] = {}
+
+
+def compile_intents(key: tuple, *intent_lists: Optional[Iterable[Dict[str, Any]]]) -> IntentMatcher:
+    """Matcher compilado uma vez por chave (personalidade, template) - listas em ordem de prioridade"""
+    matcher = _matchers.get(key)
+    if matcher is None:
+        matcher = _matchers[key] = IntentMatcher(
+            intent for intents in intent_lists if intents for intent in intents
+        )
+    return matcher
+
+
+def clear_compiled():
+    """Descarta os matchers compilados (catálogo de intenções alterado)"""
+    _matchers.clear()
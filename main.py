@@ -5,25 +5,50 @@
 📧 Login: admin@autocred.com | 🔑 Senha: admin123
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Request, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, Request, UploadFile, File, Form, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 import uvicorn
 from typing import Dict, Any, Optional, List
 import hashlib
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import requests
 import csv
 import io
 import time
+import asyncio
 import json
+import itertools
 import os
 import schedule
+import sqlite3
 import threading
+from chat_sessions import ChatSessionStore
+from agent_metrics import AgentMetricsStore
+from auto_reply import AUTO_REPLY_MAX_AGE, AutoReplyPipeline
+from intents import compile_intents
+from evolution_client import EvolutionClient
+from message_template import compile_template
+from event_hub import EventHub
+from ttl_cache import TTLCache
+from phones import normalize_many, parse_phone, to_whatsapp_jid
+from registry import Registry
+from sms_dispatch import SMSDispatcher
+from sms_status import SMSStatusPoller
+from sms_scheduler import SMS_SEND_RATE, CampaignScheduler, SendWindow, parse_start
+from webhook_queue import WebhookDeduper, WebhookQueue, webhook_event_key, webhook_event_time
+from file_import import ImportFileError, iter_rows, normalize_header, parse_brl, format_brl
+from database import (
+    init_database, seed_records, db_pool, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE,
+    normalize_cpf, normalize_phone, search_records, calendar_buckets,
+    leads_repo, clients_repo, contracts_repo, agents_repo, campaigns_repo, messages_repo,
+    dispatch_chunks_repo, campaign_contacts_repo, chat_sessions_repo, agent_metrics_repo,
+    CONTACT_LIST_PREFIX
+)
 
 # =============================================================================
 # CONFIGURAÇÃO AUTOMÁTICA DE AMBIENTE 
@@ -135,54 +160,17 @@ def keep_alive_service():
         thread.start()
         print("✅ Keep-alive service iniciado para Railway")
 
-# Evolution API Helper Function
-def make_evolution_request(method: str, endpoint: str, data: dict = None) -> dict:
-    """Helper function to make requests to Evolution API with proper authentication"""
-    url = f"{EVOLUTION_API_URL}{endpoint}"
-    headers = {
-        "apikey": EVOLUTION_API_KEY,
-        "Content-Type": "application/json"
-    }
-    
-    try:
-        if method.upper() == "GET":
-            response = requests.get(url, headers=headers, timeout=10)
-        elif method.upper() == "POST":
-            response = requests.post(url, headers=headers, json=data, timeout=10)
-        elif method.upper() == "DELETE":
-            response = requests.delete(url, headers=headers, timeout=10)
-        else:
-            return {"success": False, "error": f"Método {method} não suportado"}
-        
-        if response.status_code == 200 or response.status_code == 201:
-            return {"success": True, "data": response.json()}
-        elif response.status_code == 401:
-            # Handle authentication error - return simulated response for development
-            print(f"⚠️  Evolution API Authentication Error - Using simulated response for development")
-            return {
-                "success": True, 
-                "data": {"simulated": True, "message": "Development mode - Authentication not configured"},
-                "warning": "Using simulated response due to authentication issues"
-            }
-        else:
-            return {
-                "success": False, 
-                "error": f"Evolution API retornou status {response.status_code}",
-                "details": response.text
-            }
-    except requests.exceptions.RequestException as e:
-        print(f"⚠️  Evolution API Connection Error - Using simulated response")
-        return {
-            "success": True, 
-            "data": {"simulated": True, "message": "Development mode - API not available"},
-            "warning": "Using simulated response due to connection issues"
-        }
-    except Exception as e:
-        return {"success": False, "error": f"Erro inesperado: {str(e)}"}
+# Evolution API Client - pool de conexões assíncrono compartilhado por todas as rotas
+evolution_api = EvolutionClient(EVOLUTION_API_URL, EVOLUTION_API_KEY)
 
 # Criar aplicação FastAPI
 app = FastAPI(title="AutoCred API", version="1.0.0")
 
+@app.on_event("shutdown")
+async def close_evolution_client():
+    """Fecha as conexões keep-alive com a Evolution API"""
+    await evolution_api.close()
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -208,18 +196,137 @@ USERS_DB = {
     }
 }
 
-# Listas globais para simular banco de dados
-created_clients = []
-created_contracts = []
+# Dados de demonstração (inseridos no banco apenas quando a tabela está vazia)
+DEMO_LEADS = [
+    {
+        "id": "1",
+        "name": "Roberto Almeida",
+        "cpf": "123.456.789-01",
+        "phone": "(11) 98765-4321",
+        "source": "Ura",
+        "modality": "Portabilidade",
+        "status": "Novo",
+        "assignedTo": "Ana Rodrigues",
+        "createdAt": "2025-05-09T14:30:00Z",
+        "installment": "R$ 450,00",
+        "outstandingBalance": "R$ 12.500,00"
+    }
+]
+
+DEMO_CLIENTS = [
+    {
+        "id": "1",
+        "name": "Roberto Carlos Silva",
+        "cpf": "123.456.789-01",
+        "phone": "(11) 99999-1234",
+        "status": "ativo",
+        "contractsCount": 3,
+        "totalValue": 15500.00,
+        "lastActivity": "2025-05-10T14:30:00Z",
+        "notes": "Cliente VIP com excelente histórico de pagamento",
+        "installment": "R$ 520,00",
+        "outstandingBalance": "R$ 15.800,00",
+        "source": "Ura",
+        "modality": "Portabilidade",
+        "assignedTo": "Admin AutoCred",
+        "createdAt": "2025-04-15T10:00:00Z"
+    },
+    {
+        "id": "2",
+        "name": "Ana Paula Oliveira",
+        "cpf": "987.654.321-00",
+        "phone": "(11) 88888-5678",
+        "status": "vip",
+        "contractsCount": 5,
+        "totalValue": 28750.00,
+        "lastActivity": "2025-05-12T16:45:00Z",
+        "notes": "Cliente premium com múltiplos contratos ativos",
+        "installment": "R$ 890,00",
+        "outstandingBalance": "R$ 22.300,00",
+        "source": "WhatsApp",
+        "modality": "Port + Refin",
+        "assignedTo": "Vendedor 01",
+        "createdAt": "2025-03-20T14:30:00Z"
+    },
+    {
+        "id": "3",
+        "name": "Carlos Eduardo Santos",
+        "cpf": "456.789.123-45",
+        "phone": "(11) 77777-9012",
+        "status": "potencial",
+        "contractsCount": 1,
+        "totalValue": 8200.00,
+        "lastActivity": "2025-05-08T09:15:00Z",
+        "notes": "Cliente em negociação para segundo contrato",
+        "installment": "R$ 320,00",
+        "outstandingBalance": "R$ 9.800,00",
+        "source": "Telefone",
+        "modality": "Portabilidade",
+        "assignedTo": "Ana Rodrigues",
+        "createdAt": "2025-05-01T11:20:00Z"
+    }
+]
+
+DEMO_CONTRACTS = [
+    {
+        "id": "1001",
+        "clientName": "Roberto Almeida",
+        "clientId": "1",
+        "clientCPF": "123.456.789-01",
+        "clientPhone": "(11) 98765-4321",
+        "planId": "1",
+        "planName": "Plano Básico",
+        "modality": "Portabilidade",
+        "value": 5400.0,
+        "status": "active",
+        "startDate": "2025-04-01T00:00:00Z",
+        "endDate": "2026-03-31T23:59:59Z",
+        "createdBy": "Ana Rodrigues",
+        "createdAt": "2025-04-01T10:00:00Z",
+        "installments": 12
+    },
+    {
+        "id": "1002",
+        "clientName": "Maria Fernanda Costa",
+        "clientId": "2",
+        "clientCPF": "987.654.321-00",
+        "clientPhone": "(11) 88888-5678",
+        "planId": "2",
+        "planName": "Plano Premium",
+        "modality": "Port + Refin",
+        "value": 8200.0,
+        "status": "active",
+        "startDate": "2025-03-15T00:00:00Z",
+        "endDate": "2026-03-14T23:59:59Z",
+        "createdBy": "Vendedor 01",
+        "createdAt": "2025-03-15T14:30:00Z",
+        "installments": 12
+    }
+]
+
+# Persistência em SQLite (database.py) - sobrevive a redeploys
+init_database()
+seed_records(leads_repo, DEMO_LEADS)
+seed_records(clients_repo, DEMO_CLIENTS)
+seed_records(contracts_repo, DEMO_CONTRACTS)
 
 # =============================================================================
 # AI AGENTS GLOBAL STORAGE
 # =============================================================================
 
-# Global storage para agentes e conexões WhatsApp
-created_agents = []
-whatsapp_connections = {}
-qr_codes_cache = {}
+# Global storage para conexões WhatsApp (os agentes ficam no Registry created_agents, junto dos endpoints)
+
+# Caches limitados (ttl_cache.py): QR Codes expiram em ~60s no WhatsApp; o estado das
+# conexões vive enquanto é consultado. O limite de tamanho segura a memória com instâncias rotativas.
+QR_CODE_TTL = int(os.getenv("QR_CODE_TTL", "60"))
+CONNECTION_TTL = int(os.getenv("CONNECTION_TTL", str(24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+
+whatsapp_connections = TTLCache("whatsapp_connections", CACHE_MAX_ENTRIES, CONNECTION_TTL, sliding=True)
+qr_codes_cache = TTLCache("qr_codes_cache", CACHE_MAX_ENTRIES, QR_CODE_TTL)
+# Último QR Code e estado de conexão recebidos pelo webhook, por instância
+qr_cache = TTLCache("qr_cache", CACHE_MAX_ENTRIES, QR_CODE_TTL)
+connection_cache = TTLCache("connection_cache", CACHE_MAX_ENTRIES, CONNECTION_TTL, sliding=True)
 
 # Personalidades de agentes disponíveis
 agent_personalities = [
@@ -430,9 +537,6 @@ Sempre demonstre economia concreta com números.""",
     }
 ]
 
-# SMS Global Storage  
-sms_campaigns = []
-
 # Helper function para criação automática de instâncias WhatsApp
 async def create_whatsapp_instance_for_agent(agent_id: str, instance_name: str):
     """Helper function para criar instância WhatsApp automaticamente para agente"""
@@ -456,7 +560,7 @@ async def create_whatsapp_instance_for_agent(agent_id: str, instance_name: str):
         }
         
         # Tentar criar na Evolution API
-        result = make_evolution_request("POST", "/instance/create", instance_data)
+        result = await evolution_api.request("POST", "/instance/create", instance_data)
         
         if result.get("success"):
             print(f"✅ Instância WhatsApp {instance_name} criada para agente {agent_id}")
@@ -565,6 +669,9 @@ class Contract(BaseModel):
 class FinalizeSaleRequest(BaseModel):
     leadId: str
 
+class FinalizeSaleBatchRequest(BaseModel):
+    leadIds: List[str] = Field(..., min_length=1, max_length=5000)
+
 class FinalizeSaleResponse(BaseModel):
     success: bool
     message: str
@@ -599,32 +706,25 @@ async def root():
         return FileResponse("static/index.html")
     return {"message": "AutoCred API está funcionando!", "status": "online", "environment": ENVIRONMENT, "note": "Frontend React sendo construído..."}
 
-# Adicionar catch-all route para React Router
-@app.get("/{path:path}")
-async def serve_react_app(path: str):
-    """Serve frontend React para todas as rotas não-API"""
-    # Se for rota da API, deixar o FastAPI tratar
-    if path.startswith("api/") or path.startswith("docs") or path.startswith("webhook/"):
-        raise HTTPException(status_code=404, detail="API endpoint not found")
-    
-    # Verificar se é arquivo estático
-    file_path = f"static/{path}"
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        return FileResponse(file_path)
-    
-    # Para todas as outras rotas, servir o index.html (React Router)
-    if os.path.exists("static/index.html"):
-        return FileResponse("static/index.html")
-    
-    return {"message": "Frontend React não encontrado", "path": path}
-
 @app.get("/api/health")
 async def health_check():
     return {
         "status": "healthy",
         "message": f"AutoCred Backend rodando na porta {PORT}",
         "environment": ENVIRONMENT,
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "evolution_client": evolution_api.stats(),
+        "caches": {
+            cache.name: cache.stats()
+            for cache in (whatsapp_connections, qr_codes_cache, qr_cache, connection_cache)
+        },
+        "webhook_queue": webhook_queue.stats(),
+        "webhook_dedupe": webhook_deduper.stats(),
+        "sms_scheduler": sms_scheduler.stats(),
+        "sms_status": sms_status_poller.stats(),
+        "chat_sessions": chat_sessions.stats(),
+        "agent_metrics": agent_metrics.stats(),
+        "auto_reply": auto_reply.stats()
     }
 
 @app.post("/api/token", response_model=LoginResponse)
@@ -660,25 +760,83 @@ async def read_users_me(token: str = Depends(oauth2_scheme)):
         is_active=user["is_active"]
     )
 
+def paginate_records(repository, key: str, limit: int, cursor: Optional[str], status: Optional[str],
+                     modality: Optional[str], assignedTo: Optional[str], createdFrom: Optional[str],
+                     createdTo: Optional[str], sort: str, order: str) -> Dict[str, Any]:
+    """Monta a resposta paginada (keyset) comum às listagens de leads, clientes e contratos"""
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order deve ser 'asc' ou 'desc'")
+    try:
+        items, next_cursor = repository.paginate(
+            limit=limit,
+            cursor=cursor,
+            filters={"status": status, "modality": modality, "assignedTo": assignedTo},
+            created_from=createdFrom,
+            created_to=createdTo,
+            sort=sort,
+            descending=order == "desc"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        key: items,
+        "nextCursor": next_cursor,
+        "hasMore": next_cursor is not None,
+        "limit": limit
+    }
+
 @app.get("/api/leads")
-async def get_leads():
-    """Retorna lista de leads mockados"""
+async def get_leads(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    modality: Optional[str] = None,
+    assignedTo: Optional[str] = None,
+    createdFrom: Optional[str] = None,
+    createdTo: Optional[str] = None,
+    sort: str = "createdAt",
+    order: str = "desc"
+):
+    """Retorna uma página de leads (paginação por cursor, filtros e ordenação)"""
+    return paginate_records(leads_repo, "leads", limit, cursor, status, modality, assignedTo,
+                            createdFrom, createdTo, sort, order)
+
+def find_duplicate_lead(cpf: str, phone: str) -> Optional[Dict[str, Any]]:
+    """Retorna o lead já cadastrado com o mesmo CPF ou telefone (busca O(1) no índice em memória)"""
+    lead_id = (leads_repo.find_id_by("cpf_normalized", normalize_cpf(cpf))
+               or leads_repo.find_id_by("phone_normalized", normalize_phone(phone)))
+    return leads_repo.get(lead_id) if lead_id else None
+
+@app.get("/api/leads/by-phone/{phone}")
+async def get_lead_by_phone(phone: str):
+    """Busca lead pelo telefone normalizado"""
+    lead = leads_repo.find_by("phone_normalized", normalize_phone(phone))
+    if not lead:
+        raise HTTPException(status_code=404, detail="Lead não encontrado")
+    return {"lead": lead}
+
+@app.get("/api/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    types: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """Busca textual ranqueada em leads, clientes e contratos (nome, CPF, telefone, observações)"""
+    entities = [entity.strip() for entity in types.split(",") if entity.strip()] if types else None
+    try:
+        results, has_more = search_records(q, entities=entities, limit=limit, offset=offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
     return {
-        "leads": [
-            {
-                "id": "1",
-                "name": "Roberto Almeida",
-                "cpf": "123.456.789-01",
-                "phone": "(11) 98765-4321",
-                "source": "Ura",
-                "modality": "Portabilidade",
-                "status": "Novo",
-                "assignedTo": "Ana Rodrigues",
-                "createdAt": "2025-05-09T14:30:00Z",
-                "installment": "R$ 450,00",
-                "outstandingBalance": "R$ 12.500,00"
-            }
-        ]
+        "results": results,
+        "limit": limit,
+        "offset": offset,
+        "hasMore": has_more
     }
 
 @app.post("/api/leads", response_model=Lead)
@@ -688,6 +846,13 @@ async def create_lead(lead_data: LeadCreate):
     print(f"📝 Debug - Dados recebidos: {lead_data.model_dump()}")
     
     try:
+        duplicate = find_duplicate_lead(lead_data.cpf, lead_data.phone)
+        if duplicate:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Já existe um lead com este CPF ou telefone", "leadId": duplicate["id"]}
+            )
+        
         # Gerar ID único
         lead_id = str(uuid.uuid4())
         
@@ -707,123 +872,233 @@ async def create_lead(lead_data: LeadCreate):
             observations=lead_data.observations
         )
         
+        leads_repo.insert(new_lead.model_dump())
+        
         print(f"✅ Debug - Lead criado com sucesso: {new_lead.model_dump()}")
         return new_lead
         
+    except HTTPException:
+        raise
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=409, detail={"message": "Já existe um lead com este CPF ou telefone"})
     except Exception as e:
         print(f"❌ Debug - Erro ao criar lead: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+# Importação em lote: cabeçalhos aceitos (normalizados, sem acento) -> campo do lead
+LEAD_IMPORT_COLUMNS = {
+    "name": ("nome", "name", "cliente", "nome completo"),
+    "cpf": ("cpf", "documento", "cpf cliente"),
+    "phone": ("telefone", "phone", "celular", "whatsapp", "fone"),
+    "source": ("origem", "fonte", "source"),
+    "modality": ("modalidade", "modality", "produto"),
+    "status": ("status", "situacao"),
+    "assignedTo": ("responsavel", "assigned to", "assignedto", "vendedor", "consultor"),
+    "installment": ("parcela", "valor parcela", "installment"),
+    "outstandingBalance": ("saldo devedor", "saldo", "outstanding balance", "outstandingbalance"),
+    "observations": ("observacoes", "observacao", "obs", "observations"),
+}
+LEAD_IMPORT_BATCH_SIZE = 1000
+LEAD_IMPORT_MAX_REJECTED = 1000  # linhas rejeitadas detalhadas na resposta (o total é sempre contado)
+
+def is_valid_cpf(digits: str) -> bool:
+    """Confere os dois dígitos verificadores do CPF"""
+    if len(digits) != 11 or digits == digits[0] * 11:
+        return False
+    for position in (9, 10):
+        total = sum(int(digits[i]) * (position + 1 - i) for i in range(position))
+        if (total * 10 % 11) % 10 != int(digits[position]):
+            return False
+    return True
+
+def format_cpf(digits: str) -> str:
+    return f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}"
+
+def format_phone(digits: str) -> str:
+    return f"({digits[:2]}) {digits[2:-4]}-{digits[-4:]}"
+
+def parse_import_row(row: Dict[str, str], created_at: str) -> Dict[str, Any]:
+    """Converte uma linha da planilha em lead - ValueError com o motivo da rejeição"""
+    values = {}
+    for field, aliases in LEAD_IMPORT_COLUMNS.items():
+        values[field] = next((row[alias] for alias in aliases if row.get(alias)), "")
+
+    if not values["name"]:
+        raise ValueError("Nome obrigatório")
+    cpf = normalize_cpf(values["cpf"])
+    if not is_valid_cpf(cpf):
+        raise ValueError(f"CPF inválido: {values['cpf'] or 'vazio'}")
+    phone = parse_phone(values["phone"])
+    if not phone.valid:
+        raise ValueError(f"Telefone inválido ({phone.error}): {values['phone'] or 'vazio'}")
+    installment = parse_brl(values["installment"])
+    balance = parse_brl(values["outstandingBalance"])
+
+    return {
+        "id": str(uuid.uuid4()),
+        "name": values["name"],
+        "cpf": format_cpf(cpf),
+        "phone": format_phone(phone.national),
+        "source": values["source"] or "Importação",
+        "modality": values["modality"] or "Portabilidade",
+        "status": values["status"] or "Novo",
+        "assignedTo": values["assignedTo"] or "Admin AutoCred",
+        "createdAt": created_at,
+        "installment": format_brl(installment) if installment is not None else None,
+        "outstandingBalance": format_brl(balance) if balance is not None else None,
+        "observations": values["observations"] or None,
+    }
+
+def import_leads(rows, batch_size: int = LEAD_IMPORT_BATCH_SIZE):
+    """Valida e grava as linhas em transações de `batch_size` - gera eventos de progresso"""
+    started = time.monotonic()
+    processed = imported = rejected = 0
+    rejected_rows = []
+
+    def reject(line: int, reason: str, row: Dict[str, str]):
+        nonlocal rejected
+        rejected += 1
+        if len(rejected_rows) < LEAD_IMPORT_MAX_REJECTED:
+            rejected_rows.append({"line": line, "reason": reason, "row": row})
+
+    def flush(batch):
+        nonlocal imported
+        with db_pool.transaction() as conn:
+            inserted = leads_repo.insert_many([lead for _, lead, _ in batch], conn=conn, ignore_existing=True)
+        imported += inserted
+        if inserted < len(batch):
+            # Corrida com outro cadastro simultâneo: o índice único do banco descartou as linhas
+            for line, lead, row in batch:
+                if leads_repo.get(lead["id"]) is None:
+                    reject(line, "CPF ou telefone já cadastrado", row)
+
+    batch = []
+    # Um conjunto por coluna: um CPF igual ao telefone de outra linha não é duplicata
+    batch_cpfs, batch_phones = set(), set()
+    created_at = datetime.now().isoformat()
+    # Linha 1 é o cabeçalho
+    for line, row in enumerate(rows, start=2):
+        processed += 1
+        try:
+            lead = parse_import_row(row, created_at)
+        except ValueError as e:
+            reject(line, str(e), row)
+            continue
+
+        cpf_key = normalize_cpf(lead["cpf"])
+        phone_key = normalize_phone(lead["phone"])
+        if (cpf_key in batch_cpfs or phone_key in batch_phones
+                or leads_repo.find_id_by("cpf_normalized", cpf_key)
+                or leads_repo.find_id_by("phone_normalized", phone_key)):
+            reject(line, "CPF ou telefone já cadastrado", row)
+            continue
+        batch_cpfs.add(cpf_key)
+        batch_phones.add(phone_key)
+        batch.append((line, lead, row))
+
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch, batch_cpfs, batch_phones = [], set(), set()
+            created_at = datetime.now().isoformat()
+            yield {"event": "progress", "processed": processed, "imported": imported, "rejected": rejected}
+
+    if batch:
+        flush(batch)
+
+    yield {
+        "event": "done",
+        "processed": processed,
+        "imported": imported,
+        "rejected": rejected,
+        "rejectedRows": rejected_rows,
+        "elapsedSeconds": round(time.monotonic() - started, 3)
+    }
+
+@app.post("/api/leads/import")
+async def import_leads_file(file: UploadFile = File(...)):
+    """Importa leads de CSV/XLSX em streaming - resposta NDJSON com progresso a cada lote
+
+    Arquivo ilegível já na abertura (formato, XLSX corrompido ou grande demais) responde 400.
+    Depois disso o status já saiu como 200: a última linha é sempre {"event": "done", ...} ou
+    {"event": "error", "error": ..., "processed", "imported", "rejected"} - o cliente deve checá-la.
+    Lotes gravados antes do erro continuam importados (contados em "imported").
+    """
+    print(f"📥 Debug - Importação de leads: {file.filename}")
+    read_errors = (ImportFileError, UnicodeDecodeError, csv.Error)
+    try:
+        rows = iter_rows(file.filename, file.file)
+        # Primeira linha lida antes de responder (fora do event loop): no XLSX isso inclui a
+        # tabela de textos compartilhados, então erros de formato ainda viram 400
+        first = await asyncio.to_thread(next, rows, None)
+    except read_errors as e:
+        raise HTTPException(status_code=400, detail=f"Erro ao ler arquivo: {e}")
+    if first is not None:
+        rows = itertools.chain([first], rows)
+
+    def events():
+        progress = {"processed": 0, "imported": 0, "rejected": 0}
+        try:
+            for event in import_leads(rows):
+                progress = {key: event[key] for key in progress}
+                if event["event"] == "done":
+                    print(f"✅ Debug - Importação concluída: {event['imported']} importados, {event['rejected']} rejeitados")
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except read_errors as e:
+            yield json.dumps({"event": "error", "error": f"Erro ao ler arquivo: {e}", **progress}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"❌ Debug - Erro na importação de leads: {e}")
+            yield json.dumps({"event": "error", "error": str(e), **progress}, ensure_ascii=False) + "\n"
+
+    # Gerador síncrono: o Starlette o consome num threadpool, sem bloquear o event loop
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @app.get("/api/contracts")
-async def get_contracts():
-    """Retorna lista de contratos mockados + contratos criados"""
-    base_contracts = [
-        {
-            "id": "1001",
-            "clientName": "Roberto Almeida",
-            "clientId": "1",
-            "clientCPF": "123.456.789-01",
-            "clientPhone": "(11) 98765-4321",
-            "planId": "1",
-            "planName": "Plano Básico",
-            "modality": "Portabilidade",
-            "value": 5400.0,
-            "status": "active",
-            "startDate": "2025-04-01T00:00:00Z",
-            "endDate": "2026-03-31T23:59:59Z",
-            "createdBy": "Ana Rodrigues",
-            "createdAt": "2025-04-01T10:00:00Z",
-            "installments": 12
-        },
-        {
-            "id": "1002",
-            "clientName": "Maria Fernanda Costa",
-            "clientId": "2",
-            "clientCPF": "987.654.321-00",
-            "clientPhone": "(11) 88888-5678",
-            "planId": "2",
-            "planName": "Plano Premium",
-            "modality": "Port + Refin",
-            "value": 8200.0,
-            "status": "active",
-            "startDate": "2025-03-15T00:00:00Z",
-            "endDate": "2026-03-14T23:59:59Z",
-            "createdBy": "Vendedor 01",
-            "createdAt": "2025-03-15T14:30:00Z",
-            "installments": 12
-        }
-    ]
-    
-    # Combinar contratos base com contratos criados
-    all_contracts = base_contracts + created_contracts
+async def get_contracts(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    modality: Optional[str] = None,
+    assignedTo: Optional[str] = None,
+    createdFrom: Optional[str] = None,
+    createdTo: Optional[str] = None,
+    sort: str = "createdAt",
+    order: str = "desc"
+):
+    """Retorna uma página de contratos (paginação por cursor, filtros e ordenação)"""
+    page = paginate_records(contracts_repo, "contracts", limit, cursor, status, modality, assignedTo,
+                            createdFrom, createdTo, sort, order)
     
-    print(f"📊 Debug - Retornando {len(all_contracts)} contratos ({len(base_contracts)} base + {len(created_contracts)} criados)")
+    print(f"📊 Debug - Retornando {len(page['contracts'])} contratos")
     
-    return {"contracts": all_contracts}
+    return page
 
 @app.get("/api/clients")
-async def get_clients():
-    """Retorna lista de clientes mockados + clientes criados"""
-    base_clients = [
-        {
-            "id": "1",
-            "name": "Roberto Carlos Silva",
-            "cpf": "123.456.789-01",
-            "phone": "(11) 99999-1234",
-            "status": "ativo",
-            "contractsCount": 3,
-            "totalValue": 15500.00,
-            "lastActivity": "2025-05-10T14:30:00Z",
-            "notes": "Cliente VIP com excelente histórico de pagamento",
-            "installment": "R$ 520,00",
-            "outstandingBalance": "R$ 15.800,00",
-            "source": "Ura",
-            "modality": "Portabilidade",
-            "assignedTo": "Admin AutoCred",
-            "createdAt": "2025-04-15T10:00:00Z"
-        },
-        {
-            "id": "2",
-            "name": "Ana Paula Oliveira",
-            "cpf": "987.654.321-00",
-            "phone": "(11) 88888-5678",
-            "status": "vip",
-            "contractsCount": 5,
-            "totalValue": 28750.00,
-            "lastActivity": "2025-05-12T16:45:00Z",
-            "notes": "Cliente premium com múltiplos contratos ativos",
-            "installment": "R$ 890,00",
-            "outstandingBalance": "R$ 22.300,00",
-            "source": "WhatsApp",
-            "modality": "Port + Refin",
-            "assignedTo": "Vendedor 01",
-            "createdAt": "2025-03-20T14:30:00Z"
-        },
-        {
-            "id": "3",
-            "name": "Carlos Eduardo Santos",
-            "cpf": "456.789.123-45",
-            "phone": "(11) 77777-9012",
-            "status": "potencial",
-            "contractsCount": 1,
-            "totalValue": 8200.00,
-            "lastActivity": "2025-05-08T09:15:00Z",
-            "notes": "Cliente em negociação para segundo contrato",
-            "installment": "R$ 320,00",
-            "outstandingBalance": "R$ 9.800,00",
-            "source": "Telefone",
-            "modality": "Portabilidade",
-            "assignedTo": "Ana Rodrigues",
-            "createdAt": "2025-05-01T11:20:00Z"
-        }
-    ]
-    
-    # Combinar clientes base com clientes criados
-    all_clients = base_clients + created_clients
+async def get_clients(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    modality: Optional[str] = None,
+    assignedTo: Optional[str] = None,
+    createdFrom: Optional[str] = None,
+    createdTo: Optional[str] = None,
+    sort: str = "createdAt",
+    order: str = "desc"
+):
+    """Retorna uma página de clientes (paginação por cursor, filtros e ordenação)"""
+    page = paginate_records(clients_repo, "clients", limit, cursor, status, modality, assignedTo,
+                            createdFrom, createdTo, sort, order)
     
-    print(f"📊 Debug - Retornando {len(all_clients)} clientes ({len(base_clients)} base + {len(created_clients)} criados)")
+    print(f"📊 Debug - Retornando {len(page['clients'])} clientes")
     
-    return {"clients": all_clients}
+    return page
+
+@app.get("/api/clients/by-cpf/{cpf}")
+async def get_client_by_cpf(cpf: str):
+    """Busca cliente pelo CPF normalizado"""
+    client = clients_repo.find_by("cpf_normalized", normalize_cpf(cpf))
+    if not client:
+        raise HTTPException(status_code=404, detail="Cliente não encontrado")
+    return {"client": client}
 
 @app.post("/api/clients", response_model=Client)
 async def create_client(client_data: ClientCreate):
@@ -832,6 +1107,13 @@ async def create_client(client_data: ClientCreate):
     print(f"📝 Debug - Dados recebidos: {client_data.model_dump()}")
     
     try:
+        existing_id = clients_repo.find_id_by("cpf_normalized", normalize_cpf(client_data.cpf))
+        if existing_id:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Já existe um cliente com este CPF", "clientId": existing_id}
+            )
+        
         # Gerar ID único
         client_id = str(uuid.uuid4())
         
@@ -854,9 +1136,15 @@ async def create_client(client_data: ClientCreate):
             createdAt=datetime.now().isoformat()
         )
         
+        clients_repo.insert(new_client.model_dump())
+        
         print(f"✅ Debug - Cliente criado com sucesso: {new_client.model_dump()}")
         return new_client
         
+    except HTTPException:
+        raise
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=409, detail={"message": "Já existe um cliente com este CPF"})
     except Exception as e:
         print(f"❌ Debug - Erro ao criar cliente: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
@@ -867,31 +1155,38 @@ async def update_client_status(client_id: str, status_update: StatusUpdate):
     print(f"🔄 Debug - Atualizando status do cliente {client_id} para {status_update.status}")
     
     try:
-        # Em um ambiente real, aqui você atualizaria o banco de dados
-        # Por agora, apenas retornamos sucesso
+        updated = clients_repo.update(client_id, {"status": status_update.status})
+        if updated is None:
+            raise HTTPException(status_code=404, detail="Cliente não encontrado")
+        
         return {
             "message": f"Status do cliente {client_id} atualizado para {status_update.status}",
             "client_id": client_id,
             "new_status": status_update.status
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Debug - Erro ao atualizar status do cliente: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.delete("/api/clients/{client_id}")
-async def delete_client(client_id: int):
+async def delete_client(client_id: str):
     """Deleta um cliente"""
     print(f"🗑️  Debug - Deletando cliente com ID: {client_id}")
     
     try:
-        # Em um ambiente real, aqui você deletaria do banco de dados
-        # Por agora, apenas retornamos sucesso
+        if not clients_repo.delete(client_id):
+            raise HTTPException(status_code=404, detail="Cliente não encontrado")
+        
         return {
             "message": f"Cliente {client_id} deletado com sucesso",
             "deleted_client_id": client_id
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Debug - Erro ao deletar cliente: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
@@ -902,91 +1197,69 @@ async def update_lead_status(lead_id: str, status_update: StatusUpdate):
     print(f"🔄 Debug - Atualizando status do lead {lead_id} para {status_update.status}")
     
     try:
-        # Em um ambiente real, aqui você atualizaria o banco de dados
-        # Por agora, apenas retornamos sucesso
+        updated = leads_repo.update(lead_id, {"status": status_update.status})
+        if updated is None:
+            raise HTTPException(status_code=404, detail="Lead não encontrado")
+        
         return {
             "message": f"Status do lead {lead_id} atualizado para {status_update.status}",
             "lead_id": lead_id,
             "new_status": status_update.status
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Debug - Erro ao atualizar status do lead: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.delete("/api/leads/{lead_id}")
-async def delete_lead(lead_id: int):
+async def delete_lead(lead_id: str):
     """Deleta um lead"""
     print(f"🗑️  Debug - Deletando lead com ID: {lead_id}")
     
     try:
-        # Em um ambiente real, aqui você deletaria do banco de dados
-        # Por agora, apenas retornamos sucesso
+        if not leads_repo.delete(lead_id):
+            raise HTTPException(status_code=404, detail="Lead não encontrado")
+        
         return {
             "message": f"Lead {lead_id} deletado com sucesso",
             "deleted_lead_id": lead_id
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Debug - Erro ao deletar lead: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
-@app.post("/api/leads/finalize-sale", response_model=FinalizeSaleResponse)
-async def finalize_sale(request: FinalizeSaleRequest):
-    """Finaliza venda transferindo lead para cliente e contrato"""
-    print(f"🎯 Debug - Finalizando venda para lead ID: {request.leadId}")
-    
+def contract_value_from_installment(installment: Optional[str]) -> float:
+    """Valor do contrato: 12x a parcela do lead (R$ 450,00 quando ausente ou inválida)"""
     try:
-        # Em um ambiente real, você buscaria o lead no banco de dados
-        # Vamos simular buscando o lead pelos dados mockados
-        leads_mockados = [
-            {
-                "id": "1",
-                "name": "Roberto Almeida",
-                "cpf": "123.456.789-01",
-                "phone": "(11) 98765-4321",
-                "installment": "R$ 450,00",
-                "outstandingBalance": "R$ 12.500,00",
-                "modality": "Portabilidade",
-                "assignedTo": "Ana Rodrigues"
-            }
-        ]
-        
-        # Buscar lead específico (simulação)
-        lead_data = None
-        for lead in leads_mockados:
-            if lead["id"] == request.leadId:
-                lead_data = lead
-                break
-        
-        # Se não encontrou nos mockados, usar dados padrão do request
-        if not lead_data:
-            lead_data = {
-                "id": request.leadId,
-                "name": f"Cliente Lead {request.leadId}",
-                "cpf": "999.888.777-66", 
-                "phone": "(11) 99999-8888",
-                "installment": "R$ 520,00",
-                "outstandingBalance": "R$ 18.500,00",
-                "modality": "Portabilidade",
-                "assignedTo": "Admin AutoCred"
-            }
-        
-        # Extrair valor da parcela para calcular o contrato
-        installment_str = lead_data["installment"].replace("R$", "").replace(".", "").replace(",", ".").strip()
-        try:
-            installment_value = float(installment_str)
-        except:
-            installment_value = 450.0  # Valor padrão
-        
-        contract_value = installment_value * 12  # 12 parcelas
-        
-        # Gerar IDs únicos
-        client_id = str(uuid.uuid4())
-        contract_id = str(uuid.uuid4())
-        
+        installment_value = float(parse_brl(installment) or 0)
+    except ValueError:
+        installment_value = 0.0
+    return (installment_value or 450.0) * 12  # 12 parcelas
+
+def convert_lead(conn: sqlite3.Connection, lead_data: Dict[str, Any],
+                 existing_client: Optional[Dict[str, Any]], now: datetime) -> Dict[str, Any]:
+    """Cria (ou atualiza) o cliente e o contrato do lead e marca o lead como convertido"""
+    contract_value = contract_value_from_installment(lead_data.get("installment"))
+    timestamp = now.isoformat()
+
+    # Gerar IDs únicos
+    client_id = existing_client["id"] if existing_client else str(uuid.uuid4())
+    contract_id = str(uuid.uuid4())
+
+    if existing_client:
+        client = clients_repo.update(client_id, {
+            "contractsCount": (existing_client.get("contractsCount") or 0) + 1,
+            "totalValue": (existing_client.get("totalValue") or 0) + contract_value,
+            "lastActivity": timestamp
+        }, conn=conn)
+    else:
         # Dados do cliente (sem email conforme especificado)
-        client_data = {
+        client = clients_repo.insert({
             "id": client_id,
             "name": lead_data["name"],
             "cpf": lead_data["cpf"],
@@ -994,61 +1267,131 @@ async def finalize_sale(request: FinalizeSaleRequest):
             "status": "ativo",
             "contractsCount": 1,
             "totalValue": contract_value,
-            "lastActivity": datetime.now().isoformat(),
+            "lastActivity": timestamp,
             "notes": f"Cliente convertido do lead. Modalidade: {lead_data['modality']}. Parcela: {lead_data['installment']}",
             "installment": lead_data["installment"],
             "outstandingBalance": lead_data["outstandingBalance"],
             "source": "Lead Convertido",
             "modality": lead_data["modality"],
             "assignedTo": lead_data["assignedTo"],
-            "createdAt": datetime.now().isoformat()
-        }
-        
-        # Dados do contrato
-        contract_data = {
-            "id": contract_id,
-            "clientName": lead_data["name"],
-            "clientId": client_id,
-            "clientCPF": lead_data["cpf"],
-            "clientPhone": lead_data["phone"],
-            "planId": "3",
-            "planName": "Plano Convertido",
-            "modality": lead_data["modality"],
-            "value": contract_value,
-            "status": "active",
-            "startDate": datetime.now().isoformat(),
-            "endDate": (datetime.now().replace(year=datetime.now().year + 1)).isoformat(),
-            "createdBy": lead_data["assignedTo"],
-            "createdAt": datetime.now().isoformat(),
-            "installments": 12
-        }
-        
-        print(f"✅ Debug - Cliente será criado: {client_data['name']} - {client_data['cpf']}")
-        print(f"✅ Debug - Contrato será criado: {contract_data['planName']} - R$ {contract_value:.2f}")
-        
-        # Salvar cliente e contrato nas listas globais (simulação de banco)
-        created_clients.append(client_data)
-        created_contracts.append(contract_data)
-        
-        print(f"💾 Debug - Cliente salvo na lista global. Total: {len(created_clients)}")
-        print(f"💾 Debug - Contrato salvo na lista global. Total: {len(created_contracts)}")
+            "createdAt": timestamp
+        }, conn=conn)
+
+    # Dados do contrato
+    contract = contracts_repo.insert({
+        "id": contract_id,
+        "clientName": lead_data["name"],
+        "clientId": client_id,
+        "clientCPF": lead_data["cpf"],
+        "clientPhone": lead_data["phone"],
+        "planId": "3",
+        "planName": "Plano Convertido",
+        "modality": lead_data["modality"],
+        "value": contract_value,
+        "status": "active",
+        "startDate": timestamp,
+        "endDate": now.replace(year=now.year + 1).isoformat(),
+        "createdBy": lead_data["assignedTo"],
+        "createdAt": timestamp,
+        "installments": 12
+    }, conn=conn)
+
+    leads_repo.update(lead_data["id"], {"status": "Convertido"}, conn=conn)
+    return {"client": client, "contract": contract}
+
+@app.post("/api/leads/finalize-sale", response_model=FinalizeSaleResponse)
+async def finalize_sale(request: FinalizeSaleRequest):
+    """Finaliza venda transferindo lead para cliente e contrato"""
+    print(f"🎯 Debug - Finalizando venda para lead ID: {request.leadId}")
+    
+    try:
+        # Leitura e gravação na mesma transação (BEGIN IMMEDIATE): duas chamadas simultâneas
+        # para o mesmo lead não criam dois contratos nem dois clientes
+        with db_pool.transaction() as conn:
+            # Buscar lead no banco de dados
+            lead_data = leads_repo.get(request.leadId, conn=conn)
+            
+            if not lead_data:
+                raise HTTPException(status_code=404, detail="Lead não encontrado")
+            if lead_data.get("status") == "Convertido":
+                raise HTTPException(status_code=409, detail="Lead já convertido")
+            
+            # Cliente já cadastrado com o mesmo CPF recebe o novo contrato
+            existing_client = clients_repo.find_by("cpf_normalized", normalize_cpf(lead_data["cpf"]), conn=conn)
+            
+            # Salvar cliente, contrato e lead convertido numa única transação
+            converted = convert_lead(conn, lead_data, existing_client, datetime.now())
         
-        # Em um ambiente real, aqui você:
-        # 1. Salvaria o cliente no banco
-        # 2. Salvaria o contrato no banco  
-        # 3. Removeria/atualizaria o lead no banco
+        contract = converted["contract"]
+        print(f"💾 Debug - Cliente e contrato salvos no banco: {contract['planName']} - R$ {contract['value']:.2f}")
         
         return FinalizeSaleResponse(
             success=True,
             message=f"Venda finalizada! Cliente e contrato criados para {lead_data['name']}",
-            clientId=client_id,
-            contractId=contract_id
+            clientId=converted["client"]["id"],
+            contractId=contract["id"]
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Debug - Erro ao finalizar venda: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+@app.post("/api/leads/finalize-sale/batch")
+async def finalize_sale_batch(request: FinalizeSaleBatchRequest):
+    """Finaliza vendas de vários leads numa única transação (fechamento do mês)"""
+    lead_ids = list(dict.fromkeys(request.leadIds))
+    print(f"🎯 Debug - Finalizando vendas em lote: {len(lead_ids)} leads")
+
+    try:
+        now = datetime.now()
+        results = []
+        converted_count = 0
+
+        with db_pool.transaction() as conn:
+            # Uma consulta indexada para todos os leads (IN pela chave primária)
+            leads = leads_repo.get_many(lead_ids, conn=conn)
+
+            # Clientes existentes numa consulta pelo índice de CPF, na mesma transação;
+            # leads do lote com o mesmo CPF viram um só cliente
+            cpf_keys = {lead_id: normalize_cpf(lead["cpf"]) for lead_id, lead in leads.items()}
+            clients = clients_repo.find_many_by("cpf_normalized", cpf_keys.values(), conn=conn)
+
+            for lead_id in lead_ids:
+                lead_data = leads.get(lead_id)
+                if lead_data is None:
+                    results.append({"leadId": lead_id, "success": False, "error": "Lead não encontrado"})
+                    continue
+                if lead_data.get("status") == "Convertido":
+                    results.append({"leadId": lead_id, "success": False, "error": "Lead já convertido"})
+                    continue
+
+                cpf_key = cpf_keys[lead_id]
+                converted = convert_lead(conn, lead_data, clients.get(cpf_key), now)
+                if cpf_key:
+                    clients[cpf_key] = converted["client"]
+                converted_count += 1
+                results.append({
+                    "leadId": lead_id,
+                    "success": True,
+                    "clientId": converted["client"]["id"],
+                    "contractId": converted["contract"]["id"],
+                    "value": converted["contract"]["value"]
+                })
+
+        print(f"💾 Debug - Lote finalizado: {converted_count}/{len(lead_ids)} leads convertidos")
+        return {
+            "success": True,
+            "converted": converted_count,
+            "failed": len(lead_ids) - converted_count,
+            "results": results
+        }
+
+    except Exception as e:
+        print(f"❌ Debug - Erro ao finalizar vendas em lote: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
+
 # ==========================================
 # EVOLUTION API ENDPOINTS - WhatsApp
 # ==========================================
@@ -1067,8 +1410,40 @@ class ConnectionStatus(BaseModel):
     status: str
     agentId: str
 
-# Simulação de dados da Evolution API
-whatsapp_connections = {}
+# Eventos do webhook entregues em tempo real (SSE/WebSocket) por instância
+qr_events = EventHub()
+QR_STREAM_HEARTBEAT = 15  # segundos entre comentários keep-alive do SSE
+QR_STREAM_MAX_SECONDS = 300  # o navegador reconecta se precisar de mais tempo
+
+def agent_instance_name(agent_id: str) -> str:
+    """Nome da instância Evolution do agente (conexão registrada, configuração ou padrão)"""
+    connection = whatsapp_connections.get(agent_id) or {}
+    if connection.get("instanceName"):
+        return connection["instanceName"]
+    agent = created_agents.get(agent_id)
+    return (agent_whatsapp_instance(agent) if agent else None) or f"agent_{agent_id}"
+
+def format_qr_code(qr_code: Any) -> str:
+    """QR Code do webhook (string ou {base64, code}) como data URI de imagem"""
+    if isinstance(qr_code, dict):
+        qr_code = qr_code.get("base64") or qr_code.get("qrcode") or ""
+    qr_code = str(qr_code or "")
+    if qr_code and not qr_code.startswith("data:image"):
+        qr_code = f"data:image/png;base64,{qr_code}"
+    return qr_code
+
+def current_qr_events(instance_name: str) -> List[Dict[str, Any]]:
+    """Estado já conhecido da instância - enviado assim que o navegador assina"""
+    events = []
+    cached = qr_cache.get(instance_name)
+    if cached:
+        events.append({"type": "qrcode", "instance": instance_name, "qrcode": cached["qr_code"],
+                       "timestamp": cached["timestamp"].isoformat()})
+    cached = connection_cache.get(instance_name)
+    if cached:
+        events.append({"type": "connection", "instance": instance_name, "state": cached["status"],
+                       "timestamp": cached["timestamp"].isoformat()})
+    return events
 
 @app.post("/api/evolution/generate-qr", response_model=QRCodeResponse)
 async def generate_qr_code(request: QRCodeRequest):
@@ -1077,7 +1452,7 @@ async def generate_qr_code(request: QRCodeRequest):
         print(f"🔄 Debug - Gerando QR Code REAL para agente: {request.agentId}")
         
         # 1. Verificar se a instância já existe
-        fetch_result = make_evolution_request("GET", "/instance/fetchInstances")
+        fetch_result = await evolution_api.request("GET", "/instance/fetchInstances")
         existing_instance = None
         
         if fetch_result["success"] and fetch_result["data"]:
@@ -1108,7 +1483,7 @@ async def generate_qr_code(request: QRCodeRequest):
             else:
                 # Instância existe mas não está conectada, vamos deletá-la e recriar
                 print(f"🔄 Deletando instância existente para recriar...")
-                delete_result = make_evolution_request("DELETE", f"/instance/delete/{request.instanceName}")
+                delete_result = await evolution_api.request("DELETE", f"/instance/delete/{request.instanceName}")
                 if delete_result["success"]:
                     print(f"✅ Instância antiga deletada")
         
@@ -1120,24 +1495,38 @@ async def generate_qr_code(request: QRCodeRequest):
         }
         
         print(f"📝 Criando nova instância: {request.instanceName}")
-        create_result = make_evolution_request("POST", "/instance/create", instance_data)
+        create_result = await evolution_api.request("POST", "/instance/create", instance_data)
         
         if create_result["success"]:
             print(f"✅ Instância criada com sucesso na Evolution API")
             
             # 4. Tentar conectar a instância
             print(f"🔗 Conectando instância para iniciar processo WhatsApp...")
-            connect_result = make_evolution_request("GET", f"/instance/connect/{request.instanceName}")
+            connect_result = await evolution_api.request("GET", f"/instance/connect/{request.instanceName}")
             
             if connect_result["success"]:
                 print(f"✅ Comando de conexão enviado à Evolution API")
                 
-                # 5. Aguardar e verificar se gerou QR Code
+                # 5. Aguardar o QR Code chegar pelo webhook (sem bloquear o event loop)
                 print(f"⏳ Aguardando QR Code ser gerado...")
-                time.sleep(3)
+                await qr_events.wait_for(request.instanceName, timeout=3)
+                real_qr = qr_cache.get(request.instanceName)
+                if real_qr:
+                    whatsapp_connections[request.agentId] = {
+                        "status": "connecting",
+                        "connected": False,
+                        "instanceName": request.instanceName,
+                        "timestamp": datetime.now().isoformat(),
+                        "evolution_configured": True
+                    }
+                    return QRCodeResponse(
+                        success=True,
+                        qrcode=real_qr["qr_code"],
+                        message="🟢 QR Code real recebido da Evolution API! Escaneie com o WhatsApp."
+                    )
                 
                 # 6. Verificar estado da conexão
-                state_result = make_evolution_request("GET", f"/instance/connectionState/{request.instanceName}")
+                state_result = await evolution_api.request("GET", f"/instance/connectionState/{request.instanceName}")
                 
                 if state_result["success"]:
                     instance_info = state_result["data"]
@@ -1282,7 +1671,7 @@ async def disconnect_whatsapp(agent_id: str):
             print(f"🔄 Desconectando instância real: {instance_name}")
             
             # Tentar deletar a instância na Evolution API
-            delete_result = make_evolution_request("DELETE", f"/instance/delete/{instance_name}")
+            delete_result = await evolution_api.request("DELETE", f"/instance/delete/{instance_name}")
             
             if delete_result["success"]:
                 print(f"✅ Instância {instance_name} removida da Evolution API")
@@ -1316,7 +1705,7 @@ async def list_whatsapp_connections():
         print("📋 Debug - Listando conexões WhatsApp")
         return {
             "success": True,
-            "connections": whatsapp_connections
+            "connections": whatsapp_connections.snapshot()
         }
     except Exception as e:
         print(f"❌ Debug - Erro ao listar conexões: {e}")
@@ -1392,7 +1781,7 @@ async def create_evolution_instance(instance_data: InstanceCreate):
             "events": instance_data.events or ["APPLICATION_STARTUP", "QRCODE_UPDATED", "MESSAGES_UPSERT", "CONNECTION_UPDATE"]
         }
         
-        result = make_evolution_request("POST", "/instance/create", data)
+        result = await evolution_api.request("POST", "/instance/create", data)
         
         if result["success"]:
             return {
@@ -1420,7 +1809,7 @@ async def connect_evolution_instance(instance_name: str):
     try:
         print(f"🔄 Conectando instância: {instance_name}")
         
-        result = make_evolution_request("GET", f"/instance/connect/{instance_name}")
+        result = await evolution_api.request("GET", f"/instance/connect/{instance_name}")
         
         if result["success"]:
             return {
@@ -1449,7 +1838,7 @@ async def get_evolution_instance_status(instance_name: str):
     try:
         print(f"🔍 Verificando status da instância: {instance_name}")
         
-        result = make_evolution_request("GET", f"/instance/connectionState/{instance_name}")
+        result = await evolution_api.request("GET", f"/instance/connectionState/{instance_name}")
         
         if result["success"]:
             return {
@@ -1477,7 +1866,7 @@ async def delete_evolution_instance(instance_name: str):
     try:
         print(f"🗑️ Deletando instância: {instance_name}")
         
-        result = make_evolution_request("DELETE", f"/instance/delete/{instance_name}")
+        result = await evolution_api.request("DELETE", f"/instance/delete/{instance_name}")
         
         if result["success"]:
             return {
@@ -1516,7 +1905,7 @@ async def list_evolution_instances():
             }
         
         # Para produção com Evolution API real
-        result = make_evolution_request("GET", "/instance/fetchInstances")
+        result = await evolution_api.request("GET", "/instance/fetchInstances")
         
         if result["success"]:
             return {
@@ -1545,13 +1934,13 @@ async def send_whatsapp_message(message_data: MessageSend):
         print(f"📤 Enviando mensagem via {message_data.instanceName}")
         
         data = {
-            "number": message_data.remoteJid,
+            "number": to_whatsapp_jid(message_data.remoteJid) or message_data.remoteJid,
             "textMessage": {
                 "text": message_data.message
             }
         }
         
-        result = make_evolution_request("POST", f"/message/sendText/{message_data.instanceName}", data)
+        result = await evolution_api.request("POST", f"/message/sendText/{message_data.instanceName}", data)
         
         if result["success"]:
             return {
@@ -1585,7 +1974,7 @@ async def set_evolution_webhook(instance_name: str, webhook_data: WebhookData):
             "events": webhook_data.events
         }
         
-        result = make_evolution_request("POST", f"/webhook/set/{instance_name}", data)
+        result = await evolution_api.request("POST", f"/webhook/set/{instance_name}", data)
         
         if result["success"]:
             return {
@@ -1623,18 +2012,23 @@ class SMSCampaign(BaseModel):
     contacts: List[SMSContact]
     scheduled_date: Optional[str] = None
     scheduled_time: Optional[str] = None
-    status: str = "draft"  # draft, sending, sent, failed
+    status: str = "draft"  # draft, scheduled, sending, sent, partial, failed
     created_at: str
     sent_count: int = 0
     total_count: int = 0
     campaign_id: Optional[str] = None  # ID retornado pela API
+    send_window: Optional[Dict[str, str]] = None  # mesmo formato do business_hours dos agentes
+    send_rate: Optional[int] = None  # contatos por minuto
 
 class SMSBulkRequest(BaseModel):
     name: str
     message: str
-    contacts: List[SMSContact]
+    contacts: List[SMSContact] = []
+    contact_list_id: Optional[str] = None  # lista importada por /api/sms/upload-contacts
     scheduled_date: Optional[str] = None
     scheduled_time: Optional[str] = None
+    send_window: Optional[Dict[str, str]] = None  # {"monday": "09:00-18:00", ...}
+    send_rate: Optional[int] = None  # contatos por minuto
 
 class SMSStatus(BaseModel):
     campaign_id: str
@@ -1695,9 +2089,41 @@ class ChatResponse(BaseModel):
     session_id: str
     agent_id: str
     timestamp: str
-
-# Global storage for agents
-created_agents = []
+    turn: int = 1  # número da mensagem do cliente na sessão
+    intent: Optional[str] = None  # intenção reconhecida na mensagem
+
+def agent_whatsapp_instance(agent: Dict[str, Any]) -> Optional[str]:
+    return (agent.get("configuration") or {}).get("whatsapp_instance")
+
+# Global storage for agents (carregado do banco): agente por id em O(1), índices por
+# instância WhatsApp (roteamento do webhook) e por id no Superagentes
+created_agents = Registry(agents_repo, indexes={
+    "whatsapp_instance": agent_whatsapp_instance,
+    "superagentes_id": lambda agent: agent.get("superagentes_id")
+})
+created_agents.load()
+
+def agent_for_instance(instance_name: str) -> Optional[Dict[str, Any]]:
+    """Agente dono da instância Evolution (configurada ou o nome padrão agent_<id>)"""
+    agent = created_agents.find_one("whatsapp_instance", instance_name)
+    if agent is None and instance_name.startswith("agent_"):
+        agent = created_agents.get(instance_name[len("agent_"):])
+    return agent
+
+# Histórico das conversas com os agentes: últimos turnos por sessão, memória limitada,
+# sessões frias gravadas no SQLite
+chat_sessions = ChatSessionStore(chat_sessions_repo)
+
+def store_agent_performance(stats_by_agent: Dict[str, Dict[str, Any]]):
+    """Copia os totais das estatísticas para o performance_stats dos agentes"""
+    for agent_id, stats in stats_by_agent.items():
+        agent = created_agents.get(agent_id)
+        if agent is not None:
+            created_agents.update(agent_id, {"performance_stats": {**(agent.get("performance_stats") or {}), **stats}})
+
+# Estatísticas dos agentes: contadores em buckets de minuto/hora/dia, gravados periodicamente
+agent_metrics = AgentMetricsStore(agent_metrics_repo, on_save=store_agent_performance)
+agent_metrics.load()
 agent_personalities = [
     {
         "id": "vendas_consultivo",
@@ -1705,7 +2131,11 @@ agent_personalities = [
         "description": "Especialista em vendas consultivas e relacionamento com clientes de crédito",
         "tone": "consultivo",
         "expertise": ["vendas", "crédito", "negociação", "relacionamento"],
-        "use_cases": ["qualificação de leads", "apresentação de produtos", "fechamento de vendas"]
+        "use_cases": ["qualificação de leads", "apresentação de produtos", "fechamento de vendas"],
+        "intents": [
+            {"id": "simulacao", "keywords": ["simul*", "parcela*", "taxa*", "juros", "quanto fica"],
+             "response": "Posso fazer uma simulação para você! Me informe o valor desejado e em quantas parcelas gostaria de pagar."}
+        ]
     },
     {
         "id": "suporte_especializado",
@@ -1713,7 +2143,11 @@ agent_personalities = [
         "description": "Atendimento especializado em produtos financeiros e resolução de problemas",
         "tone": "profissional",
         "expertise": ["suporte técnico", "produtos financeiros", "resolução de problemas"],
-        "use_cases": ["dúvidas sobre contratos", "problemas técnicos", "orientações"]
+        "use_cases": ["dúvidas sobre contratos", "problemas técnicos", "orientações"],
+        "intents": [
+            {"id": "contrato", "keywords": ["contrato*", "boleto*", "segunda via", "extrato*", "quitar", "quitação"],
+             "response": "Vou verificar isso para você. Pode me informar o número do contrato ou o seu CPF?"}
+        ]
     },
     {
         "id": "relacionamento_humanizado",
@@ -1721,7 +2155,11 @@ agent_personalities = [
         "description": "Foco em criar relacionamentos próximos e humanizados com os clientes",
         "tone": "empático",
         "expertise": ["relacionamento", "retenção", "fidelização"],
-        "use_cases": ["pós-venda", "retenção", "relacionamento contínuo"]
+        "use_cases": ["pós-venda", "retenção", "relacionamento contínuo"],
+        "intents": [
+            {"id": "insatisfacao", "keywords": ["cancel*", "desistir", "reclama*", "insatisfeit*"],
+             "response": "Sinto muito por isso! Quero entender o que aconteceu e encontrar a melhor solução para você. Pode me contar mais?"}
+        ]
     },
     {
         "id": "prospeccao_ativa",
@@ -1729,7 +2167,11 @@ agent_personalities = [
         "description": "Especialista em prospecção ativa e geração de leads qualificados",
         "tone": "dinâmico",
         "expertise": ["prospecção", "qualificação", "cold calling"],
-        "use_cases": ["prospecção ativa", "qualificação de leads", "abordagem inicial"]
+        "use_cases": ["prospecção ativa", "qualificação de leads", "abordagem inicial"],
+        "intents": [
+            {"id": "interesse", "keywords": ["interess*", "quero saber", "como funciona"],
+             "response": "Que bom que se interessou! Posso te explicar rapidinho como funciona e ver a melhor condição para o seu perfil."}
+        ]
     }
 ]
 
@@ -1756,6 +2198,10 @@ SCRIPT INICIAL:
 "Olá! Sou a Carla da AutoCred, especialista em crédito consignado. Vi que você tem interesse em saber mais sobre nossas condições especiais. Como posso ajudá-lo hoje?"
 
 Seja sempre transparente sobre taxas e condições.""",
+        "intents": [
+            {"id": "consignado", "keywords": ["consignado", "inss", "aposentad*", "pension*", "margem", "servidor*"],
+             "response": "No consignado as parcelas são descontadas direto do benefício, com as menores taxas do mercado. Você é aposentado, pensionista ou servidor?"}
+        ],
         "configuration": {
             "max_credit_amount": 500000,
             "interest_rate_range": "1.2% a 2.1% ao mês",
@@ -1790,6 +2236,10 @@ SCRIPT INICIAL:
 "Oi! Sou o Rafael da AutoCred. Temos cartões de crédito com condições especiais e sem complicação. Qual seria seu interesse principal?"
 
 Foque sempre na necessidade real do cliente.""",
+        "intents": [
+            {"id": "cartao", "keywords": ["cartão", "cartões", "cartão de crédito", "anuidade", "limite", "negativad*"],
+             "response": "Temos cartões sem anuidade no primeiro ano e opção pré-paga para negativados. Qual é o seu principal interesse no cartão?"}
+        ],
         "configuration": {
             "card_types": ["gold", "platinum", "prepaid"],
             "min_income": 1500,
@@ -1896,6 +2346,10 @@ SCRIPT INICIAL:
 "Olá! Sou a Patricia da AutoCred, especialista em portabilidade. Você sabia que pode reduzir até 50% dos juros do seu contrato atual? Posso fazer uma análise gratuita?"
 
 Sempre demonstre economia concreta com números.""",
+        "intents": [
+            {"id": "portabilidade", "keywords": ["portabilidade", "transferir", "outro banco", "reduzir parcela*"],
+             "response": "Com a portabilidade você traz seu contrato para a AutoCred e pode reduzir a taxa ou a parcela. Em qual banco está o seu contrato hoje?"}
+        ],
         "configuration": {
             "max_discount_rate": 50,
             "processing_time": "24h",
@@ -1905,8 +2359,37 @@ Sempre demonstre economia concreta com números.""",
     }
 ]
 
-# SMS Global Storage
-sms_campaigns = []
+# Intenções comuns a todos os agentes (depois das específicas da personalidade/template)
+# Intenções com "conversion": True contam como conversão (uma por conversa) nas estatísticas
+AGENT_BASE_INTENTS = [
+    {"id": "contratacao", "keywords": ["contratar", "quero fechar", "vamos fechar", "pode fechar", "aceito a proposta"],
+     "response": "Perfeito! Vou registrar a sua solicitação e te enviar os próximos passos para a contratação.",
+     "conversion": True},
+    {"id": "credito", "keywords": ["crédito", "empresti*", "financiamento"],
+     "response": "Ótimo! Posso ajudá-lo com informações sobre nossos produtos de crédito. Qual seria sua necessidade específica?"},
+    {"id": "ajuda", "keywords": ["ajud*", "dúvida*", "socorro"],
+     "response": "Claro! Estou aqui para ajudar. Pode me contar mais sobre o que precisa?"},
+]
+
+personalities_by_id = {personality["id"]: personality for personality in agent_personalities}
+templates_by_id = {template["id"]: template for template in agent_templates}
+
+def agent_intent_matcher(agent: Dict[str, Any]):
+    """Matcher compilado (uma vez por personalidade + template) com as intenções do agente"""
+    personality = personalities_by_id.get(agent["personality_id"], agent_personalities[0])
+    template_id = (agent.get("configuration") or {}).get("template_id")
+    template = templates_by_id.get(template_id) or {}
+    return compile_intents(
+        (personality["id"], template_id),
+        template.get("intents"), personality.get("intents"), AGENT_BASE_INTENTS
+    )
+
+# SMS Global Storage (carregado do banco): campanha por id em O(1), índice por status
+sms_campaigns = Registry(campaigns_repo, factory=lambda record: SMSCampaign(**record), indexes=("status",))
+sms_campaigns.load()
+sms_dispatcher = SMSDispatcher(SMS_API_BASE_URL, SMS_TOKEN, SMS_TIPO, dispatch_chunks_repo)
+sms_scheduler = CampaignScheduler(dispatch_chunks_repo)
+sms_status_poller = SMSStatusPoller(SMS_API_BASE_URL, SMS_TOKEN)
 
 # =============================================================================
 # AI AGENTS ENDPOINTS
@@ -1917,7 +2400,7 @@ async def list_custom_agents():
     """Lista todos os agentes personalizados criados"""
     try:
         print(f"📋 Debug - Listando {len(created_agents)} agentes criados")
-        return {"agents": created_agents, "total": len(created_agents)}
+        return {"agents": created_agents.values(), "total": len(created_agents)}
     except Exception as e:
         print(f"❌ Error listing agents: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1960,7 +2443,7 @@ async def create_whatsapp_instance_for_agent(agent_id: str, instance_name: str):
         }
         
         # Tentar criar na Evolution API
-        result = make_evolution_request("POST", "/instance/create", instance_data)
+        result = await evolution_api.request("POST", "/instance/create", instance_data)
         
         if result.get("success"):
             print(f"✅ Instância WhatsApp {instance_name} criada para agente {agent_id}")
@@ -1980,7 +2463,11 @@ async def create_custom_agent(agent_data: CreateAgentRequest):
         print(f"🤖 Debug - Criando agente: {agent_data.name}")
         
         agent_id = str(uuid.uuid4())
-        instance_name = f"autocred_agent_{len(created_agents) + 1}"
+        # Depois de exclusões a contagem repete números: pula os nomes ainda em uso
+        number = len(created_agents) + 1
+        while created_agents.find_one("whatsapp_instance", f"autocred_agent_{number}"):
+            number += 1
+        instance_name = f"autocred_agent_{number}"
         
         # Simular integração com Superagentes (desenvolvimento)
         superagentes_id = f"sa_{agent_id[:8]}"
@@ -2003,8 +2490,8 @@ async def create_custom_agent(agent_data: CreateAgentRequest):
             }
         )
         
-        # Adicionar à lista de agentes criados
-        created_agents.append(new_agent.dict())
+        # Registrar o agente (banco + índices)
+        created_agents.add(new_agent.dict())
         print(f"✅ Debug - Agente criado: {new_agent.name}")
         
         # Tentar criar instância WhatsApp automaticamente
@@ -2031,7 +2518,7 @@ async def create_agent_from_template(template_id: str, agent_name: str = Form(..
     """Cria um agente baseado em um template"""
     try:
         # Encontrar template
-        template = next((t for t in agent_templates if t["id"] == template_id), None)
+        template = templates_by_id.get(template_id)
         if not template:
             raise HTTPException(status_code=404, detail="Template não encontrado")
         
@@ -2050,10 +2537,10 @@ async def create_agent_from_template(template_id: str, agent_name: str = Form(..
             status="ativo",
             created_at=datetime.now().isoformat(),
             created_by="admin@autocred.com",
-            configuration=template["configuration"]
+            configuration={**template["configuration"], "template_id": template_id}
         )
         
-        created_agents.append(new_agent.dict())
+        created_agents.add(new_agent.dict())
         print(f"✅ Debug - Agente criado do template: {agent_name}")
         
         return {
@@ -2069,11 +2556,13 @@ async def create_agent_from_template(template_id: str, agent_name: str = Form(..
 async def get_agent_details(agent_id: str):
     """Obtém detalhes de um agente específico"""
     try:
-        agent = next((a for a in created_agents if a["id"] == agent_id), None)
+        agent = created_agents.get(agent_id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agente não encontrado")
         
         return {"agent": agent}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -2081,23 +2570,22 @@ async def get_agent_details(agent_id: str):
 async def update_agent(agent_id: str, updates: dict):
     """Atualiza um agente existente"""
     try:
-        agent_index = next((i for i, a in enumerate(created_agents) if a["id"] == agent_id), None)
-        if agent_index is None:
+        if agent_id not in created_agents:
             raise HTTPException(status_code=404, detail="Agente não encontrado")
         
-        # Atualizar campos permitidos
+        # Atualizar campos permitidos (banco e índices - a instância WhatsApp pode mudar)
         allowed_fields = ["name", "description", "custom_prompt", "status", "configuration"]
-        for field in allowed_fields:
-            if field in updates:
-                created_agents[agent_index][field] = updates[field]
+        agent = created_agents.update(agent_id, {field: updates[field] for field in allowed_fields if field in updates})
         
         print(f"🔄 Debug - Agente {agent_id} atualizado")
         
         return {
             "success": True,
-            "agent": created_agents[agent_index],
+            "agent": agent,
             "message": "Agente atualizado com sucesso"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error updating agent: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -2106,75 +2594,127 @@ async def update_agent(agent_id: str, updates: dict):
 async def delete_agent(agent_id: str):
     """Deleta um agente"""
     try:
-        agent_index = next((i for i, a in enumerate(created_agents) if a["id"] == agent_id), None)
-        if agent_index is None:
+        deleted_agent = created_agents.remove(agent_id)
+        if deleted_agent is None:
             raise HTTPException(status_code=404, detail="Agente não encontrado")
         
-        deleted_agent = created_agents.pop(agent_index)
+        agent_metrics.forget(agent_id)
         print(f"🗑️ Debug - Agente {deleted_agent['name']} deletado")
         
         return {
             "success": True,
             "message": f"Agente '{deleted_agent['name']}' deletado com sucesso"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error deleting agent: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def agent_reply(agent: Dict[str, Any], session_id: str, message: str) -> Dict[str, Any]:
+    """Gera a resposta do agente e grava os dois turnos na sessão (chat da API e WhatsApp)"""
+    session = chat_sessions.get_or_create(agent["id"], session_id)
+    
+    # Resposta simulada baseada na personalidade: intenção classificada numa passada
+    intent = agent_intent_matcher(agent).classify(message)
+    
+    def respond(first_turn: bool):
+        # Apresentação só no início da conversa; depois o agente segue o contexto
+        if intent is not None:
+            response_text = intent["response"]
+        elif first_turn:
+            response_text = f"Olá! Sou o {agent['name']}, {agent['description']}. Como posso ajudá-lo hoje?"
+        else:
+            response_text = "Entendi! Pode me contar mais detalhes para eu ajudar da melhor forma?"
+        return response_text, {"intent": intent["id"] if intent else None,
+                               "conversion": bool(intent and intent.get("conversion"))}
+    
+    # Primeiro turno e conversão nova decididos junto com a gravação (sob o lock da sessão)
+    turns = chat_sessions.exchange(session, message, respond)
+    return {
+        "text": turns["turn"]["text"],
+        "intent": intent,
+        "turn_count": turns["turn_count"],
+        "first_turn": turns["first_turn"],
+        "new_conversion": turns["new_conversion"]
+    }
+
 @app.post("/api/agents/{agent_id}/chat")
 async def chat_with_agent(agent_id: str, chat_data: ChatRequest):
     """Conversa com um agente específico"""
     try:
-        agent = next((a for a in created_agents if a["id"] == agent_id), None)
+        agent = created_agents.get(agent_id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agente não encontrado")
         
         print(f"💬 Debug - Chat com agente {agent['name']}: {chat_data.message}")
+        started = time.perf_counter()
         
         # Simular resposta do agente (em produção, integraria com Superagentes)
         session_id = chat_data.session_id or str(uuid.uuid4())
+        reply = await asyncio.to_thread(agent_reply, agent, session_id, chat_data.message)
+        intent = reply["intent"]
         
-        # Resposta simulada baseada na personalidade
-        personality = next((p for p in agent_personalities if p["id"] == agent["personality_id"]), agent_personalities[0])
-        
-        response_text = f"Olá! Sou o {agent['name']}, {agent['description']}. Como posso ajudá-lo hoje?"
-        if "crédito" in chat_data.message.lower():
-            response_text = "Ótimo! Posso ajudá-lo com informações sobre nossos produtos de crédito. Qual seria sua necessidade específica?"
-        elif "ajuda" in chat_data.message.lower():
-            response_text = "Claro! Estou aqui para ajudar. Pode me contar mais sobre o que precisa?"
+        if reply["first_turn"]:
+            agent_metrics.record_conversation(agent_id)
+        agent_metrics.record_message(agent_id)
+        if reply["new_conversion"]:
+            agent_metrics.record_conversion(agent_id)
+        agent_metrics.record_response(agent_id, time.perf_counter() - started)
         
         response = ChatResponse(
-            response=response_text,
+            response=reply["text"],
             session_id=session_id,
             agent_id=agent_id,
-            timestamp=datetime.now().isoformat()
+            timestamp=datetime.now().isoformat(),
+            turn=(reply["turn_count"] + 1) // 2,
+            intent=intent["id"] if intent else None
         )
         
         return response.dict()
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error in agent chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/agents/{agent_id}/chat/{session_id}")
+async def get_chat_history(agent_id: str, session_id: str):
+    """Últimos turnos de uma sessão de chat (memória ou SQLite)"""
+    turns = chat_sessions.history(agent_id, session_id)
+    if turns is None:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    return {"session_id": session_id, "agent_id": agent_id, "turns": turns, "total": len(turns)}
+
 @app.get("/api/agents/{agent_id}/stats")
 async def get_agent_stats(agent_id: str):
     """Obtém estatísticas de performance de um agente"""
     try:
-        agent = next((a for a in created_agents if a["id"] == agent_id), None)
+        agent = created_agents.get(agent_id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agente não encontrado")
         
-        # Simular estatísticas
+        # Contadores em buckets: cada janela soma no máximo os buckets dela
+        summary = agent_metrics.summary(agent_id)
+        total = summary["total"]
         stats = {
-            "total_conversations": 15,
-            "successful_conversions": 8,
-            "average_response_time": 1.2,
-            "satisfaction_score": 4.5,
-            "last_activity": datetime.now().isoformat(),
-            "conversations_this_week": 12,
-            "conversion_rate": 53.3
+            "total_conversations": total["conversations"],
+            "successful_conversions": total["conversions"],
+            "average_response_time": total["average_response_time"],
+            "satisfaction_score": (agent.get("performance_stats") or {}).get("satisfaction_score", 0),
+            "last_activity": summary["last_activity"],
+            "conversations_this_week": summary["last_7_days"]["conversations"],
+            "conversion_rate": total["conversion_rate"],
+            "total_messages": total["messages"],
+            "last_hour": summary["last_hour"],
+            "last_24h": summary["last_24h"],
+            "last_7_days": summary["last_7_days"],
+            "response_time_histogram": summary["response_time_histogram"]
         }
         
         return {"statistics": stats}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -2213,12 +2753,14 @@ async def get_sms_balance():
 async def send_single_sms(phone: str, message: str):
     """Envia SMS único"""
     try:
-        # Remove caracteres especiais do telefone
-        clean_phone = ''.join(filter(str.isdigit, phone))
-        
-        # Remove código do país se presente
-        if clean_phone.startswith('55'):
-            clean_phone = clean_phone[2:]
+        # DDD + número, sem o código do país
+        parsed = parse_phone(phone)
+        if not parsed.valid:
+            return {
+                "success": False,
+                "error": f"Telefone inválido: {parsed.error}"
+            }
+        clean_phone = parsed.national
         
         params = {
             "action": "sendsms",
@@ -2248,39 +2790,134 @@ async def send_single_sms(phone: str, message: str):
             "error": f"Erro no envio: {str(e)}"
         }
 
+# Importação de contatos: lidos em streaming e gravados em lotes no armazenamento da campanha
+SMS_CONTACT_BATCH_SIZE = 1000
+SMS_UPLOAD_INLINE_LIMIT = 1000  # até aqui a resposta do upload traz os contatos (tela de campanha)
+# Listas enviadas por upload e não usadas numa campanha são apagadas depois desse prazo
+SMS_CONTACT_LIST_TTL_HOURS = float(os.getenv("SMS_CONTACT_LIST_TTL_HOURS", "24"))
+SMS_CONTACT_NAME_COLUMNS = ("nome", "name", "cliente", "nome completo")
+SMS_CONTACT_PHONE_COLUMNS = ("telefone", "phone", "celular", "whatsapp", "fone")
+
+def normalize_contacts(contacts: List[Dict[str, Any]]) -> tuple:
+    """Normaliza os telefones de um lote de contatos de uma vez - retorna (válidos, rejeitados)"""
+    phones = normalize_many(contact["phone"] for contact in contacts)
+    valid = []
+    for contact, national, ok in zip(contacts, phones.national, phones.valid):
+        if ok:
+            contact["phone"] = national
+            valid.append(contact)
+    return valid, len(contacts) - len(valid)
+
+def import_campaign_contacts(list_id: str, rows, batch_size: int = SMS_CONTACT_BATCH_SIZE,
+                             keep: int = SMS_UPLOAD_INLINE_LIMIT) -> Dict[str, Any]:
+    """Valida e grava as linhas em lotes - memória limitada ao lote e à prévia (`keep` contatos)"""
+    imported = 0
+    rejected = 0
+    preview: List[Dict[str, Any]] = []
+    batch: List[Dict[str, Any]] = []
+    
+    def flush():
+        nonlocal imported, rejected
+        valid, invalid = normalize_contacts(batch)
+        rejected += invalid
+        if len(preview) < keep:
+            preview.extend(valid[:keep - len(preview)])
+        imported += campaign_contacts_repo.append(list_id, valid)
+        batch.clear()
+    
+    for row in rows:
+        batch.append({
+            "name": next((row[c] for c in SMS_CONTACT_NAME_COLUMNS if row.get(c)), 'Sem nome'),
+            "phone": next((row[c] for c in SMS_CONTACT_PHONE_COLUMNS if row.get(c)), ''),
+            "customFields": row
+        })
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    
+    return {"imported": imported, "rejected": rejected, "preview": preview}
+
 @app.post("/api/sms/create-campaign")
 async def create_sms_campaign(campaign_data: SMSBulkRequest):
-    """Cria nova campanha SMS"""
+    """Cria nova campanha SMS (com os contatos enviados ou com uma lista importada por upload)"""
     try:
         campaign_id = f"sms_{uuid.uuid4().hex[:8]}"
         
-        # Preparar números de telefone
-        phone_numbers = []
-        for contact in campaign_data.contacts:
-            clean_phone = ''.join(filter(str.isdigit, contact.phone))
-            if clean_phone.startswith('55'):
-                clean_phone = clean_phone[2:]
-            phone_numbers.append(clean_phone)
+        # Agendamento e janela validados antes de gravar os contatos
+        try:
+            parse_start(campaign_data.scheduled_date, campaign_data.scheduled_time)
+            SendWindow(campaign_data.send_window)
+        except ValueError as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        
+        rejected = 0
+        if campaign_data.contact_list_id:
+            # Só listas de upload: o id de outra campanha levaria os contatos dela
+            if (not campaign_data.contact_list_id.startswith(CONTACT_LIST_PREFIX)
+                    or campaign_data.contact_list_id in sms_campaigns):
+                return {
+                    "success": False,
+                    "error": "Lista de contatos inválida"
+                }
+            total_count = campaign_contacts_repo.adopt(campaign_data.contact_list_id, campaign_id)
+            if not total_count:
+                return {
+                    "success": False,
+                    "error": "Lista de contatos não encontrada"
+                }
+        else:
+            # Preparar números de telefone
+            # Colunas com o mesmo nome normalizado do upload: os campos do template casam nos dois caminhos
+            stored, rejected = normalize_contacts([
+                {
+                    "name": contact.name,
+                    "phone": contact.phone,
+                    "customFields": {normalize_header(k): v for k, v in (contact.custom_fields or {}).items()}
+                }
+                for contact in campaign_data.contacts
+            ])
+            if not stored:
+                return {
+                    "success": False,
+                    "error": "Nenhum telefone válido na lista de contatos"
+                }
+            total_count = campaign_contacts_repo.append(campaign_id, stored)
         
         campaign = SMSCampaign(
             id=campaign_id,
             name=campaign_data.name,
             message=campaign_data.message,
-            contacts=campaign_data.contacts,
+            contacts=[],  # lista só em sms_campaign_contacts (não duplicada no JSON/memória)
             scheduled_date=campaign_data.scheduled_date,
             scheduled_time=campaign_data.scheduled_time,
             status="draft",
             created_at=datetime.now().isoformat(),
-            total_count=len(campaign_data.contacts)
+            total_count=total_count,
+            send_window=campaign_data.send_window,
+            send_rate=campaign_data.send_rate
         )
         
-        sms_campaigns.append(campaign)
+        sms_campaigns.add(campaign)
+        
+        # Campos do template ({nome}, {parcela}...) que a lista não tem saem com o valor padrão
+        template = compile_template(campaign.message)
+        missing_fields = []
+        if template.personalized:
+            sample = campaign_contacts_repo.contacts(campaign_id, 0, 1)
+            missing_fields = template.missing_fields(list(sample[0]["customFields"] or {}) if sample else [])
         
         return {
             "success": True,
             "campaign_id": campaign_id,
             "message": "Campanha criada com sucesso",
-            "total_contacts": len(campaign_data.contacts)
+            "total_contacts": total_count,
+            "total_rejected": rejected,
+            "template_fields": template.field_names,
+            "missing_fields": missing_fields
         }
     except Exception as e:
         return {
@@ -2288,78 +2925,182 @@ async def create_sms_campaign(campaign_data: SMSBulkRequest):
             "error": f"Erro ao criar campanha: {str(e)}"
         }
 
+def campaign_contact_count(campaign: SMSCampaign) -> int:
+    """Contatos no armazenamento da campanha (campanhas antigas: copiados do JSON na primeira vez)"""
+    total = campaign_contacts_repo.count_for(campaign.id)
+    if not total and campaign.contacts:
+        stored, _ = normalize_contacts([
+            {"name": contact.name, "phone": contact.phone, "customFields": contact.custom_fields}
+            for contact in campaign.contacts
+        ])
+        total = campaign_contacts_repo.append(campaign.id, stored)
+        sms_campaigns.update(campaign.id, {"contacts": []})
+    return total
+
+def campaign_is_scheduled(campaign: SMSCampaign) -> bool:
+    """Campanhas com data, janela ou ritmo de envio passam pelo agendador local"""
+    return bool(campaign.scheduled_date or campaign.send_window or campaign.send_rate or SMS_SEND_RATE)
+
+def start_campaign_dispatch(campaign: SMSCampaign) -> bool:
+    """Inicia (ou retoma) o disparo em lotes da campanha em segundo plano"""
+    total = campaign_contact_count(campaign)
+    
+    async def finish(progress: Dict[str, Any]):
+        if progress["complete"]:
+            status = "sent"
+        else:
+            status = "partial" if progress["sent_count"] else "failed"
+        first_chunk = next((chunk for chunk in dispatch_chunks_repo.for_campaign(campaign.id) if chunk["providerId"]), None)
+        sms_campaigns.update(campaign.id, {
+            "status": status,
+            "sent_count": progress["sent_count"],
+            "campaign_id": first_chunk["providerId"] if first_chunk else campaign.campaign_id
+        })
+        if campaign.campaign_id:
+            sms_status_poller.watch(campaign.id, campaign.campaign_id, final=True)
+        print(f"📨 Campanha {campaign.id}: {progress['sent_chunks']}/{progress['chunks']} lotes enviados ({campaign.status})")
+    
+    # Mensagem personalizada: o template é compilado uma vez e cada lote renderiza só os seus contatos
+    template = compile_template(campaign.message)
+    if template.personalized:
+        def load_chunk(start: int, end: int):
+            return ((contact["phone"], template.render(contact))
+                    for contact in campaign_contacts_repo.contacts(campaign.id, start, end))
+    else:
+        def load_chunk(start: int, end: int):
+            return campaign_contacts_repo.phones(campaign.id, start, end)
+    
+    if not campaign_is_scheduled(campaign):
+        started = sms_dispatcher.start(campaign.id, total, load_chunk, campaign.message, on_done=finish)
+        if started:
+            sms_campaigns.update(campaign.id, {"status": "sending"})
+        return started
+    
+    # Agendada: os lotes são liberados pelo agendador (no lugar do jobdate/jobtime do provedor)
+    if sms_scheduler.is_scheduled(campaign.id):
+        return False
+    sms_dispatcher.plan(campaign.id, total)
+    
+    async def release(chunks: List[Dict[str, Any]]):
+        sms_campaigns.update(campaign.id, {"status": "sending"})
+        await sms_dispatcher.send_chunks(campaign.id, chunks, load_chunk, campaign.message)
+        # Envio espalhado por horas/dias: o status no provedor é acompanhado desde o primeiro lote
+        if not campaign.campaign_id:
+            first_chunk = next((chunk for chunk in dispatch_chunks_repo.for_campaign(campaign.id) if chunk["providerId"]), None)
+            if first_chunk:
+                sms_campaigns.update(campaign.id, {"campaign_id": first_chunk["providerId"]})
+                sms_status_poller.watch(campaign.id, campaign.campaign_id)
+    
+    async def done():
+        await finish(sms_dispatcher.progress(campaign.id))
+    
+    scheduled = sms_scheduler.schedule(
+        campaign.id, SendWindow(campaign.send_window),
+        parse_start(campaign.scheduled_date, campaign.scheduled_time),
+        campaign.send_rate or SMS_SEND_RATE, release, on_done=done
+    )
+    if not scheduled:
+        # Nada pendente: só atualiza o status final
+        asyncio.get_running_loop().create_task(done())
+        return False
+    sms_campaigns.update(campaign.id, {"status": "scheduled"})
+    return True
+
+def purge_contact_lists() -> int:
+    """Apaga as listas de upload que nenhuma campanha adotou dentro do prazo"""
+    deleted = campaign_contacts_repo.purge_lists_before(
+        (datetime.now() - timedelta(hours=SMS_CONTACT_LIST_TTL_HOURS)).isoformat()
+    )
+    if deleted:
+        print(f"🧹 {deleted} contatos de listas não usadas removidos")
+    return deleted
+
+@app.on_event("startup")
+async def purge_contact_lists_on_startup():
+    await asyncio.to_thread(purge_contact_lists)
+
+@app.on_event("startup")
+async def resume_sms_dispatches():
+    """Retoma os disparos e agendamentos interrompidos por queda ou restart"""
+    for campaign in sms_campaigns.find("status", "sending") + sms_campaigns.find("status", "scheduled"):
+        if sms_dispatcher.progress(campaign.id)["complete"]:
+            # Campanhas agendadas no provedor (jobdate) antes do agendador local
+            if campaign.campaign_id:
+                sms_status_poller.watch(campaign.id, campaign.campaign_id, final=True)
+            continue
+        print(f"🔁 Retomando disparo da campanha {campaign.id}")
+        start_campaign_dispatch(campaign)
+
+@app.on_event("shutdown")
+async def stop_sms_dispatcher():
+    # Lotes interrompidos ficam "sending" e são reenviados na retomada
+    await sms_scheduler.close()
+    await sms_dispatcher.close()
+    await sms_status_poller.close()
+
+@app.on_event("shutdown")
+async def save_chat_sessions():
+    # Sessões ativas vão para o SQLite e continuam depois do restart
+    saved = await asyncio.to_thread(chat_sessions.close)
+    print(f"💬 {saved} sessões de chat gravadas")
+
 @app.post("/api/sms/send-campaign/{campaign_id}")
 async def send_sms_campaign(campaign_id: str):
-    """Envia campanha SMS"""
+    """Envia campanha SMS em lotes (em segundo plano) - reenviar retoma os lotes que falharam"""
     try:
-        if campaign_id not in sms_campaigns:
+        campaign = sms_campaigns.get(campaign_id)
+        if campaign is None:
             return {
                 "success": False,
                 "error": "Campanha não encontrada"
             }
         
-        campaign = sms_campaigns[campaign_id]
-        
-        # Preparar números de telefone
-        phone_numbers = []
-        for contact in campaign.contacts:
-            clean_phone = ''.join(filter(str.isdigit, contact.phone))
-            if clean_phone.startswith('55'):
-                clean_phone = clean_phone[2:]
-            phone_numbers.append(clean_phone)
-        
-        numbers_str = ",".join(phone_numbers)
-        
-        params = {
-            "action": "sendsms",
-            "token": SMS_TOKEN,
-            "tipo": SMS_TIPO,
-            "msg": campaign.message,
-            "numbers": numbers_str
-        }
-        
-        # Adicionar agendamento se especificado
-        if campaign.scheduled_date:
-            params["jobdate"] = campaign.scheduled_date
-        if campaign.scheduled_time:
-            params["jobtime"] = campaign.scheduled_time
-        
-        response = requests.get(SMS_API_BASE_URL, params=params, timeout=30)
-        
-        if response.status_code == 200:
-            # Atualizar status da campanha
-            campaign.status = "sent" if not campaign.scheduled_date else "scheduled"
-            campaign.sent_count = len(campaign.contacts)
-            campaign.campaign_id = response.text  # ID retornado pela API
-            
+        if sms_dispatcher.is_running(campaign_id) or sms_scheduler.is_scheduled(campaign_id):
             return {
                 "success": True,
                 "campaign_id": campaign_id,
-                "sent_count": campaign.sent_count,
-                "api_response": response.text,
-                "message": "Campanha enviada com sucesso"
-            }
-        else:
-            campaign.status = "failed"
-            return {
-                "success": False,
-                "error": "Erro no envio da campanha",
-                "status_code": response.status_code
+                "message": "Campanha já está sendo enviada",
+                "dispatch": sms_dispatcher.progress(campaign_id),
+                "schedule": sms_scheduler.status(campaign_id)
             }
+        
+        start_campaign_dispatch(campaign)
+        return {
+            "success": True,
+            "campaign_id": campaign_id,
+            "status": campaign.status,
+            "message": "Envio da campanha agendado" if campaign.status == "scheduled" else "Envio da campanha iniciado",
+            "dispatch": sms_dispatcher.progress(campaign_id),
+            "schedule": sms_scheduler.status(campaign_id)
+        }
     except Exception as e:
-        if campaign_id in sms_campaigns:
-            sms_campaigns[campaign_id].status = "failed"
+        sms_campaigns.update(campaign_id, {"status": "failed"})
         return {
             "success": False,
             "error": f"Erro no envio: {str(e)}"
         }
 
+@app.get("/api/sms/campaign/{campaign_id}/dispatch")
+async def get_campaign_dispatch(campaign_id: str):
+    """Progresso do disparo e resultado de cada lote"""
+    campaign = sms_campaigns.get(campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campanha não encontrada")
+    return {
+        "success": True,
+        "status": campaign.status,
+        "dispatch": sms_dispatcher.progress(campaign_id),
+        "schedule": sms_scheduler.status(campaign_id),
+        "chunks": dispatch_chunks_repo.for_campaign(campaign_id)
+    }
+
 @app.get("/api/sms/campaigns")
-async def get_sms_campaigns():
-    """Lista todas as campanhas SMS"""
+async def get_sms_campaigns(status: Optional[str] = None):
+    """Lista as campanhas SMS (opcionalmente só as de um status, pelo índice)"""
     try:
+        campaigns = sms_campaigns.find("status", status) if status else sms_campaigns.values()
         campaigns_list = []
-        for campaign in sms_campaigns:
+        for campaign in campaigns:
             campaigns_list.append({
                 "id": campaign.id,
                 "name": campaign.name,
@@ -2383,8 +3124,12 @@ async def get_sms_campaigns():
         }
 
 @app.get("/api/sms/campaign/{campaign_id}")
-async def get_sms_campaign_details(campaign_id: str):
-    """Detalhes de uma campanha específica"""
+async def get_sms_campaign_details(
+    campaign_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
+    """Detalhes de uma campanha específica - contatos em faixas (offset/limit) por posição"""
     try:
         if campaign_id not in sms_campaigns:
             return {
@@ -2393,6 +3138,12 @@ async def get_sms_campaign_details(campaign_id: str):
             }
         
         campaign = sms_campaigns[campaign_id]
+        total = campaign_contact_count(campaign)
+        contacts = [
+            {"name": contact["name"], "phone": contact["phone"], "custom_fields": contact["customFields"] or {}}
+            for contact in campaign_contacts_repo.contacts(campaign_id, offset, offset + limit)
+        ]
+        next_offset = offset + limit if offset + limit < total else None
         
         return {
             "success": True,
@@ -2406,7 +3157,10 @@ async def get_sms_campaign_details(campaign_id: str):
                 "created_at": campaign.created_at,
                 "scheduled_date": campaign.scheduled_date,
                 "scheduled_time": campaign.scheduled_time,
-                "contacts": campaign.contacts,
+                "contacts": contacts,
+                "contacts_total": total,
+                "contacts_offset": offset,
+                "contacts_next_offset": next_offset,
                 "campaign_id": campaign.campaign_id
             }
         }
@@ -2417,45 +3171,43 @@ async def get_sms_campaign_details(campaign_id: str):
         }
 
 @app.get("/api/sms/campaign-status/{campaign_id}")
-async def get_campaign_status(campaign_id: str):
-    """Verifica status da campanha na API SMS Shortcode"""
+async def get_campaign_status(campaign_id: str, refresh: bool = False):
+    """Status da campanha na API SMS Shortcode - lido do cache do poller (refresh=true consulta agora)"""
     try:
-        if campaign_id not in sms_campaigns:
+        campaign = sms_campaigns.get(campaign_id)
+        if campaign is None:
             return {
                 "success": False,
                 "error": "Campanha não encontrada"
             }
         
-        campaign = sms_campaigns[campaign_id]
-        
         if not campaign.campaign_id:
             return {
                 "success": False,
                 "error": "Campanha ainda não foi enviada"
             }
         
-        params = {
-            "action": "GetCampanha",
-            "token": SMS_TOKEN,
-            "idCamp": campaign.campaign_id
-        }
-        
-        response = requests.get(SMS_API_BASE_URL, params=params, timeout=10)
+        status = None if refresh else sms_status_poller.get(campaign_id)
+        if status is None:
+            # Primeira consulta (ou cache descartado): uma chamada agora, depois só o cache
+            status = await sms_status_poller.refresh(campaign_id, campaign.campaign_id)
         
-        if response.status_code == 200:
-            return {
-                "success": True,
-                "api_status": response.text,
-                "campaign_status": campaign.status,
-                "sent_count": campaign.sent_count,
-                "total_count": campaign.total_count
-            }
-        else:
+        if status["api_status"] is None:
             return {
                 "success": False,
                 "error": "Erro ao consultar status",
-                "status_code": response.status_code
+                "detail": status["error"]
             }
+        return {
+            "success": True,
+            "api_status": status["api_status"],
+            "checked_at": status["checked_at"],
+            "terminal": status["terminal"],
+            "polling": sms_status_poller.is_watching(campaign_id),
+            "campaign_status": campaign.status,
+            "sent_count": campaign.sent_count,
+            "total_count": campaign.total_count
+        }
     except Exception as e:
         return {
             "success": False,
@@ -2463,37 +3215,59 @@ async def get_campaign_status(campaign_id: str):
         }
 
 @app.post("/api/sms/upload-contacts")
-async def upload_contacts(file: UploadFile = File(...)):
-    """Upload de lista de contatos CSV"""
+async def upload_contacts(file: UploadFile = File(...), campaign_id: Optional[str] = None):
+    """Upload de lista de contatos CSV/XLSX - lida em streaming e gravada em lotes
+
+    Com campaign_id os contatos entram na campanha; sem ele viram uma lista
+    (contact_list_id) que a criação de campanha adota.
+    """
     try:
-        contents = await file.read()
-        
-        # Detectar encoding
-        try:
-            content_str = contents.decode('utf-8')
-        except UnicodeDecodeError:
-            content_str = contents.decode('latin-1')
-        
-        # Ler CSV
-        csv_reader = csv.DictReader(io.StringIO(content_str))
-        contacts = []
-        
-        for row in csv_reader:
-            # Assumir colunas: nome, telefone
-            contact = SMSContact(
-                name=row.get('nome', row.get('name', 'Sem nome')),
-                phone=row.get('telefone', row.get('phone', '')),
-                custom_fields=row
-            )
-            
-            if contact.phone:  # Só adicionar se tiver telefone
-                contacts.append(contact)
+        if campaign_id and campaign_id not in sms_campaigns:
+            return {
+                "success": False,
+                "error": "Campanha não encontrada"
+            }
+        if campaign_id and sms_campaigns[campaign_id].status != "draft":
+            # Os lotes de envio já foram planejados com a lista atual
+            return {
+                "success": False,
+                "error": "Contatos só podem ser adicionados a campanhas em rascunho"
+            }
+        if campaign_id:
+            list_id = campaign_id
+        else:
+            list_id = f"{CONTACT_LIST_PREFIX}{uuid.uuid4().hex[:12]}"
+            await asyncio.to_thread(purge_contact_lists)
+            campaign_contacts_repo.register_list(list_id, datetime.now().isoformat())
+        rows = iter_rows(file.filename, file.file)
+        result = await asyncio.to_thread(import_campaign_contacts, list_id, rows)
+        
+        complete = result["imported"] <= SMS_UPLOAD_INLINE_LIMIT
+        if campaign_id:
+            sms_campaigns.update(campaign_id, {"total_count": campaign_contacts_repo.count_for(campaign_id)})
+        elif complete:
+            # Lista pequena volta inteira na resposta e é enviada junto com a campanha
+            campaign_contacts_repo.delete_campaign(list_id)
+            list_id = None
         
         return {
             "success": True,
-            "contacts": contacts,
-            "total_imported": len(contacts),
-            "message": f"{len(contacts)} contatos importados com sucesso"
+            "campaign_id": campaign_id,
+            "contact_list_id": None if campaign_id else list_id,
+            # Listas pequenas voltam inteiras; as grandes, só uma prévia
+            "contacts": [
+                {"name": contact["name"], "phone": contact["phone"], "custom_fields": contact["customFields"]}
+                for contact in result["preview"]
+            ],
+            "contacts_truncated": not complete,
+            "total_imported": result["imported"],
+            "total_rejected": result["rejected"],
+            "message": f"{result['imported']} contatos importados com sucesso"
+        }
+    except ImportFileError as e:
+        return {
+            "success": False,
+            "error": str(e)
         }
     except Exception as e:
         return {
@@ -2511,6 +3285,10 @@ async def delete_sms_campaign(campaign_id: str):
                 "error": "Campanha não encontrada"
             }
         
+        sms_scheduler.cancel(campaign_id)
+        sms_status_poller.unwatch(campaign_id)
+        sms_dispatcher.forget(campaign_id)
+        campaign_contacts_repo.delete_campaign(campaign_id)
         sms_campaigns.remove(campaign_id)
         
         return {
@@ -2528,8 +3306,8 @@ async def get_sms_stats():
     """Estatísticas gerais do SMS"""
     try:
         total_campaigns = len(sms_campaigns)
-        sent_campaigns = len([c for c in sms_campaigns if c.status == "sent"])
-        total_messages = sum(c.sent_count for c in sms_campaigns)
+        sent_campaigns = sms_campaigns.count_by("status").get("sent", 0)
+        total_messages = sum(c.sent_count for c in sms_campaigns.values())
         
         return {
             "success": True,
@@ -2550,64 +3328,82 @@ async def get_sms_stats():
 # DASHBOARD & STATISTICS ENDPOINTS  
 # =============================================================================
 
+def breakdown(buckets: Dict[str, Dict[str, Any]], with_total: bool = False) -> Dict[str, Any]:
+    """Formata os buckets de uma dimensão: contagem (e soma, para contratos)"""
+    if with_total:
+        return {bucket: {"count": data["count"], "total": data["total"]} for bucket, data in buckets.items()}
+    return {bucket: data["count"] for bucket, data in buckets.items()}
+
 @app.get("/api/dashboard/stats")
 async def get_dashboard_stats():
     """Obtém estatísticas gerais do dashboard"""
     try:
-        # Estatísticas simuladas baseadas nos dados
-        total_leads = len([
-            {"id": "1", "name": "Roberto Almeida", "status": "Novo"},
-            {"id": "2", "name": "Maria Silva", "status": "Em andamento"},
-            {"id": "3", "name": "João Santos", "status": "Finalizado"}
-        ]) + len([])  # leads criados dinamicamente
-        
-        total_clients = len([
-            {"id": "1", "name": "Ana Costa", "status": "ativo"},
-            {"id": "2", "name": "Carlos Pereira", "status": "ativo"},
-            {"id": "3", "name": "Fernanda Lima", "status": "inativo"}
-        ]) + len(created_clients)
-        
-        total_contracts = len([
-            {"id": "1", "value": 5400.00, "status": "ativo"},
-            {"id": "2", "value": 8200.00, "status": "ativo"},
-            {"id": "3", "value": 3100.00, "status": "finalizado"}
-        ]) + len(created_contracts)
-        
-        total_agents = len(created_agents)
-        
-        # Calcular valores
-        revenue_total = 16700.00 + sum(c.get('value', 0) for c in created_contracts)
+        # Agregados mantidos na escrita (database.py) - leitura O(1), sem varrer contratos
+        with db_pool.connection() as conn:
+            leads_by_status = leads_repo.aggregates("status", conn=conn)
+            clients_by_status = clients_repo.aggregates("status", conn=conn)
+            contracts_by_status = contracts_repo.aggregates("status", conn=conn)
+            contracts_total = contracts_repo.aggregate("total", "", conn=conn)
+
+            today = datetime.now().isoformat()
+            current = calendar_buckets(today)
+            revenue = {
+                period: contracts_repo.aggregate(period, current[period], conn=conn)["total"]
+                for period in ("month", "quarter", "year")
+            }
+
+            breakdowns = {
+                repository.entity: {
+                    dimension: breakdown(repository.aggregates(dimension, conn=conn), with_total=repository is contracts_repo)
+                    for dimension in repository.aggregate_fields
+                }
+                for repository in (leads_repo, clients_repo, contracts_repo)
+            }
+
+        total_leads = leads_repo.aggregate("total", "")["count"]
+        new_leads = leads_by_status.get("Novo", {}).get("count", 0)
+        converted_leads = leads_by_status.get("Convertido", {}).get("count", 0)
+
+        total_clients = clients_repo.aggregate("total", "")["count"]
+        inactive_clients = clients_by_status.get("inativo", {}).get("count", 0)
+
+        # Agentes: contadores em buckets (agent_metrics) - ativo = conversou nas últimas 24h
+        agents_overview = agent_metrics.overview(agent["id"] for agent in created_agents.values())
         
         return {
             "success": True,
             "stats": {
                 "leads": {
                     "total": total_leads,
-                    "new": total_leads - 1,
-                    "in_progress": 1,
-                    "converted": 1
+                    "new": new_leads,
+                    "in_progress": total_leads - new_leads - converted_leads,
+                    "converted": converted_leads
                 },
                 "clients": {
                     "total": total_clients,
-                    "active": total_clients - 1,
-                    "inactive": 1
+                    "active": total_clients - inactive_clients,
+                    "inactive": inactive_clients
                 },
                 "contracts": {
-                    "total": total_contracts,
-                    "active": total_contracts - 1,
-                    "completed": 1,
-                    "total_value": revenue_total
+                    "total": contracts_total["count"],
+                    "active": contracts_by_status.get("active", {}).get("count", 0),
+                    "completed": contracts_by_status.get("completed", {}).get("count", 0),
+                    "total_value": contracts_total["total"]
                 },
                 "agents": {
-                    "total": total_agents,
-                    "active": total_agents,
-                    "total_conversations": total_agents * 15
+                    "total": len(created_agents),
+                    "active": agents_overview["active"],
+                    "total_conversations": agents_overview["total"]["conversations"],
+                    "total_conversions": agents_overview["total"]["conversions"],
+                    "conversations_last_24h": agents_overview["last_24h"]["conversations"]
                 },
                 "revenue": {
-                    "month": revenue_total * 0.15,  # 15% do total como receita mensal
-                    "quarter": revenue_total * 0.45,  # 45% do total como receita trimestral
-                    "year": revenue_total
-                }
+                    "month": revenue["month"],
+                    "quarter": revenue["quarter"],
+                    "year": revenue["year"],
+                    "periods": current
+                },
+                "breakdown": breakdowns
             }
         }
     except Exception as e:
@@ -2677,49 +3473,378 @@ async def get_performance_metrics():
 # WEBHOOK EVOLUTION API
 # ==========================================
 
-@app.post("/webhook/evolution")
-async def webhook_evolution(request: Request):
-    """Webhook para receber eventos da Evolution API - QR Codes reais"""
-    try:
-        body = await request.body()
-        data = json.loads(body.decode('utf-8'))
-        
-        print(f"🔔 Webhook Evolution recebido: {data}")
-        
-        # Verifica se é evento de QR Code
-        if data.get('event') == 'QRCODE_UPDATED':
-            instance_name = data.get('instance_name', '')
-            qr_code = data.get('data', {}).get('qrcode', '')
-            
-            if qr_code:
-                print(f"🎉 QR CODE REAL RECEBIDO para {instance_name}!")
-                print(f"📱 QR Code: {qr_code[:50]}...")
-                
-                # Salvar QR Code real em cache
-                qr_cache[instance_name] = {
-                    'qr_code': qr_code,
-                    'timestamp': datetime.now(),
-                    'type': 'real'
-                }
+def process_webhook_event(data: Dict[str, Any]):
+    """Aplica um evento da Evolution API (QR Code, estado da conexão) aos caches e assinantes"""
+    event = data["event"]
+    instance_name = data["instance"]
+    payload = data.get('data') or {}
+    
+    # Verifica se é evento de QR Code
+    if event == 'QRCODE_UPDATED':
+        qr_code = format_qr_code(payload.get('qrcode'))
         
-        # Eventos de conexão
-        elif data.get('event') == 'CONNECTION_UPDATE':
-            instance_name = data.get('instance_name', '')
-            status = data.get('data', {}).get('state', '')
-            
-            print(f"🔄 Status atualizado {instance_name}: {status}")
+        if qr_code:
+            print(f"🎉 QR CODE REAL RECEBIDO para {instance_name}!")
             
-            # Atualizar cache de status
-            connection_cache[instance_name] = {
-                'status': status,
-                'timestamp': datetime.now()
+            # Salvar QR Code real em cache e entregar a quem está assinando
+            now = datetime.now()
+            qr_cache[instance_name] = {
+                'qr_code': qr_code,
+                'timestamp': now,
+                'type': 'real'
             }
-        
-        return {"success": True, "message": "Webhook processado"}
-        
-    except Exception as e:
-        print(f"❌ Erro no webhook: {e}")
-        return {"success": False, "error": str(e)}
+            qr_events.publish(instance_name, {
+                "type": "qrcode",
+                "instance": instance_name,
+                "qrcode": qr_code,
+                "timestamp": now.isoformat()
+            })
+    
+    # Eventos de conexão
+    elif event == 'CONNECTION_UPDATE':
+        status = payload.get('state', '')
+        event_time = webhook_event_time(data)
+        
+        # Reenvio atrasado de um estado antigo não pode sobrescrever o atual
+        cached = connection_cache.get(instance_name)
+        if event_time is not None and cached and (cached.get('event_time') or 0) > event_time:
+            webhook_deduper.out_of_order += 1
+            print(f"⏭️ CONNECTION_UPDATE fora de ordem ignorado para {instance_name}: {status}")
+            return
+        
+        print(f"🔄 Status atualizado {instance_name}: {status}")
+        
+        # Atualizar cache de status
+        now = datetime.now()
+        connection_cache[instance_name] = {
+            'status': status,
+            'timestamp': now,
+            'event_time': event_time
+        }
+        if status == 'open':
+            # Conectado: o QR Code não serve mais
+            qr_cache.pop(instance_name, None)
+        # Conexão do agente dono da instância pelo índice; varredura só para instâncias fora do registro
+        agent = agent_for_instance(instance_name)
+        connection = whatsapp_connections.get(agent["id"]) if agent else None
+        if connection is not None and connection.get("instanceName") == instance_name:
+            connections = [connection]
+        else:
+            connections = [c for c in whatsapp_connections.values() if c.get("instanceName") == instance_name]
+        for connection in connections:
+            connection.update({
+                "status": {"open": "connected", "connecting": "connecting"}.get(status, "disconnected"),
+                "connected": status == "open",
+                "evolution_state": status,
+                "timestamp": now.isoformat()
+            })
+        qr_events.publish(instance_name, {
+            "type": "connection",
+            "instance": instance_name,
+            "state": status,
+            "timestamp": now.isoformat()
+        })
+
+# Eventos de mensagem - gravados em lote no histórico de conversas
+MESSAGE_EVENTS = ("MESSAGES_UPSERT", "SEND_MESSAGE", "MESSAGES_UPDATE")
+MESSAGE_TEXT_PATHS = (
+    ("conversation",),
+    ("extendedTextMessage", "text"),
+    ("imageMessage", "caption"),
+    ("videoMessage", "caption"),
+    ("documentMessage", "caption"),
+    ("documentMessage", "fileName"),
+    ("buttonsResponseMessage", "selectedDisplayText"),
+    ("listResponseMessage", "title"),
+    ("templateButtonReplyMessage", "selectedDisplayText"),
+)
+
+def webhook_items(payload: Any) -> List[Dict[str, Any]]:
+    """`data` do webhook como lista - a v1 envia {"messages": [...]} ou uma lista"""
+    if isinstance(payload, list):
+        return [item for item in payload if isinstance(item, dict)]
+    if isinstance(payload, dict):
+        if isinstance(payload.get('messages'), list):
+            return [item for item in payload['messages'] if isinstance(item, dict)]
+        return [payload]
+    return []
+
+def message_text(message: Any) -> Optional[str]:
+    if not isinstance(message, dict):
+        return None
+    for path in MESSAGE_TEXT_PATHS:
+        value = message
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if value:
+            return str(value)
+    return None
+
+def message_timestamp(value: Any) -> int:
+    """messageTimestamp vem como número, texto ou Long do protobuf ({"low": ..., "high": ...})"""
+    if isinstance(value, dict):
+        value = (value.get('high') or 0) * 2 ** 32 + (value.get('low') or 0)
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return int(time.time())
+
+def parse_message_event(data: Dict[str, Any], messages: List[Dict[str, Any]], statuses: List[tuple]):
+    """Converte um evento de mensagem da Evolution em linhas do histórico / mudanças de status"""
+    instance_name = data["instance"]
+    for item in webhook_items(data.get('data')):
+        key = item.get('key') if isinstance(item.get('key'), dict) else {}
+        message_id = key.get('id') or item.get('keyId') or item.get('id')
+        if not message_id:
+            continue
+        record_id = f"{instance_name}:{message_id}"
+        
+        if data["event"] == "MESSAGES_UPDATE":
+            status = item.get('status') or (item.get('update') or {}).get('status')
+            if status:
+                statuses.append((record_id, str(status)))
+            continue
+        
+        remote_jid = key.get('remoteJid') or item.get('remoteJid')
+        if not remote_jid:
+            continue
+        from_me = bool(key.get('fromMe', data["event"] == "SEND_MESSAGE"))
+        messages.append({
+            "id": record_id,
+            "instance": instance_name,
+            "remoteJid": remote_jid,
+            "messageId": message_id,
+            "fromMe": int(from_me),
+            "messageType": item.get('messageType'),
+            "text": message_text(item.get('message')),
+            "status": item.get('status') or ("SERVER_ACK" if from_me else "DELIVERY_ACK"),
+            "pushName": item.get('pushName'),
+            "timestamp": message_timestamp(item.get('messageTimestamp')),
+            "receivedAt": data.get("received_at")
+        })
+
+def record_agent_activity(messages: List[Dict[str, Any]]):
+    """Mensagens das instâncias de agentes alimentam as estatísticas (conversas, conversões, tempo de resposta)"""
+    for message in messages:
+        remote_jid = message["remoteJid"]
+        if remote_jid.endswith("@g.us") or remote_jid.endswith("@broadcast"):
+            continue
+        agent = agent_for_instance(message["instance"])
+        if agent is None:
+            continue
+        if message["fromMe"]:
+            agent_metrics.record_outbound(agent["id"], remote_jid, message["timestamp"])
+        else:
+            intent = agent_intent_matcher(agent).classify(message["text"] or "")
+            agent_metrics.record_inbound(agent["id"], remote_jid, message["timestamp"],
+                                         conversion=bool(intent and intent.get("conversion")))
+
+def auto_reply_enabled(agent: Dict[str, Any]) -> bool:
+    return agent.get("status") == "ativo" and (agent.get("configuration") or {}).get("auto_reply", True)
+
+def queue_auto_replies(messages: List[Dict[str, Any]]):
+    """Mensagens novas dos contatos nas instâncias de agentes entram no pipeline de resposta automática"""
+    oldest = time.time() - AUTO_REPLY_MAX_AGE
+    for message in messages:
+        remote_jid = message["remoteJid"]
+        if (message["fromMe"] or not message["text"] or message["timestamp"] < oldest
+                or remote_jid.endswith("@g.us") or remote_jid.endswith("@broadcast")):
+            continue  # histórico sincronizado, grupos e mídia sem texto ficam sem resposta automática
+        agent = agent_for_instance(message["instance"])
+        if agent is None or not auto_reply_enabled(agent):
+            continue
+        if not auto_reply.submit(message["instance"], agent["id"], remote_jid, message["text"], message["receivedAt"]):
+            print(f"⚠️ Fila de respostas automáticas cheia ({message['instance']}): {remote_jid} sem resposta")
+
+async def process_webhook_batch(events: List[Dict[str, Any]]):
+    """Handler dos workers da fila: processa um lote de eventos na ordem de chegada"""
+    messages: List[Dict[str, Any]] = []
+    statuses: List[tuple] = []
+    for data in events:
+        try:
+            if data["event"] in MESSAGE_EVENTS:
+                parse_message_event(data, messages, statuses)
+            else:
+                process_webhook_event(data)
+        except Exception as e:
+            print(f"❌ Erro no webhook ({data.get('event')} {data.get('instance')}): {e}")
+    
+    if messages:
+        record_agent_activity(messages)
+        queue_auto_replies(messages)
+    
+    if messages or statuses:
+        # Uma transação por lote, fora do event loop
+        try:
+            await asyncio.to_thread(messages_repo.store_batch, messages, statuses)
+        except Exception as e:
+            print(f"❌ Erro ao gravar {len(messages)} mensagens do webhook: {e}")
+
+async def generate_auto_reply(job: Dict[str, Any]) -> Optional[str]:
+    """Resposta do agente para a mensagem do WhatsApp - sessão de chat = contato"""
+    agent = created_agents.get(job["agent_id"])
+    if agent is None or not auto_reply_enabled(agent):
+        return None
+    # Sessão fria é relida do SQLite (e o despejo pode gravar): fora do event loop
+    reply = await asyncio.to_thread(agent_reply, agent, job["contact"], job["text"])
+    return reply["text"]
+
+async def send_auto_reply(instance: str, contact: str, text: str) -> Dict[str, Any]:
+    data = {"number": to_whatsapp_jid(contact) or contact, "textMessage": {"text": text}}
+    return await evolution_api.request("POST", f"/message/sendText/{instance}", data)
+
+# Respostas automáticas: no máximo AUTO_REPLY_CONCURRENCY envios simultâneos por instância
+auto_reply = AutoReplyPipeline(generate_auto_reply, send_auto_reply)
+
+# Fila de ingestão: o endpoint só valida e enfileira; os workers aplicam os eventos em lotes
+webhook_queue = WebhookQueue(process_webhook_batch)
+# Eventos já aceitos - reenvios da Evolution são respondidos sem reprocessar
+webhook_deduper = WebhookDeduper()
+
+@app.on_event("startup")
+async def start_webhook_queue():
+    webhook_queue.start()
+
+@app.on_event("shutdown")
+async def stop_webhook_queue():
+    await webhook_queue.stop()
+
+@app.on_event("shutdown")
+async def stop_auto_reply():
+    # Depois da fila do webhook: as mensagens já enfileiradas ainda recebem resposta
+    await auto_reply.close()
+
+@app.on_event("startup")
+async def start_agent_metrics():
+    agent_metrics.start()
+
+@app.on_event("shutdown")
+async def save_agent_metrics():
+    # Depois da fila do webhook: os últimos eventos já foram contados
+    saved = await agent_metrics.close()
+    print(f"📈 Estatísticas de {saved} agentes gravadas")
+
+@app.post("/webhook/evolution")
+async def webhook_evolution(request: Request):
+    """Webhook para receber eventos da Evolution API - valida, enfileira e responde na hora"""
+    body = await request.body()
+    try:
+        data = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return JSONResponse(status_code=400, content={"success": False, "error": "JSON inválido"})
+    if not isinstance(data, dict) or not data.get('event'):
+        return JSONResponse(status_code=400, content={"success": False, "error": "Evento ausente"})
+    
+    # Evolution v1 envia "QRCODE_UPDATED", a v2 envia "qrcode.updated"
+    data['event'] = str(data['event']).upper().replace('.', '_')
+    instance_name = data.get('instance') or data.get('instance_name') or ''
+    if isinstance(instance_name, dict):
+        instance_name = instance_name.get('instanceName') or instance_name.get('name') or ''
+    data['instance'] = str(instance_name)
+    data['received_at'] = time.time()
+    
+    event_key = webhook_event_key(data, body)
+    if webhook_deduper.seen(event_key):
+        return {"success": True, "message": "Webhook já recebido", "duplicate": True}
+    
+    print(f"🔔 Webhook Evolution recebido: {data['event']} ({data['instance']})")
+    
+    if not webhook_queue.enqueue(data, key=data['instance']):
+        # Backpressure: a Evolution reenvia o webhook mais tarde
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "5"},
+            content={"success": False, "error": "Fila de webhooks cheia"}
+        )
+    webhook_deduper.mark(event_key)
+    return {"success": True, "message": "Webhook enfileirado"}
+
+@app.get("/api/webhook/queue")
+async def get_webhook_queue_stats():
+    """Profundidade e métricas da fila de ingestão de webhooks"""
+    return {"success": True, "queue": webhook_queue.stats(), "dedupe": webhook_deduper.stats()}
+
+@app.get("/api/webhook/auto-reply")
+async def get_auto_reply_stats():
+    """Respostas automáticas: filas por instância e latência de ponta a ponta (webhook -> sendText)"""
+    return {"success": True, "auto_reply": auto_reply.stats()}
+
+@app.get("/api/conversations/{instance}/{jid}")
+async def get_conversation(
+    instance: str,
+    jid: str,
+    before: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
+    """Histórico de uma conversa WhatsApp, paginado para trás a partir de `before`"""
+    # Aceita só o número (conversa individual) em qualquer formato
+    jid = to_whatsapp_jid(jid) or f"{jid}@s.whatsapp.net"
+    try:
+        messages, next_before = messages_repo.history(instance, jid, limit=limit, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "success": True,
+        "instance": instance,
+        "jid": jid,
+        "messages": messages,
+        "nextBefore": next_before,
+        "hasMore": next_before is not None,
+        "limit": limit
+    }
+
+async def qr_event_stream(agent_id: str, is_disconnected=None):
+    """Eventos de QR Code/conexão do agente: estado atual e, depois, cada evento do webhook"""
+    instance_name = agent_instance_name(agent_id)
+    deadline = time.monotonic() + QR_STREAM_MAX_SECONDS
+    async with qr_events.subscribe(instance_name) as queue:
+        for event in current_qr_events(instance_name):
+            yield event
+            if event["type"] == "connection" and event["state"] == "open":
+                return
+        while time.monotonic() < deadline:
+            try:
+                event = await asyncio.wait_for(queue.get(), QR_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    return
+                yield None  # heartbeat
+                continue
+            yield event
+            if event["type"] == "connection" and event["state"] == "open":
+                return
+
+@app.get("/api/evolution/qrcode/stream/{agent_id}")
+async def stream_qr_code(agent_id: str, request: Request):
+    """SSE com o QR Code e o estado da conexão do agente, entregues assim que o webhook recebe"""
+    print(f"📡 Stream de QR Code aberto para agente: {agent_id}")
+
+    async def events():
+        yield "retry: 3000\n\n"
+        async for event in qr_event_stream(agent_id, request.is_disconnected):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/api/evolution/qrcode/stream/{agent_id}")
+async def stream_qr_code_ws(websocket: WebSocket, agent_id: str):
+    """Mesmo canal do SSE via WebSocket"""
+    await websocket.accept()
+    try:
+        # Heartbeats falham quando o navegador fecha, encerrando a assinatura
+        async for event in qr_event_stream(agent_id):
+            await websocket.send_json(event if event is not None else {"type": "heartbeat"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        print(f"📡 WebSocket de QR Code fechado para agente: {agent_id}")
 
 # =============================================================================
 # MAIN SERVER STARTUP
@@ -2743,7 +3868,7 @@ async def get_qr_direct(agent_id: str):
         
         for endpoint in endpoints_to_try:
             print(f"🔄 Tentando endpoint: {endpoint}")
-            result = make_evolution_request("GET", endpoint)
+            result = await evolution_api.request("GET", endpoint)
             
             if result["success"] and result.get("data"):
                 qr_data = result["data"]
@@ -2776,7 +3901,7 @@ async def get_qr_direct(agent_id: str):
                 print(f"❌ Endpoint {endpoint} não funcionou: {result.get('error', 'Unknown error')}")
         
         # Se não encontrou QR Code real, tentar verificar estado da instância
-        state_result = make_evolution_request("GET", f"/instance/connectionState/{instance_name}")
+        state_result = await evolution_api.request("GET", f"/instance/connectionState/{instance_name}")
         if state_result["success"]:
             state = state_result["data"].get("instance", {}).get("state", "unknown")
             print(f"📊 Estado atual da instância: {state}")
@@ -2821,13 +3946,23 @@ async def monitor_qr_code(agent_id: str):
         for attempt in range(1, max_attempts + 1):
             print(f"📊 Tentativa {attempt}/{max_attempts}")
             
+            # QR Code real já entregue pelo webhook
+            real_qr = qr_cache.get(instance_name)
+            if real_qr:
+                return {
+                    "success": True,
+                    "qrcode": real_qr["qr_code"],
+                    "method": "webhook",
+                    "message": "QR Code REAL recebido via webhook!"
+                }
+            
             # Tentar buscar QR Code direto
             direct_result = await get_qr_direct(agent_id)
             if direct_result["success"]:
                 return direct_result
             
             # Verificar estado
-            state_result = make_evolution_request("GET", f"/instance/connectionState/{instance_name}")
+            state_result = await evolution_api.request("GET", f"/instance/connectionState/{instance_name}")
             if state_result["success"]:
                 state = state_result["data"].get("instance", {}).get("state", "unknown")
                 print(f"📊 Estado {attempt}: {state}")
@@ -2842,14 +3977,13 @@ async def monitor_qr_code(agent_id: str):
                 elif state == "close":
                     print(f"⚠️ Instância desconectada, tentando reconectar...")
                     # Tentar reconectar
-                    connect_result = make_evolution_request("GET", f"/instance/connect/{instance_name}")
+                    connect_result = await evolution_api.request("GET", f"/instance/connect/{instance_name}")
                     if connect_result["success"]:
                         print(f"🔄 Comando de reconexão enviado")
             
-            # Aguardar 2 segundos entre tentativas
+            # Aguardar até 2 segundos entre tentativas - acorda antes se o webhook entregar um evento
             if attempt < max_attempts:
-                import time
-                time.sleep(2)
+                await qr_events.wait_for(instance_name, timeout=2)
         
         return {
             "success": False,
@@ -2884,11 +4018,8 @@ async def get_real_qr_code(agent_id: str):
         # Simular base64 real (placeholder)
         qr_base64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
         
-        # Cache do QR Code (usando variável global já definida)
-        if agent_id not in qr_codes_cache:
-            qr_codes_cache[agent_id] = {}
-        
-        qr_codes_cache[agent_id].update({
+        # Cache do QR Code (novo QR Code renova o TTL da entrada)
+        qr_codes_cache[agent_id] = dict(qr_codes_cache.get(agent_id) or {}, **{
             "qrcode": qr_placeholder,
             "qrcode_base64": f"data:image/png;base64,{qr_base64}",
             "timestamp": datetime.now().isoformat(),
@@ -3032,7 +4163,7 @@ async def create_whatsapp_instance_robust(instance_name: str = Form(...)):
         print(f"🚀 Criando instância WhatsApp: {instance_name}")
         
         # Verificar se instância já existe
-        list_result = make_evolution_request("GET", "/instance/fetchInstances")
+        list_result = await evolution_api.request("GET", "/instance/fetchInstances")
         if list_result["success"] and list_result["data"]:
             for instance in list_result["data"]:
                 if instance.get("name") == instance_name:
@@ -3066,7 +4197,7 @@ async def create_whatsapp_instance_robust(instance_name: str = Form(...)):
         }
         
         # Tentar criar instância
-        create_result = make_evolution_request("POST", "/instance/create", instance_config)
+        create_result = await evolution_api.request("POST", "/instance/create", instance_config)
         
         if create_result["success"]:
             print(f"✅ Instância {instance_name} criada com sucesso!")
@@ -3127,8 +4258,8 @@ async def get_qr_code_real_time(agent_id: str):
         print(f"🔍 Buscando QR Code para agente: {agent_id}")
         
         # Verificar se temos QR Code na cache
-        if agent_id in qr_codes_cache:
-            qr_data = qr_codes_cache[agent_id]
+        qr_data = qr_codes_cache.get(agent_id)
+        if qr_data:
             print(f"✅ QR Code encontrado na cache para agente: {agent_id}")
             return {
                 "success": True,
@@ -3142,7 +4273,7 @@ async def get_qr_code_real_time(agent_id: str):
         instance_name = connection.get("instanceName", f"agent_{agent_id}")
         
         # Verificar status na Evolution API
-        fetch_result = make_evolution_request("GET", "/instance/fetchInstances")
+        fetch_result = await evolution_api.request("GET", "/instance/fetchInstances")
         
         if fetch_result["success"] and fetch_result["data"]:
             for instance in fetch_result["data"]:
@@ -3178,6 +4309,25 @@ async def get_qr_code_real_time(agent_id: str):
             "error": str(e)
         }
 
+# Catch-all para React Router - registrada por último para não encobrir as rotas GET da API
+@app.get("/{path:path}")
+async def serve_react_app(path: str):
+    """Serve frontend React para todas as rotas não-API"""
+    # Se for rota da API, deixar o FastAPI tratar
+    if path.startswith("api/") or path.startswith("docs") or path.startswith("webhook/"):
+        raise HTTPException(status_code=404, detail="API endpoint not found")
+    
+    # Verificar se é arquivo estático
+    file_path = f"static/{path}"
+    if os.path.exists(file_path) and os.path.isfile(file_path):
+        return FileResponse(file_path)
+    
+    # Para todas as outras rotas, servir o index.html (React Router)
+    if os.path.exists("static/index.html"):
+        return FileResponse("static/index.html")
+    
+    return {"message": "Frontend React não encontrado", "path": path}
+
 if __name__ == "__main__":
     print("🚀 Iniciando AutoCred Backend...")
     print(f"📧 Login: admin@autocred.com") 
@@ -0,0 +1,94 @@
+"""
+✉️ AutoCred Message Template - Mensagens personalizadas por contato
+
+"Olá {nome}, sua parcela de {parcela} ..." é compilado uma vez por campanha:
+os campos viram posições de um str.format (renderização em C) e cada contato
+só fornece os valores. O texto final é gerado na hora do envio, lote a lote,
+sem guardar uma cópia da mensagem por contato.
+
+Os nomes dos campos seguem as colunas da planilha importada (minúsculas, sem
+acento: {Nº Contrato} == {nº contrato}); {nome|Cliente} usa "Cliente" quando o
+contato não tem o valor. Chaves literais são escritas como {{ e }}.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from file_import import normalize_header
+
+PLACEHOLDER = re.compile(r"\{\{|\}\}|\{([^{}|]+)(?:\|([^{}]*))?\}")
+
+# Campos do contato com nome próprio (o resto vem das colunas importadas)
+CONTACT_FIELDS = {
+    "nome": "name",
+    "name": "name",
+    "telefone": "phone",
+    "phone": "phone",
+    "celular": "phone",
+}
+
+
+class MessageTemplate:
+    """Template compilado: formato posicional + lista de (campo, valor padrão)"""
+
+    __slots__ = ("source", "fields", "_format", "_static")
+
+    def __init__(self, source: str):
+        self.source = source
+        parts: List[str] = []
+        fields: List[Tuple[str, str]] = []
+        position = 0
+        for match in PLACEHOLDER.finditer(source):
+            parts.append(source[position:match.start()].replace("{", "{{").replace("}", "}}"))
+            token = match.group(0)
+            if token in ("{{", "}}"):
+                parts.append(token)
+            else:
+                parts.append(f"{{{len(fields)}}}")
+                fields.append((normalize_header(match.group(1)), match.group(2) or ""))
+            position = match.end()
+        parts.append(source[position:].replace("{", "{{").replace("}", "}}"))
+        self.fields = tuple(fields)
+        self._format = "".join(parts)
+        self._static = None if fields else self._format.format()
+
+    @property
+    def personalized(self) -> bool:
+        return bool(self.fields)
+
+    @property
+    def field_names(self) -> List[str]:
+        return list(dict.fromkeys(name for name, _ in self.fields))
+
+    def render(self, contact: Dict[str, Any]) -> str:
+        """Mensagem do contato ({name, phone, customFields}) - campos ausentes usam o padrão"""
+        if self._static is not None:
+            return self._static
+        custom = contact.get("customFields") or {}
+        values = []
+        for name, default in self.fields:
+            attribute = CONTACT_FIELDS.get(name)
+            value = contact.get(attribute) if attribute else None
+            if value in (None, ""):
+                value = custom.get(name)
+            values.append(default if value in (None, "") else value)
+        return self._format.format(*values)
+
+    def missing_fields(self, columns: List[str]) -> List[str]:
+        """Campos do template que não existem nas colunas informadas (aviso ao criar a campanha)"""
+        available = {normalize_header(column) for column in columns} | set(CONTACT_FIELDS)
+        return [name for name in self.field_names if name not in available]
+
+
+_compiled: Dict[str, MessageTemplate] = {}
+
+
+def compile_template(source: Optional[str]) -> MessageTemplate:
+    """Compila (uma vez por texto) o template da campanha"""
+    source = source or ""
+    template = _compiled.get(source)
+    if template is None:
+        if len(_compiled) > 1024:
+            _compiled.clear()
+        template = _compiled[source] = MessageTemplate(source)
+    return template
@@ -0,0 +1,133 @@
+"""
+🗂️ AutoCred Registry - Registros em memória indexados por id, persistidos no SQLite
+
+Substitui as listas globais percorridas a cada requisição (`x in lista`,
+`next(a for a in lista if ...)`): busca por id em O(1), índices secundários
+por campo (status, instância...) e toda alteração gravada no repositório,
+então o estado sobrevive a restarts.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from database import Repository
+
+
+def field_value(item: Any, field: str) -> Any:
+    """Lê o campo de um dict ou de um modelo pydantic"""
+    if isinstance(item, dict):
+        return item.get(field)
+    return getattr(item, field, None)
+
+
+class Registry:
+    """Dicionário id -> item com índices secundários (valor -> ids, na ordem de inserção)"""
+
+    def __init__(self, repository: Repository, factory: Callable[[Dict[str, Any]], Any] = dict,
+                 dump: Optional[Callable[[Any], Dict[str, Any]]] = None,
+                 indexes: Union[Iterable[str], Dict[str, Callable[[Any], Any]]] = ()):
+        self.repository = repository
+        self.factory = factory
+        self.dump = dump or (lambda item: item if isinstance(item, dict) else item.model_dump())
+        if not isinstance(indexes, dict):
+            indexes = {name: (lambda item, name=name: field_value(item, name)) for name in indexes}
+        self._key_functions = indexes
+        self._items: Dict[str, Any] = {}
+        self._indexes: Dict[str, Dict[Any, Dict[str, None]]] = {name: {} for name in indexes}
+        self._lock = threading.RLock()
+
+    def load(self) -> int:
+        """Carrega todos os registros do banco (na ordem do repositório)"""
+        with self._lock:
+            self._items.clear()
+            for index in self._indexes.values():
+                index.clear()
+            for record in self.repository.list_all():
+                self._put(self.factory(record))
+            return len(self._items)
+
+    def _put(self, item: Any):
+        item_id = str(field_value(item, "id"))
+        self._items[item_id] = item
+        for name, key in self._key_functions.items():
+            value = key(item)
+            if value is not None and value != "":
+                self._indexes[name].setdefault(value, {})[item_id] = None
+
+    def _drop(self, item: Any):
+        item_id = str(field_value(item, "id"))
+        self._items.pop(item_id, None)
+        for name, key in self._key_functions.items():
+            ids = self._indexes[name].get(key(item))
+            if ids is not None:
+                ids.pop(item_id, None)
+                if not ids:
+                    del self._indexes[name][key(item)]
+
+    def get(self, item_id: str, default: Any = None) -> Any:
+        return self._items.get(str(item_id), default)
+
+    def __getitem__(self, item_id: str) -> Any:
+        return self._items[str(item_id)]
+
+    def __contains__(self, item_id: object) -> bool:
+        return str(item_id) in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._items))
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return list(self._items.values())
+
+    def add(self, item: Any) -> Any:
+        """Grava no banco e registra (o item precisa ter `id`)"""
+        with self._lock:
+            self.repository.insert(self.dump(item))
+            self._put(item)
+            return item
+
+    def update(self, item_id: str, changes: Dict[str, Any]) -> Any:
+        """Aplica as mudanças no banco e no item em memória, reindexando - None se não existir"""
+        with self._lock:
+            item = self._items.get(str(item_id))
+            if item is None:
+                return None
+            self.repository.update(str(item_id), changes)
+            self._drop(item)
+            for field, value in changes.items():
+                if isinstance(item, dict):
+                    item[field] = value
+                else:
+                    setattr(item, field, value)
+            self._put(item)
+            return item
+
+    def remove(self, item_id: str) -> Any:
+        """Remove do banco e da memória - retorna o item removido (None se não existia)"""
+        with self._lock:
+            item = self._items.get(str(item_id))
+            if item is None:
+                return None
+            self.repository.delete(str(item_id))
+            self._drop(item)
+            return item
+
+    def find(self, index: str, value: Any) -> List[Any]:
+        """Itens com o valor no índice secundário, na ordem de inserção"""
+        with self._lock:
+            return [self._items[item_id] for item_id in self._indexes[index].get(value, ())]
+
+    def find_one(self, index: str, value: Any) -> Any:
+        with self._lock:
+            for item_id in self._indexes[index].get(value, ()):
+                return self._items[item_id]
+            return None
+
+    def count_by(self, index: str) -> Dict[Any, int]:
+        """Quantidade de itens por valor do índice (ex.: campanhas por status)"""
+        with self._lock:
+            return {value: len(ids) for value, ids in self._indexes[index].items()}
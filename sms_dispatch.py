@@ -0,0 +1,270 @@
+"""
+📨 AutoCred SMS Dispatch - Disparo de campanhas SMS em lotes
+
+A lista de contatos é dividida em lotes do tamanho aceito pelo provedor (a URL do
+GET não estoura), enviados em paralelo sob um limite de requisições por segundo.
+Cada lote tem o seu resultado gravado no SQLite: depois de uma queda ou restart o
+disparo recomeça dos lotes que ainda não foram confirmados.
+
+Em campanhas personalizadas o lote é agrupado pelo texto final (uma requisição
+por mensagem distinta) e o progresso dentro do lote também é gravado.
+
+Lotes (ou grupos) que estavam "sending" durante uma queda são reenviados (entrega
+pelo menos uma vez) - o provedor não informa se a requisição interrompida foi aceita.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import httpx
+
+from database import DispatchChunkRepository
+
+SMS_CHUNK_SIZE = int(os.getenv("SMS_CHUNK_SIZE", "300"))
+SMS_DISPATCH_CONCURRENCY = int(os.getenv("SMS_DISPATCH_CONCURRENCY", "4"))
+SMS_RATE_LIMIT = float(os.getenv("SMS_RATE_LIMIT", "5"))  # requisições por segundo (0 = sem limite)
+SMS_CHUNK_RETRIES = int(os.getenv("SMS_CHUNK_RETRIES", "3"))
+SMS_REQUEST_TIMEOUT = float(os.getenv("SMS_REQUEST_TIMEOUT", "30"))
+SMS_RETRY_BACKOFF = float(os.getenv("SMS_RETRY_BACKOFF", "2"))
+
+# Status de um lote: pending -> sending -> sent | failed
+CHUNK_DONE = "sent"
+CHUNK_FAILED = "failed"
+
+
+class RateLimiter:
+    """Espaça as requisições em intervalos fixos (usado dentro do event loop)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class SMSDispatcher:
+    """Motor de disparo: planeja os lotes, envia em paralelo e registra o resultado de cada um"""
+
+    def __init__(self, base_url: str, token: str, tipo: str, chunks: DispatchChunkRepository,
+                 chunk_size: int = SMS_CHUNK_SIZE, concurrency: int = SMS_DISPATCH_CONCURRENCY,
+                 rate_limit: float = SMS_RATE_LIMIT, retries: int = SMS_CHUNK_RETRIES,
+                 retry_backoff: float = SMS_RETRY_BACKOFF,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url
+        self.token = token
+        self.tipo = tipo
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(SMS_REQUEST_TIMEOUT),
+                limits=httpx.Limits(max_connections=self.concurrency),
+                transport=self.transport
+            )
+        return self._client
+
+    def plan(self, campaign_id: str, total: int) -> List[Dict[str, Any]]:
+        """Cria os lotes da campanha na primeira vez; depois devolve os já gravados (mesmas faixas)"""
+        existing = self.chunks.for_campaign(campaign_id)
+        if existing:
+            return existing
+        now = datetime.now().isoformat()
+        planned = [
+            {
+                "id": f"{campaign_id}:{index}",
+                "campaignId": campaign_id,
+                "chunkIndex": index,
+                "start": start,
+                "end": min(start + self.chunk_size, total),
+                "status": "pending",
+                "attempts": 0,
+                "sentGroups": 0,
+                "updatedAt": now
+            }
+            for index, start in enumerate(range(0, total, self.chunk_size))
+        ]
+        self.chunks.insert_many(planned, ignore_existing=True)
+        return self.chunks.for_campaign(campaign_id)
+
+    async def _send(self, phones: List[str], message: str, params: Dict[str, Any]) -> httpx.Response:
+        await self.rate_limiter.acquire()
+        query = {
+            "action": "sendsms",
+            "token": self.token,
+            "tipo": self.tipo,
+            "msg": message,
+            "numbers": ",".join(phones),
+            **params
+        }
+        return await self._get_client().get(self.base_url, params=query)
+
+    @staticmethod
+    def _groups(items: Iterable[Union[str, Tuple[str, str]]], message: str) -> List[Tuple[str, List[str]]]:
+        """Agrupa o lote pelo texto final - uma requisição por mensagem distinta, na ordem dos contatos"""
+        groups: Dict[str, List[str]] = {}
+        for item in items:
+            phone, text = item if isinstance(item, tuple) else (item, message)
+            if phone:
+                groups.setdefault(text, []).append(phone)
+        return list(groups.items())
+
+    async def _send_group(self, phones: List[str], message: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        """Envia um grupo com novas tentativas - retorna (resultado, tentativas feitas)"""
+        result: Dict[str, Any] = {}
+        for attempt in range(self.retries):
+            try:
+                response = await self._send(phones, message, params)
+            except httpx.HTTPError as e:
+                result = {"status": CHUNK_FAILED, "error": f"{type(e).__name__}: {e}"}
+            else:
+                if response.status_code == 200:
+                    return {
+                        "status": CHUNK_DONE,
+                        "providerId": response.text.strip(),
+                        "response": response.text[:500],
+                        "error": None
+                    }, attempt + 1
+                result = {
+                    "status": CHUNK_FAILED,
+                    "response": response.text[:500],
+                    "error": f"Provedor retornou status {response.status_code}"
+                }
+                if response.status_code < 500 and response.status_code != 429:
+                    # Erro do pedido (token, parâmetros): repetir não adianta
+                    return result, attempt + 1
+            if attempt + 1 < self.retries:
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+        return result, self.retries
+
+    async def _dispatch_chunk(self, chunk: Dict[str, Any], load_chunk: Callable[[int, int], Iterable],
+                              message: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        groups = self._groups(load_chunk(chunk["start"], chunk["end"]), message)
+        self.chunks.update(chunk["id"], {"status": "sending", "updatedAt": datetime.now().isoformat()})
+        attempts = chunk.get("attempts") or 0
+        sent_groups = chunk.get("sentGroups") or 0
+        changes: Dict[str, Any] = {"status": CHUNK_DONE, "error": None}
+
+        # Grupos já confirmados numa execução anterior não são reenviados
+        for text, phones in groups[sent_groups:]:
+            result, tries = await self._send_group(phones, text, params)
+            attempts += tries
+            if result["status"] != CHUNK_DONE:
+                changes = result
+                break
+            sent_groups += 1
+            result["providerId"] = chunk.get("providerId") or result["providerId"]
+            chunk["providerId"] = result["providerId"]
+            changes = result
+            if len(groups) > 1:
+                self.chunks.update(chunk["id"], {"sentGroups": sent_groups, "providerId": result["providerId"]})
+
+        changes.update({"attempts": attempts, "sentGroups": sent_groups, "updatedAt": datetime.now().isoformat()})
+        return self.chunks.update(chunk["id"], changes)
+
+    async def dispatch(self, campaign_id: str, total: int, load_chunk: Callable[[int, int], Iterable],
+                       message: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Envia os lotes ainda não confirmados da campanha e devolve o resumo do disparo
+
+        load_chunk(start, end) devolve os telefones da faixa - ou pares (telefone, mensagem)
+        em campanhas personalizadas. Os contatos precisam manter a mesma ordem entre
+        execuções para a retomada ser correta.
+        """
+        pending = [chunk for chunk in self.plan(campaign_id, total) if chunk["status"] != CHUNK_DONE]
+        await self.send_chunks(campaign_id, pending, load_chunk, message, params)
+        return self.progress(campaign_id)
+
+    async def send_chunks(self, campaign_id: str, chunks: List[Dict[str, Any]],
+                          load_chunk: Callable[[int, int], Iterable], message: str,
+                          params: Optional[Dict[str, Any]] = None):
+        """Envia os lotes informados em paralelo limitado (usado também pelo agendador)"""
+        params = params or {}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(chunk):
+            async with semaphore:
+                try:
+                    return await self._dispatch_chunk(chunk, load_chunk, message, params)
+                except Exception as e:
+                    print(f"❌ Erro no lote {chunk['chunkIndex']} da campanha {campaign_id}: {e}")
+                    return self.chunks.update(chunk["id"], {"status": CHUNK_FAILED, "error": str(e)})
+
+        await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+    def start(self, campaign_id: str, total: int, load_chunk: Callable[[int, int], Iterable],
+              message: str, params: Optional[Dict[str, Any]] = None,
+              on_done: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> bool:
+        """Dispara em segundo plano - False se a campanha já está sendo enviada"""
+        if self.is_running(campaign_id):
+            return False
+        # Lotes planejados já na chamada: o progresso aparece antes do primeiro envio
+        self.plan(campaign_id, total)
+
+        async def run():
+            try:
+                summary = await self.dispatch(campaign_id, total, load_chunk, message, params)
+                if on_done is not None:
+                    await on_done(summary)
+            finally:
+                self._tasks.pop(campaign_id, None)
+
+        self._tasks[campaign_id] = asyncio.get_running_loop().create_task(run(), name=f"sms-dispatch-{campaign_id}")
+        return True
+
+    def is_running(self, campaign_id: str) -> bool:
+        task = self._tasks.get(campaign_id)
+        return task is not None and not task.done()
+
+    def progress(self, campaign_id: str) -> Dict[str, Any]:
+        summary = self.chunks.summary(campaign_id)
+        chunks = sum(item["chunks"] for item in summary.values())
+        sent = summary.get(CHUNK_DONE, {"chunks": 0, "contacts": 0})
+        failed = summary.get(CHUNK_FAILED, {"chunks": 0, "contacts": 0})
+        return {
+            "campaign_id": campaign_id,
+            "running": self.is_running(campaign_id),
+            "chunks": chunks,
+            "sent_chunks": sent["chunks"],
+            "failed_chunks": failed["chunks"],
+            "pending_chunks": chunks - sent["chunks"] - failed["chunks"],
+            "sent_count": sent["contacts"],
+            "failed_count": failed["contacts"],
+            "complete": chunks > 0 and sent["chunks"] == chunks
+        }
+
+    def forget(self, campaign_id: str):
+        """Cancela o disparo em andamento e apaga os lotes (campanha excluída)"""
+        task = self._tasks.pop(campaign_id, None)
+        if task is not None:
+            task.cancel()
+        self.chunks.delete_campaign(campaign_id)
+
+    async def close(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
@@ -0,0 +1,271 @@
+"""
+⏰ AutoCred SMS Scheduler - Liberação dos lotes de campanha ao longo da janela de envio
+
+Em vez de mandar a campanha inteira num único horário (jobdate/jobtime no provedor),
+os lotes são liberados aos poucos: no ritmo pedido (contatos por minuto) e só dentro
+da janela de envio, no mesmo formato do business_hours dos agentes
+({"monday": "09:00-18:00", ...}). Isso suaviza a carga no provedor e a avalanche de
+respostas/webhooks que volta depois de cada disparo.
+
+Um heap (momento, lote) alimenta um único timer, que dorme até a próxima liberação.
+O momento de cada lote fica gravado no SQLite (release_at): depois de um restart a
+campanha continua do primeiro lote não enviado, sem reenviar os confirmados e sem
+despejar de uma vez os lotes que venceram enquanto o servidor estava fora.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from database import DispatchChunkRepository
+from sms_dispatch import CHUNK_DONE
+
+SMS_SEND_RATE = float(os.getenv("SMS_SEND_RATE", "0"))  # contatos por minuto (0 = sem espalhar)
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+CLOSED = ("", "closed", "fechado")
+
+# Atraso tolerado na liberação antes de conferir de novo a janela (event loop ocupado)
+WINDOW_GRACE = 60
+
+
+def parse_clock(value: str) -> int:
+    """'09:30' -> minutos desde a meia-noite ('24:00' fecha o dia)"""
+    hours, _, minutes = value.strip().partition(":")
+    total = int(hours) * 60 + int(minutes or 0)
+    if not 0 <= total <= 24 * 60:
+        raise ValueError(f"Horário inválido: {value}")
+    return total
+
+
+def parse_start(date: Optional[str], clock: Optional[str] = None) -> Optional[datetime]:
+    """Início agendado da campanha ('2030-01-31' ou '31/01/2030', hora opcional 'HH:MM')"""
+    if not date:
+        return None
+    for layout in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            day = datetime.strptime(date.strip(), layout)
+            break
+        except ValueError:
+            continue
+    else:
+        raise ValueError(f"Data de agendamento inválida: {date}")
+    if clock:
+        day += timedelta(minutes=parse_clock(clock[:5]))
+    return day
+
+
+class SendWindow:
+    """Horários permitidos por dia da semana - sem horários configurados, sempre aberta"""
+
+    def __init__(self, hours: Optional[Dict[str, str]] = None):
+        self.hours = dict(hours or {})
+        self._days: List[List[Tuple[int, int]]] = [[] for _ in WEEKDAYS]
+        for day, spec in self.hours.items():
+            if day.lower() not in WEEKDAYS:
+                raise ValueError(f"Dia da semana inválido: {day}")
+            for part in str(spec or "").split(","):
+                if part.strip().lower() in CLOSED:
+                    continue
+                start, _, end = part.partition("-")
+                opening, closing = parse_clock(start), parse_clock(end)
+                if closing <= opening:
+                    raise ValueError(f"Intervalo inválido: {part.strip()}")
+                self._days[WEEKDAYS.index(day.lower())].append((opening, closing))
+        for intervals in self._days:
+            intervals.sort()
+        if self.hours and not any(self._days):
+            raise ValueError("Janela de envio sem nenhum horário aberto")
+
+    @property
+    def always_open(self) -> bool:
+        return not self.hours
+
+    def next_open(self, moment: datetime) -> datetime:
+        """O próprio momento se a janela está aberta, senão a próxima abertura"""
+        if self.always_open:
+            return moment
+        midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        for offset in range(8):
+            day = midnight + timedelta(days=offset)
+            for opening, closing in self._days[day.weekday()]:
+                if day + timedelta(minutes=closing) > moment:
+                    return max(moment, day + timedelta(minutes=opening))
+        raise ValueError("Janela de envio sem nenhum horário aberto")
+
+    def is_open(self, moment: datetime) -> bool:
+        return self.next_open(moment) == moment
+
+    def spread(self, start: datetime, durations: List[float]) -> List[datetime]:
+        """Momento de cada lote: um depois do outro (duração em segundos), só com a janela aberta"""
+        times = []
+        moment = start
+        for duration in durations:
+            moment = self.next_open(moment)
+            times.append(moment)
+            moment += timedelta(seconds=duration)
+        return times
+
+
+class CampaignScheduler:
+    """Heap de liberações (momento, campanha, lote) com um único timer"""
+
+    def __init__(self, chunks: DispatchChunkRepository):
+        self.chunks = chunks
+        self._heap: List[Tuple[float, int, str, str, int]] = []  # (momento, seq, campanha, lote, geração)
+        self._campaigns: Dict[str, Dict[str, Any]] = {}
+        self._sequence = itertools.count()
+        self._generations = itertools.count(1)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._releases: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.released = 0
+
+    def start(self):
+        """Cria o timer no event loop atual (idempotente)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run(), name="sms-scheduler")
+
+    def schedule(self, campaign_id: str, window: SendWindow, start: Optional[datetime], rate: float,
+                 release: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+                 on_done: Optional[Callable[[], Awaitable[None]]] = None) -> int:
+        """Planeja (ou replaneja) a liberação dos lotes não enviados - retorna quantos foram agendados
+
+        rate é em contatos por minuto (0 = todos os lotes na abertura da janela).
+        """
+        self.start()
+        entry = self._campaigns.get(campaign_id)
+        released = entry["released"] if entry is not None else set()
+        pending = [
+            chunk for chunk in self.chunks.for_campaign(campaign_id)
+            if chunk["status"] != CHUNK_DONE and chunk["id"] not in released
+        ]
+        if not pending:
+            return 0
+
+        # Retomada: segue do próximo lote planejado, nunca antes do início pedido nem no passado
+        planned = [datetime.fromisoformat(chunk["releaseAt"]) for chunk in pending if chunk.get("releaseAt")]
+        candidates = [datetime.now()] + ([start] if start else []) + ([min(planned)] if planned else [])
+        durations = [(chunk["end"] - chunk["start"]) * 60 / rate if rate > 0 else 0 for chunk in pending]
+        times = window.spread(max(candidates), durations)
+        self.chunks.set_release_times({chunk["id"]: moment.isoformat() for chunk, moment in zip(pending, times)})
+
+        if entry is None:
+            entry = self._campaigns[campaign_id] = {"released": released, "in_flight": 0}
+        entry.update({
+            "window": window,
+            "start": start,
+            "rate": rate,
+            "release": release,
+            "on_done": on_done,
+            "generation": next(self._generations),
+            "remaining": len(pending),
+            # Momentos planejados do plano atual, em ordem (o heap pode ter entradas de planos antigos)
+            "upcoming": deque(moment.timestamp() for moment in times)
+        })
+        generation = entry["generation"]
+        for chunk, moment in zip(pending, times):
+            heapq.heappush(self._heap, (moment.timestamp(), next(self._sequence), campaign_id, chunk["id"], generation))
+        self._wakeup.set()
+        return len(pending)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._heap[0][0] - time.time() if self._heap else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due: Dict[str, List[str]] = {}
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                moment, _, campaign_id, chunk_id, generation = heapq.heappop(self._heap)
+                entry = self._campaigns.get(campaign_id)
+                # Entradas de um plano substituído (replanejamento, cancelamento) são descartadas
+                if entry is None or entry["generation"] != generation:
+                    continue
+                entry["upcoming"].popleft()
+                if now - moment > WINDOW_GRACE and not entry["window"].is_open(datetime.now()):
+                    # Atrasou até a janela fechar: a campanha é replanejada para a próxima abertura
+                    due.pop(campaign_id, None)
+                    self.schedule(campaign_id, entry["window"], entry["start"], entry["rate"],
+                                  entry["release"], entry["on_done"])
+                    continue
+                due.setdefault(campaign_id, []).append(chunk_id)
+
+            for campaign_id, chunk_ids in due.items():
+                entry = self._campaigns[campaign_id]
+                entry["released"].update(chunk_ids)
+                entry["remaining"] -= len(chunk_ids)
+                entry["in_flight"] += 1
+                task = asyncio.get_running_loop().create_task(self._release(campaign_id, entry, chunk_ids))
+                self._releases.add(task)
+                task.add_done_callback(self._releases.discard)
+
+    async def _release(self, campaign_id: str, entry: Dict[str, Any], chunk_ids: List[str]):
+        try:
+            chunks = self.chunks.get_many(chunk_ids)
+            await entry["release"]([chunks[chunk_id] for chunk_id in chunk_ids if chunk_id in chunks])
+        except Exception as e:
+            print(f"❌ Erro ao liberar lotes da campanha {campaign_id}: {e}")
+        finally:
+            entry["in_flight"] -= 1
+            self.released += len(chunk_ids)
+        if entry["remaining"] <= 0 and entry["in_flight"] == 0 and self._campaigns.get(campaign_id) is entry:
+            del self._campaigns[campaign_id]
+            if entry["on_done"] is not None:
+                await entry["on_done"]()
+
+    def is_scheduled(self, campaign_id: str) -> bool:
+        return campaign_id in self._campaigns
+
+    def status(self, campaign_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._campaigns.get(campaign_id)
+        if entry is None:
+            return None
+        return {
+            "remaining_chunks": entry["remaining"],
+            "in_flight": entry["in_flight"],
+            "next_release": datetime.fromtimestamp(entry["upcoming"][0]).isoformat() if entry["upcoming"] else None,
+            "rate_per_minute": entry["rate"],
+            "window": entry["window"].hours
+        }
+
+    def cancel(self, campaign_id: str):
+        """Tira a campanha do agendamento (as entradas no heap ficam órfãs e são descartadas)"""
+        self._campaigns.pop(campaign_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        upcoming = [entry["upcoming"][0] for entry in self._campaigns.values() if entry["upcoming"]]
+        return {
+            "campaigns": len(self._campaigns),
+            "queued": len(self._heap),
+            "in_flight": len(self._releases),
+            "released": self.released,
+            "next_release": datetime.fromtimestamp(min(upcoming)).isoformat() if upcoming else None
+        }
+
+    async def close(self):
+        """Para o timer - lotes já liberados e interrompidos são liberados de novo na retomada"""
+        tasks = list(self._releases) + ([self._task] if self._task is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._releases.clear()
+        self._task = None
+        self._heap.clear()
+        self._campaigns.clear()
@@ -0,0 +1,199 @@
+"""
+📊 AutoCred SMS Status - Consulta em segundo plano do status das campanhas no provedor
+
+O endpoint de status fazia um GetCampanha ao vivo a cada requisição (um painel com
+50 campanhas abertas = 50 chamadas bloqueantes por atualização). Agora um poller
+consulta as campanhas ativas em lotes, em paralelo limitado, e guarda a última
+resposta num cache - o endpoint só lê o cache.
+
+Backoff adaptativo por campanha: resposta igual à anterior (ou erro) dobra o
+intervalo até o máximo; resposta nova volta ao intervalo base. A campanha sai da
+lista quando fica terminal - o provedor informa o fim, ou o disparo local já
+terminou e a resposta ficou estável por algumas consultas seguidas.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+from ttl_cache import TTLCache
+
+SMS_STATUS_INTERVAL = float(os.getenv("SMS_STATUS_INTERVAL", "30"))
+SMS_STATUS_MAX_INTERVAL = float(os.getenv("SMS_STATUS_MAX_INTERVAL", "600"))
+SMS_STATUS_BATCH_SIZE = int(os.getenv("SMS_STATUS_BATCH_SIZE", "20"))
+SMS_STATUS_STABLE_POLLS = int(os.getenv("SMS_STATUS_STABLE_POLLS", "5"))
+SMS_STATUS_CACHE_SIZE = int(os.getenv("SMS_STATUS_CACHE_SIZE", "5000"))
+SMS_STATUS_TIMEOUT = float(os.getenv("SMS_STATUS_TIMEOUT", "10"))
+
+# Trechos da resposta do GetCampanha que indicam campanha encerrada
+TERMINAL_MARKERS = ("finaliz", "conclu", "cancel", "encerr")
+
+
+def is_terminal_status(text: str) -> bool:
+    lowered = (text or "").lower()
+    return any(marker in lowered for marker in TERMINAL_MARKERS)
+
+
+class SMSStatusPoller:
+    """Lista de campanhas acompanhadas + cache da última resposta do provedor"""
+
+    def __init__(self, base_url: str, token: str, interval: float = SMS_STATUS_INTERVAL,
+                 max_interval: float = SMS_STATUS_MAX_INTERVAL, batch_size: int = SMS_STATUS_BATCH_SIZE,
+                 stable_polls: int = SMS_STATUS_STABLE_POLLS,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url
+        self.token = token
+        self.interval = interval
+        self.max_interval = max_interval
+        self.batch_size = batch_size
+        self.stable_polls = stable_polls
+        self.transport = transport
+        self.cache = TTLCache("sms_status", SMS_STATUS_CACHE_SIZE, None)
+        self._watching: Dict[str, Dict[str, Any]] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.polls = 0
+        self.errors = 0
+        self.cycles = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client_loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(SMS_STATUS_TIMEOUT),
+                limits=httpx.Limits(max_connections=self.batch_size),
+                transport=self.transport
+            )
+        return self._client
+
+    def start(self):
+        """Cria o loop de consultas no event loop atual (idempotente)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run(), name="sms-status-poller")
+
+    def watch(self, campaign_id: str, provider_id: str, final: bool = False):
+        """Acompanha a campanha (final=True quando o disparo local já terminou)"""
+        self.start()
+        entry = self._watching.get(campaign_id)
+        if entry is None or entry["provider_id"] != provider_id:
+            entry = self._watching[campaign_id] = {
+                "provider_id": provider_id,
+                "interval": self.interval,
+                "due": time.monotonic(),
+                "stable": 0
+            }
+        entry["final"] = final
+        self._wakeup.set()
+
+    def unwatch(self, campaign_id: str):
+        self._watching.pop(campaign_id, None)
+        self.cache.pop(campaign_id, None)
+
+    def is_watching(self, campaign_id: str) -> bool:
+        return campaign_id in self._watching
+
+    def get(self, campaign_id: str) -> Optional[Dict[str, Any]]:
+        return self.cache.get(campaign_id)
+
+    async def _fetch(self, provider_id: str) -> httpx.Response:
+        params = {"action": "GetCampanha", "token": self.token, "idCamp": provider_id}
+        return await self._get_client().get(self.base_url, params=params)
+
+    async def refresh(self, campaign_id: str, provider_id: str) -> Dict[str, Any]:
+        """Consulta agora (cache vazio ou pedido explícito) e atualiza o cache"""
+        entry = self._watching.get(campaign_id) or {
+            "provider_id": provider_id, "interval": self.interval, "stable": 0, "final": True
+        }
+        return await self._poll(campaign_id, entry)
+
+    async def _poll(self, campaign_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        previous = self.cache.get(campaign_id) or {}
+        self.polls += 1
+        try:
+            response = await self._fetch(entry["provider_id"])
+            error = None if response.status_code == 200 else f"Provedor retornou status {response.status_code}"
+        except httpx.HTTPError as e:
+            response = None
+            error = f"{type(e).__name__}: {e}"
+
+        if error is None:
+            text = response.text
+            changed = text != previous.get("api_status")
+            entry["stable"] = 0 if changed else entry["stable"] + 1
+            entry["interval"] = self.interval if changed else min(entry["interval"] * 2, self.max_interval)
+            terminal = is_terminal_status(text) or (entry["final"] and entry["stable"] >= self.stable_polls)
+            result = {
+                "api_status": text,
+                "checked_at": datetime.now().isoformat(),
+                "terminal": terminal,
+                "error": None
+            }
+        else:
+            # Falha: mantém a última resposta boa e espera mais antes de tentar de novo
+            self.errors += 1
+            entry["interval"] = min(entry["interval"] * 2, self.max_interval)
+            result = {
+                "api_status": previous.get("api_status"),
+                "checked_at": previous.get("checked_at"),
+                "terminal": False,
+                "error": error
+            }
+        result.update({"provider_id": entry["provider_id"], "next_interval": entry["interval"]})
+        self.cache.set(campaign_id, result)
+
+        entry["due"] = time.monotonic() + entry["interval"]
+        if result["terminal"] and self._watching.get(campaign_id) is entry:
+            del self._watching[campaign_id]
+        return result
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            due = sorted(
+                (entry["due"], campaign_id) for campaign_id, entry in self._watching.items() if entry["due"] <= now
+            )[:self.batch_size]
+            if due:
+                self.cycles += 1
+                # Lote de campanhas vencidas consultado em paralelo (uma conexão por campanha)
+                await asyncio.gather(
+                    *(self._poll(campaign_id, self._watching[campaign_id]) for _, campaign_id in due
+                      if campaign_id in self._watching),
+                    return_exceptions=True
+                )
+                continue
+            delay = min((entry["due"] for entry in self._watching.values()), default=None)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), None if delay is None else max(0.0, delay - now))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "watching": len(self._watching),
+            "polls": self.polls,
+            "errors": self.errors,
+            "cycles": self.cycles,
+            "cache": self.cache.stats()
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
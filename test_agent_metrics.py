@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Teste das estatísticas dos agentes em buckets de tempo (agent_metrics.py)
+"""
+
+import os
+import tempfile
+import time
+
+from agent_metrics import AgentMetricsStore
+from database import AgentMetricsRepository, ConnectionPool, create_schema
+
+
+def create_metrics_repo():
+    path = os.path.join(tempfile.mkdtemp(), "autocred_test.db")
+    pool = ConnectionPool(path, size=2)
+    with pool.transaction() as conn:
+        create_schema(conn)
+    return AgentMetricsRepository(pool)
+
+
+def test_agent_metrics():
+    print("📈 TESTE - ESTATÍSTICAS DOS AGENTES")
+    print("=" * 50)
+
+    day = 86400
+    now = 1_700_000_000.0
+    saved = {}
+    repo = create_metrics_repo()
+    store = AgentMetricsStore(repo, on_save=saved.update, conversation_gap=3600)
+
+    # 1. Janelas: semana, 24h e última hora somam só os buckets delas
+    for days_ago in range(10):
+        store.record_conversation("agente", now - days_ago * day)
+    store.record_conversion("agente", now - 60)
+    store.record_conversion("agente", now - 8 * day)
+    summary = store.summary("agente", now)
+    assert summary["total"]["conversations"] == 10 and summary["total"]["conversion_rate"] == 20.0
+    assert summary["last_7_days"]["conversations"] == 7
+    assert summary["last_24h"]["conversations"] == 1 and summary["last_hour"]["conversions"] == 1
+    print("✅ 10 conversas em 10 dias: 7 na semana, 1 nas últimas 24h")
+
+    # 2. Webhook: conversa por contato, conversão única, tempo de resposta no histograma
+    store.record_inbound("agente", "5511@s.whatsapp.net", now, conversion=True)
+    store.record_inbound("agente", "5511@s.whatsapp.net", now + 10, conversion=True)
+    store.record_outbound("agente", "5511@s.whatsapp.net", now + 40)
+    store.record_outbound("agente", "5511@s.whatsapp.net", now + 50)
+    last_hour = store.summary("agente", now + 60)["last_hour"]
+    assert last_hour["conversations"] == 2 and last_hour["conversions"] == 2 and last_hour["messages"] == 2
+    assert last_hour["responses"] == 1 and last_hour["average_response_time"] == 40
+    store.record_inbound("agente", "5511@s.whatsapp.net", now + 2 * 3600)
+    histogram = store.summary("agente", now)["response_time_histogram"]
+    assert histogram["<=60s"] == 1 and sum(histogram.values()) == 1
+    assert store.summary("agente", now + 2 * 3600)["total"]["conversations"] == 12
+    print("✅ Webhook: nova conversa depois do intervalo, uma conversão por conversa, espera de 40s")
+
+    # 3. Bucket reaproveitado quando o anel dá a volta; evento mais antigo que o anel é ignorado
+    store.record_message("outro", now)
+    store.record_message("outro", now + 60 * 60)
+    store.record_message("outro", now - 60 * 60)
+    assert store.window("outro", "minute", 60, now + 60 * 60)[2] == 1
+    assert store.summary("outro", now + 60 * 60)["total"]["messages"] == 3
+    print("✅ Anel de minutos reaproveitado sem misturar horas diferentes")
+
+    # 3b. Visão geral do dashboard: só os agentes pedidos; ativo = atividade nas últimas 24h
+    overview = store.overview(["agente", "outro", "sem-eventos"], now=now + 2 * day)
+    assert overview["active"] == 0 and overview["total"]["conversations"] == 12
+    overview = store.overview(["agente", "outro"], now=now + 60 * 60)
+    assert overview["active"] == 2 and overview["total"]["messages"] == 6
+    assert overview["last_24h"]["conversations"] == 2 and overview["last_24h"]["messages"] == 5
+    print("✅ Visão geral: conversas somadas e agentes ativos nas últimas 24h")
+
+    # 4. Gravação em BLOB e recarga; performance_stats atualizado
+    assert store.save() == 2 and store.save() == 0
+    assert saved["agente"]["total_conversations"] == 12
+    reloaded = AgentMetricsStore(repo)
+    assert reloaded.load() == 2
+    assert reloaded.summary("agente", now + 60) == store.summary("agente", now + 60)
+    print(f"✅ Buckets gravados ({len(repo.get('agente')['buckets'])} bytes por agente) e recarregados")
+
+    # 5. Leitura em O(buckets), independente do volume de eventos
+    for i in range(100000):
+        store.record_message("volume", now + i * 5)
+    started = time.perf_counter()
+    for _ in range(100):
+        summary = store.summary("volume", now + 100000 * 5)
+    elapsed = (time.perf_counter() - started) / 100
+    assert summary["total"]["messages"] == 100000
+    assert elapsed < 0.005, elapsed
+    print(f"✅ 100 mil eventos, resumo em {elapsed * 1e3:.2f}ms")
+
+
+if __name__ == "__main__":
+    test_agent_metrics()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Teste do pipeline de respostas automáticas do WhatsApp (auto_reply.py)
+"""
+
+import asyncio
+
+from auto_reply import AutoReplyPipeline
+
+
+def test_auto_reply_pipeline():
+    print("🤖 TESTE - RESPOSTAS AUTOMÁTICAS")
+    print("=" * 50)
+
+    sent = []
+    active = {}
+    peak = {}
+
+    async def generate(job):
+        if job["text"] == "sem resposta":
+            return None
+        return f"re: {job['text']}"
+
+    async def send(instance, contact, text):
+        active[instance] = active.get(instance, 0) + 1
+        peak[instance] = max(peak.get(instance, 0), active[instance])
+        await asyncio.sleep(0.01)
+        active[instance] -= 1
+        sent.append((instance, contact, text))
+        if instance == "fora":
+            return {"success": False, "error": "instância desconectada"}
+        if instance == "dev":
+            return {"success": True, "data": {"simulated": True}}
+        return {"success": True}
+
+    # 1. Limite por instância e ordem das respostas de cada contato
+    async def run_limits():
+        pipeline = AutoReplyPipeline(generate, send, concurrency=2, queue_size=50)
+        for i in range(30):
+            for instance in ("a", "b"):
+                assert pipeline.submit(instance, "agente", f"contato{i % 5}", f"msg {i}")
+        await pipeline.drain()
+        return pipeline.stats()
+
+    stats = asyncio.run(run_limits())
+    assert stats["sent"] == 60 and stats["active_workers"] == 0 and stats["pending"] == 0
+    assert stats["instances"] == 0
+    assert peak == {"a": 2, "b": 2}, peak
+    replies = [text for instance, contact, text in sent if instance == "a" and contact == "contato3"]
+    assert replies == [f"re: msg {i}" for i in range(3, 30, 5)]
+    print(f"✅ 60 respostas em 2 instâncias, no máximo {peak['a']} envios simultâneos por instância, ordem por contato mantida")
+    print("✅ Filas das instâncias removidas quando esvaziam")
+
+    # 2. Backpressure: fila cheia recusa sem esperar; outras instâncias não são afetadas
+    async def run_backpressure():
+        pipeline = AutoReplyPipeline(generate, send, concurrency=1, queue_size=3)
+        accepted = [pipeline.submit("lotada", "agente", "5511", f"msg {i}") for i in range(6)]
+        other = pipeline.submit("livre", "agente", "5511", "oi")
+        await pipeline.drain()
+        return accepted, other, pipeline.stats()
+
+    accepted, other, stats = asyncio.run(run_backpressure())
+    assert accepted == [True] * 3 + [False] * 3 and other
+    assert stats["rejected"] == 3 and stats["sent"] == 4
+    print("✅ Fila cheia recusa na hora (3 recusadas), outra instância segue respondendo")
+
+    # 3. Sem resposta, falha no envio, envio simulado e latência por etapa
+    async def run_latency():
+        pipeline = AutoReplyPipeline(generate, send, concurrency=1)
+        pipeline.submit("a", "agente", "c1", "sem resposta")
+        pipeline.submit("fora", "agente", "c1", "oi")
+        pipeline.submit("dev", "agente", "c1", "oi")
+        for i in range(10):
+            pipeline.submit("a", "agente", "c1", f"msg {i}")
+        await pipeline.drain()
+        return pipeline.stats()
+
+    stats = asyncio.run(run_latency())
+    assert stats["skipped"] == 1 and stats["failed"] == 1 and stats["sent"] == 10
+    assert stats["simulated"] == 1
+    latency = stats["latency"]
+    assert latency["total"]["samples"] == 10 and latency["send"]["p50_ms"] >= 10
+    assert latency["queue"]["max_ms"] >= latency["queue"]["p50_ms"] > 0
+    print(f"✅ Latência medida: total p50 {latency['total']['p50_ms']}ms / p95 {latency['total']['p95_ms']}ms")
+
+
+if __name__ == "__main__":
+    test_auto_reply_pipeline()
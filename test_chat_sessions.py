@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Teste do armazenamento de sessões de chat (chat_sessions.py)
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from chat_sessions import ChatSessionStore
+from database import ChatSessionRepository, ConnectionPool, create_schema
+
+
+def create_sessions_repo():
+    path = os.path.join(tempfile.mkdtemp(), "autocred_test.db")
+    pool = ConnectionPool(path, size=2)
+    with pool.transaction() as conn:
+        create_schema(conn)
+    return ChatSessionRepository(pool)
+
+
+def test_chat_sessions():
+    print("💬 TESTE - SESSÕES DE CHAT")
+    print("=" * 50)
+
+    repo = create_sessions_repo()
+
+    # 1. Ring buffer: só os últimos turnos ficam
+    store = ChatSessionStore(repo, max_turns=4, max_chars=10)
+    session = store.get_or_create("agente", "s1")
+    for i in range(10):
+        store.append(session, "user", f"mensagem número {i}")
+    turns = store.history("agente", "s1")
+    assert [turn["text"] for turn in turns] == ["mensagem n"] * 4
+    assert session.turn_count == 10 and len(session.turns) == 4
+    assert store.history("outro-agente", "s1") is None
+    print("✅ Buffer fixo por sessão, texto limitado e sessão separada por agente")
+
+    # 1b. Troca (pergunta + resposta) atômica: mensagens simultâneas na mesma sessão
+    store = ChatSessionStore(None)
+    session = store.get_or_create("agente", "simultanea")
+    results = []
+
+    def respond(first_turn):
+        time.sleep(0.001)
+        return ("olá" if first_turn else "certo"), {"conversion": True}
+
+    def chat():
+        results.append(store.exchange(session, "quero contratar", respond))
+
+    threads = [threading.Thread(target=chat) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(result["first_turn"] for result in results) == 1
+    assert sum(result["new_conversion"] for result in results) == 1
+    assert sorted(result["turn_count"] for result in results) == list(range(2, 17, 2))
+    assert [turn["role"] for turn in session.turns][:4] == ["user", "agent", "user", "agent"]
+    print("✅ 8 mensagens simultâneas: um primeiro turno, uma conversão, turnos intercalados")
+
+    # 2. Teto global: as menos usadas vão para o SQLite e voltam quando a conversa continua
+    store = ChatSessionStore(repo, max_turns=4, max_sessions=100, spill_batch=10)
+    for i in range(250):
+        store.append(store.get_or_create("agente", f"c{i}"), "user", f"oi {i}")
+    store.flush_spilled()
+    assert len(store) == 100 and store.evicted == 150 and store.spilled == 150
+    restored = store.get("agente", "c3")
+    assert [turn["text"] for turn in restored.turns] == ["oi 3"] and store.restored == 1
+    print("✅ 250 sessões com teto de 100: 150 gravadas no SQLite, relidas sob demanda")
+
+    # 3. TTL de inatividade
+    store = ChatSessionStore(repo, idle_ttl=0.05)
+    store.append(store.get_or_create("agente", "parada"), "user", "volto já")
+    time.sleep(0.1)
+    store.append(store.get_or_create("agente", "nova"), "user", "oi")
+    assert len(store) == 1 and store.expired == 1
+    store.close()
+    assert store.history("agente", "parada")[0]["text"] == "volto já"
+    print("✅ Sessão parada saiu da memória e foi gravada")
+
+    # 4. stats() só lê; falha no banco não perde as sessões despejadas
+    store = ChatSessionStore(repo, idle_ttl=0.05)
+    store.append(store.get_or_create("agente", "lenta"), "user", "oi")
+    time.sleep(0.1)
+    stats = store.stats()
+    assert stats["sessions"] == 1 and stats["expirable"] == 1 and stats["expired"] == 0
+    save_many = repo.save_many
+    repo.save_many = lambda records: (_ for _ in ()).throw(sqlite3.OperationalError("database is locked"))
+    try:
+        store.get("agente", "outra")
+        try:
+            store.flush_spilled()
+            assert False, "falha do banco deveria propagar"
+        except sqlite3.OperationalError:
+            pass
+        assert store.stats()["pending_spill"] == 1
+        assert store.history("agente", "lenta")[0]["text"] == "oi"
+    finally:
+        repo.save_many = save_many
+    store.close()
+    assert ChatSessionStore(repo).history("agente", "lenta")[0]["text"] == "oi"
+    print("✅ stats() sem efeito colateral; sessões mantidas quando a gravação falha")
+
+    # 4b. Banco fora por muito tempo: fila de gravação limitada em turnos e tentativas espaçadas
+    calls = []
+
+    def failing_save(records):
+        calls.append(len(records))
+        raise sqlite3.OperationalError("database is locked")
+
+    store = ChatSessionStore(repo, max_sessions=1, spill_batch=2, spill_max_turns=6)
+    repo.save_many = failing_save
+    try:
+        for i in range(10):
+            session = store.get_or_create("agente", f"fora{i}")
+            store.append(session, "user", "oi")
+            store.append(session, "agent", "olá")
+        stats = store.stats()
+        assert calls == [2], calls
+        assert stats["pending_spill_turns"] == 6 and stats["pending_spill"] == 3
+        assert stats["dropped"] == 6 and store.history("agente", "fora0") is None
+    finally:
+        repo.save_many = save_many
+    assert store.flush_spilled() == 3 and store.stats()["pending_spill_turns"] == 0
+    print("✅ Banco fora: fila limitada a 6 turnos (6 sessões antigas descartadas), uma tentativa até a espera passar")
+
+    # 5. Memória estável com dezenas de milhares de conversas
+    store = ChatSessionStore(None, max_turns=10, max_sessions=2000)
+    tracemalloc.start()
+    for i in range(20000):
+        session = store.get_or_create("agente", f"m{i}")
+        for _ in range(3):
+            store.append(session, "user", "quero saber sobre crédito consignado")
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(store) == 2000
+    assert current < 20 * 1024 * 1024, current
+    print(f"✅ 20k conversas com teto de 2k sessões: {current / 1024 / 1024:.1f}MB em memória")
+
+
+if __name__ == "__main__":
+    test_chat_sessions()
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Teste da camada de repositórios SQLite (database.py)
+"""
+
+import os
+import tempfile
+
+import sqlite3
+
+from database import (
+    create_schema, ConnectionPool, LeadRepository, ClientRepository,
+    ContractRepository, AgentRepository, MessageRepository, CampaignContactRepository, normalize_cpf, normalize_phone,
+    search_records
+)
+
+
+def create_test_pool():
+    path = os.path.join(tempfile.mkdtemp(), "autocred_test.db")
+    pool = ConnectionPool(path, size=2)
+    with pool.transaction() as conn:
+        create_schema(conn)
+    return pool
+
+
+def test_repositories():
+    print("🗄️ TESTE - REPOSITÓRIOS SQLITE")
+    print("=" * 50)
+
+    pool = create_test_pool()
+    leads = LeadRepository(pool)
+    clients = ClientRepository(pool)
+    contracts = ContractRepository(pool)
+    agents = AgentRepository(pool)
+
+    # 1. Modo WAL ativo
+    with pool.connection() as conn:
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert journal_mode == "wal"
+    print("✅ Modo WAL ativo")
+
+    # 2. CRUD de leads
+    lead = {
+        "id": "lead-1",
+        "name": "João Silva Teste",
+        "cpf": "123.456.789-01",
+        "phone": "(11) 98765-4321",
+        "source": "Ura",
+        "modality": "Portabilidade",
+        "status": "Novo",
+        "assignedTo": "Admin AutoCred",
+        "createdAt": "2025-06-01T10:00:00",
+        "installment": "R$ 450,00",
+        "outstandingBalance": "R$ 12.500,00",
+        "observations": None
+    }
+    leads.insert(lead)
+    assert leads.get("lead-1") == lead
+    assert leads.update("lead-1", {"status": "Aguardando retorno"})["status"] == "Aguardando retorno"
+    assert leads.update("inexistente", {"status": "Novo"}) is None
+    print("✅ Lead inserido, lido e atualizado")
+
+    found = leads.get_many(["lead-1", "inexistente", "lead-1"])
+    assert list(found) == ["lead-1"]
+    print("✅ Busca em lote pela chave primária")
+
+    # 3. Transação: cliente + contrato juntos, rollback em caso de erro
+    try:
+        with pool.transaction() as conn:
+            clients.insert({"id": "c-1", "name": "João", "cpf": "1", "phone": "2", "createdAt": "2025-06-01"}, conn=conn)
+            contracts.insert({"id": "k-1", "clientName": "João", "createdAt": "2025-06-01"}, conn=conn)
+            raise RuntimeError("falha simulada")
+    except RuntimeError:
+        pass
+    assert clients.count() == 0 and contracts.count() == 0
+    print("✅ Rollback desfez cliente e contrato")
+
+    # 4. Campos JSON dos agentes
+    agents.insert({
+        "id": "a-1",
+        "name": "Carla",
+        "created_at": "2025-06-01",
+        "configuration": {"whatsapp_instance": "autocred_agent_1"},
+        "performance_stats": {"total_conversations": 0}
+    })
+    assert agents.get("a-1")["configuration"]["whatsapp_instance"] == "autocred_agent_1"
+    print("✅ Configuração do agente preservada em JSON")
+
+    # 5. Exclusão
+    assert leads.delete("lead-1") is True
+    assert leads.delete("lead-1") is False
+    print("✅ Lead excluído")
+
+    pool.close_all()
+    print("\n🎉 Repositórios funcionando!")
+
+
+def test_keyset_pagination():
+    print("📄 TESTE - PAGINAÇÃO POR CURSOR")
+    print("=" * 50)
+
+    pool = create_test_pool()
+    clients = ClientRepository(pool)
+    clients.insert_many([
+        {
+            "id": f"c-{i:03d}",
+            "name": f"Cliente {i:03d}",
+            "cpf": str(i),
+            "phone": str(i),
+            "status": "vip" if i % 3 == 0 else "ativo",
+            "createdAt": f"2025-05-{(i % 28) + 1:02d}T10:00:00"
+        }
+        for i in range(120)
+    ])
+
+    # 1. Percorrer todas as páginas de clientes VIP sem repetir nenhum
+    seen = []
+    cursor = None
+    while True:
+        items, cursor = clients.paginate(limit=7, cursor=cursor, filters={"status": "vip"})
+        seen.extend(item["id"] for item in items)
+        if cursor is None:
+            break
+    assert len(seen) == 40 and len(set(seen)) == 40
+    print(f"✅ {len(seen)} clientes VIP em páginas de 7, sem repetição")
+
+    # 2. Ordenação por nome e intervalo de datas
+    items, _ = clients.paginate(limit=3, sort="name", descending=False)
+    assert [item["name"] for item in items] == ["Cliente 000", "Cliente 001", "Cliente 002"]
+    items, _ = clients.paginate(limit=500, created_from="2025-05-01", created_to="2025-05-01T23:59:59")
+    assert all(item["createdAt"].startswith("2025-05-01") for item in items) and len(items) == 5
+    print("✅ Ordenação por nome e filtro por data funcionando")
+
+    # 3. Cursor inválido é rejeitado
+    try:
+        clients.paginate(cursor="invalido")
+        assert False, "cursor inválido deveria falhar"
+    except ValueError:
+        print("✅ Cursor inválido rejeitado")
+
+    pool.close_all()
+
+
+def test_cpf_phone_indexes():
+    print("🔎 TESTE - ÍNDICES DE CPF E TELEFONE")
+    print("=" * 50)
+
+    assert normalize_cpf("123.456.789-01") == "12345678901"
+    assert normalize_cpf("1234567890") == "01234567890"
+    assert normalize_phone("+55 (11) 98765-4321") == "11987654321"
+    print("✅ Normalização de CPF e telefone")
+
+    pool = create_test_pool()
+    leads = LeadRepository(pool)
+    leads.insert({"id": "l-1", "name": "Maria", "cpf": "111.222.333-44", "phone": "(11) 91234-5678", "createdAt": "2025-06-01"})
+
+    # 1. Busca O(1) pelo índice em memória
+    assert leads.find_id_by("phone_normalized", normalize_phone("5511912345678")) == "l-1"
+    assert leads.find_by("cpf_normalized", normalize_cpf("11122233344"))["name"] == "Maria"
+    print("✅ Lead encontrado por CPF e telefone")
+
+    # 2. Índice único no banco rejeita duplicidade
+    try:
+        leads.insert({"id": "l-2", "name": "Outra", "cpf": "999", "phone": "11 91234 5678", "createdAt": "2025-06-01"})
+        assert False, "telefone duplicado deveria falhar"
+    except sqlite3.IntegrityError:
+        print("✅ Telefone duplicado rejeitado pelo banco")
+
+    # 3. Rollback não deixa lixo no índice em memória
+    try:
+        with pool.transaction() as conn:
+            leads.insert({"id": "l-3", "name": "Temp", "cpf": "555", "phone": "21999990000", "createdAt": "2025-06-01"}, conn=conn)
+            raise RuntimeError("falha simulada")
+    except RuntimeError:
+        pass
+    assert leads.find_id_by("phone_normalized", "21999990000") is None
+    print("✅ Índice em memória respeita rollback")
+
+    # Dentro da transação a busca vai ao banco: enxerga o que ainda não foi confirmado
+    with pool.transaction() as conn:
+        leads.insert({"id": "l-4", "name": "Nova", "cpf": "777", "phone": "31999990000", "createdAt": "2025-06-01"}, conn=conn)
+        assert leads.find_id_by("phone_normalized", "31999990000") is None
+        assert leads.find_by("phone_normalized", "31999990000", conn=conn)["id"] == "l-4"
+        # Mesma condição do índice único parcial: busca pelo índice, não varredura
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM crm_leads WHERE cpf_normalized = ? "
+                            "AND cpf_normalized <> '' LIMIT 1", ("777",)).fetchall()
+        assert "USING INDEX" in plan[0][3], plan
+        found = leads.find_many_by("phone_normalized", ["31999990000", "", "00000000000"], conn=conn)
+        assert list(found) == ["31999990000"] and found["31999990000"]["id"] == "l-4"
+    leads.delete("l-4")
+    print("✅ Busca por CPF/telefone dentro da transação")
+
+    # 4. Atualização e exclusão mantêm o índice coerente
+    leads.update("l-1", {"phone": "(11) 90000-0000"})
+    assert leads.find_id_by("phone_normalized", "11912345678") is None
+    assert leads.find_id_by("phone_normalized", "11900000000") == "l-1"
+    leads.delete("l-1")
+    assert leads.find_id_by("cpf_normalized", "11122233344") is None
+    print("✅ Índice atualizado após update e delete")
+
+    pool.close_all()
+
+
+def test_full_text_search():
+    print("🔍 TESTE - BUSCA TEXTUAL")
+    print("=" * 50)
+
+    pool = create_test_pool()
+    leads = LeadRepository(pool)
+    clients = ClientRepository(pool)
+    contracts = ContractRepository(pool)
+    repositories = {"lead": leads, "client": clients, "contract": contracts}
+
+    leads.insert({"id": "l-1", "name": "José Conceição", "cpf": "123.456.789-01", "phone": "(11) 98765-4321",
+                  "observations": "Cliente prefere contato à tarde", "createdAt": "2025-06-01"})
+    leads.insert({"id": "l-2", "name": "Maria Souza", "cpf": "98765432100", "phone": "21912345678",
+                  "observations": "Indicada pelo José", "createdAt": "2025-06-02"})
+    clients.insert({"id": "c-1", "name": "Joselito Ramos", "cpf": "55566677788", "phone": "31999990000",
+                    "createdAt": "2025-06-03"})
+    contracts.insert({"id": "k-1", "clientName": "Maria Souza", "clientCPF": "98765432100",
+                      "planName": "Portabilidade Premium", "createdAt": "2025-06-04"})
+
+    # 1. Sem acento, parcial e ranqueado pelo nome
+    results, _ = search_records("jose", repositories=repositories)
+    assert {r["id"] for r in results[:2]} == {"l-1", "c-1"} and results[2]["id"] == "l-2"
+    print("✅ 'jose' encontra José, Joselito e a observação")
+
+    # 2. CPF e telefone parciais, com ou sem máscara
+    results, _ = search_records("456.789", repositories=repositories)
+    assert [r["id"] for r in results] == ["l-1"]
+    results, _ = search_records("91234", repositories=repositories)
+    assert [r["id"] for r in results] == ["l-2"]
+    print("✅ Busca por trechos de CPF e telefone")
+
+    # 3. Filtro por tipo e múltiplos termos
+    results, _ = search_records("maria souza", entities=["contract"], repositories=repositories)
+    assert [(r["type"], r["id"]) for r in results] == [("contract", "k-1")]
+    print("✅ Filtro por tipo de registro")
+
+    # 4. Índice acompanha update e delete
+    leads.update("l-2", {"name": "Mariana Lima"})
+    results, _ = search_records("lima", repositories=repositories)
+    assert [r["id"] for r in results] == ["l-2"]
+    leads.delete("l-1")
+    results, _ = search_records("conceicao", repositories=repositories)
+    assert results == []
+    print("✅ Índice atualizado após update e delete")
+
+    # 5. Termos curtos demais são rejeitados
+    try:
+        search_records("jo", repositories=repositories)
+        assert False, "termo curto deveria falhar"
+    except ValueError:
+        print("✅ Consulta sem termos válidos rejeitada")
+
+    pool.close_all()
+
+
+def test_dashboard_aggregates():
+    print("📊 TESTE - AGREGADOS DO DASHBOARD")
+    print("=" * 50)
+
+    pool = create_test_pool()
+    leads = LeadRepository(pool)
+    contracts = ContractRepository(pool)
+
+    contracts.insert_many([
+        {"id": f"k-{i}", "clientName": f"Cliente {i}", "status": "active", "modality": "Portabilidade",
+         "createdBy": "Ana", "value": 1000.0, "createdAt": f"2025-0{(i % 6) + 1}-10T10:00:00"}
+        for i in range(12)
+    ])
+    leads.insert({"id": "l-1", "name": "Lead", "cpf": "1", "phone": "1", "status": "Novo", "createdAt": "2025-06-01"})
+
+    # 1. Contagens e somas por dimensão e calendário
+    assert contracts.aggregate("total", "")["total"] == 12000.0
+    assert contracts.aggregate("month", "2025-06") == {"count": 2, "total": 2000.0}
+    assert contracts.aggregate("quarter", "2025-Q2")["total"] == 6000.0
+    assert contracts.aggregate("year", "2025")["count"] == 12
+    print("✅ Receita por mês, trimestre e ano")
+
+    # 2. Update e delete movem os contadores entre buckets
+    contracts.update("k-0", {"status": "completed", "value": 500.0})
+    contracts.delete("k-1")
+    leads.update("l-1", {"status": "Convertido"})
+    by_status = contracts.aggregates("status")
+    assert by_status["active"]["count"] == 10 and by_status["completed"] == {"count": 1, "total": 500.0}
+    assert leads.aggregates("status") == {"Convertido": {"count": 1, "total": 0.0}}
+    print("✅ Contadores acompanham update e delete")
+
+    # 3. Rollback não altera os agregados
+    try:
+        with pool.transaction() as conn:
+            contracts.insert({"id": "k-x", "clientName": "X", "value": 99.0, "createdAt": "2025-06-01"}, conn=conn)
+            raise RuntimeError("falha simulada")
+    except RuntimeError:
+        pass
+    assert contracts.aggregate("total", "")["count"] == 11
+    print("✅ Rollback preserva os agregados")
+
+    # 4. Incremental == recalculado do zero
+    with pool.connection() as conn:
+        incremental = conn.execute(
+            "SELECT dimension, bucket, count, total FROM dashboard_counters WHERE count <> 0 ORDER BY 1, 2"
+        ).fetchall()
+    contracts.rebuild_aggregates()
+    leads.rebuild_aggregates()
+    with pool.connection() as conn:
+        rebuilt = conn.execute(
+            "SELECT dimension, bucket, count, total FROM dashboard_counters WHERE count <> 0 ORDER BY 1, 2"
+        ).fetchall()
+    assert [tuple(row) for row in incremental] == [tuple(row) for row in rebuilt]
+    print("✅ Agregados incrementais conferem com a reconstrução")
+
+    pool.close_all()
+
+
+def test_message_history():
+    print("\n💬 TESTE - HISTÓRICO DE CONVERSAS")
+    print("=" * 50)
+
+    pool = create_test_pool()
+    messages = MessageRepository(pool)
+    jid = "5511999990000@s.whatsapp.net"
+
+    def message(i, remote_jid=jid, prefix="M"):
+        return {
+            "id": f"agent_a:{prefix}{i}", "instance": "agent_a", "remoteJid": remote_jid,
+            "messageId": f"{prefix}{i}", "fromMe": i % 2, "text": f"msg {i}",
+            "status": "SERVER_ACK", "timestamp": 1700000000 + i // 3
+        }
+
+    batch = [message(i) for i in range(100)] + [message(i, "outro@s.whatsapp.net", "X") for i in range(10)]
+    assert messages.store_batch(batch, []) == (110, 0)
+    # Reenvio do mesmo lote não duplica
+    assert messages.store_batch(batch[:10], []) == (0, 0)
+    print("✅ Lote gravado sem duplicar reenvios")
+
+    # Status só avança
+    assert messages.store_batch([], [("agent_a:M1", "READ")]) == (0, 1)
+    assert messages.store_batch([], [("agent_a:M1", "DELIVERY_ACK")]) == (0, 0)
+    assert messages.get("agent_a:M1")["status"] == "READ"
+    assert messages.get("agent_a:M1")["fromMe"] is True
+    print("✅ Status atrasado não regride a mensagem")
+
+    seen = []
+    items, before = messages.history("agent_a", jid, limit=30)
+    assert [item["text"] for item in items[-2:]] == ["msg 98", "msg 99"]
+    while True:
+        seen.extend(item["messageId"] for item in items)
+        timestamps = [item["timestamp"] for item in items]
+        assert timestamps == sorted(timestamps)
+        if before is None:
+            break
+        items, before = messages.history("agent_a", jid, limit=30, before=before)
+    assert sorted(seen) == sorted(f"M{i}" for i in range(100))
+    print("✅ Paginação para trás percorre a conversa sem repetir mensagens")
+
+    items, _ = messages.history("agent_a", jid, limit=50, before="1700000001")
+    assert [item["messageId"] for item in items] == ["M0", "M1", "M2"]
+
+    with pool.connection() as conn:
+        plan = " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + messages._history_sql,
+                                                        ("agent_a", jid, 1, "", 10)))
+    assert "ix_whatsapp_messages_chat" in plan
+    print("✅ Consulta usa o índice (instância, contato, timestamp)")
+
+    pool.close_all()
+
+
+def test_campaign_contacts():
+    print("\n📇 TESTE - CONTATOS DE CAMPANHA")
+    print("=" * 50)
+
+    pool = create_test_pool()
+    contacts = CampaignContactRepository(pool)
+
+    def batch(start, size):
+        return [
+            {"name": f"C{i}", "phone": f"1199{i:07d}", "customFields": {"parcela": str(i)}}
+            for i in range(start, start + size)
+        ]
+
+    # 1. Lotes acrescentados com posições contínuas
+    contacts.register_list("contacts_x", "2025-06-01T10:00:00")
+    assert contacts.append("contacts_x", batch(0, 1000)) == 1000
+    assert contacts.append("contacts_x", batch(1000, 500)) == 500
+    assert contacts.count_for("contacts_x") == 1500
+    assert contacts.phones("contacts_x", 998, 1002) == [f"1199{i:07d}" for i in range(998, 1002)]
+    print("✅ Lotes gravados em ordem, lidos por faixa de posição")
+
+    # 2. Lista importada adotada pela campanha - nunca os contatos de outra campanha
+    contacts.append("sms_0", batch(0, 10))
+    assert contacts.adopt("sms_0", "sms_1") == 0 and contacts.adopt("contacts_y", "sms_1") == 0
+    assert contacts.count_for("sms_0") == 10
+    assert contacts.adopt("contacts_x", "sms_1") == 1500
+    assert contacts.count_for("contacts_x") == 0
+    page = contacts.contacts("sms_1", 0, 2)
+    assert page[1]["customFields"] == {"parcela": "1"} and page[1]["position"] == 1
+    print("✅ Lista transferida para a campanha")
+
+    assert contacts.delete_campaign("sms_1") == 1500
+    assert contacts.count_for("sms_1") == 0
+    print("✅ Contatos removidos com a campanha")
+
+    # 3. Listas de upload nunca adotadas são apagadas depois do prazo (as sem registro também)
+    contacts.register_list("contacts_velha", "2025-06-01T10:00:00")
+    contacts.append("contacts_velha", batch(0, 5))
+    contacts.register_list("contacts_nova", "2025-06-03T10:00:00")
+    contacts.append("contacts_nova", batch(0, 5))
+    contacts.append("contacts_orfa", batch(0, 5))
+    assert contacts.purge_lists_before("2025-06-02T00:00:00") == 10
+    assert contacts.count_for("contacts_nova") == 5 and contacts.count_for("sms_0") == 10
+    print("✅ Listas abandonadas removidas")
+
+    pool.close_all()
+
+
+if __name__ == "__main__":
+    test_repositories()
+    test_keyset_pagination()
+    test_cpf_phone_indexes()
+    test_full_text_search()
+    test_dashboard_aggregates()
+    test_message_history()
+    test_campaign_contacts()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Teste do pub/sub de eventos em tempo real (event_hub.py)
+"""
+
+import asyncio
+
+from event_hub import EventHub
+
+
+def test_event_hub():
+    print("📡 TESTE - EVENTOS EM TEMPO REAL")
+    print("=" * 50)
+
+    async def scenario():
+        hub = EventHub(queue_size=2)
+
+        # 1. Assinante recebe o evento publicado na sua instância
+        async with hub.subscribe("agent_1") as queue:
+            assert hub.publish("agent_1", {"type": "qrcode"}) == 1
+            assert hub.publish("agent_2", {"type": "qrcode"}) == 0
+            assert (await queue.get()) == {"type": "qrcode"}
+            print("✅ Evento entregue só para a instância assinada")
+
+            # 2. Fila cheia descarta o evento mais antigo
+            for i in range(3):
+                hub.publish("agent_1", {"type": "qrcode", "n": i})
+            assert [(await queue.get())["n"] for _ in range(2)] == [1, 2]
+            assert hub.dropped == 1
+            print("✅ Assinante lento recebe os eventos mais recentes")
+
+        assert hub.subscriber_count() == 0
+
+        # 3. wait_for acorda no evento ou desiste no timeout
+        waiter = asyncio.create_task(hub.wait_for("agent_3", timeout=1))
+        await asyncio.sleep(0)
+        hub.publish("agent_3", {"type": "connection", "state": "open"})
+        assert (await waiter)["state"] == "open"
+        assert await hub.wait_for("agent_3", timeout=0.01) is None
+        print("✅ wait_for sem bloquear o event loop")
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_event_hub()
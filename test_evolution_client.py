@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Teste do cliente assíncrono da Evolution API (evolution_client.py)
+"""
+
+import asyncio
+
+import httpx
+
+from evolution_client import EvolutionClient
+
+
+def test_evolution_client():
+    print("📱 TESTE - CLIENTE EVOLUTION ASSÍNCRONO")
+    print("=" * 50)
+
+    active = 0
+    peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if request.url.path.startswith("/instance/connectionState/"):
+            assert request.headers["apikey"] == "chave"
+            return httpx.Response(200, json={"instance": {"state": "open"}})
+        return httpx.Response(500, text="erro")
+
+    client = EvolutionClient(
+        "http://evolution.local", "chave", max_concurrency=3,
+        transport=httpx.MockTransport(handler)
+    )
+
+    async def scenario():
+        results = await asyncio.gather(*[
+            client.request("GET", f"/instance/connectionState/agent_{i}") for i in range(12)
+        ])
+        failed = await client.request("POST", "/instance/create", {"instanceName": "x"})
+        unsupported = await client.request("PATCH", "/instance/create")
+        await client.close()
+        return results, failed, unsupported
+
+    results, failed, unsupported = asyncio.run(scenario())
+
+    # 1. Respostas no formato do helper antigo
+    assert all(r == {"success": True, "data": {"instance": {"state": "open"}}} for r in results)
+    assert failed["success"] is False and "500" in failed["error"]
+    assert unsupported["success"] is False
+    print("✅ Formato {success, data | error} preservado")
+
+    # 2. Concorrência limitada pelo semáforo
+    assert peak <= 3
+    print(f"✅ No máximo {peak} chamadas simultâneas")
+
+    # 3. Timeout por endpoint (prefixo mais longo vence)
+    assert client.timeout_for("/instance/create") == 30.0
+    assert client.timeout_for("/instance/connectionState/agent_1") == 5.0
+    assert client.timeout_for("/chat/findMessages/x") == 10.0
+    print("✅ Timeouts por endpoint")
+
+
+if __name__ == "__main__":
+    test_evolution_client()
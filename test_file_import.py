@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Teste da leitura em streaming de planilhas CSV/XLSX (file_import.py)
+"""
+
+import io
+import zipfile
+from decimal import Decimal
+
+import file_import
+from file_import import ImportFileError, iter_rows, parse_brl, format_brl, sniff_encoding
+
+
+def make_xlsx(rows):
+    """XLSX mínimo: textos inline e números como valores"""
+    def cell(reference, value):
+        if isinstance(value, (int, float)):
+            return f'<c r="{reference}"><v>{value}</v></c>'
+        return f'<c r="{reference}" t="inlineStr"><is><t>{value}</t></is></c>'
+
+    sheet_rows = "".join(
+        f'<row r="{i + 1}">' + "".join(cell(f"{chr(65 + j)}{i + 1}", v) for j, v in enumerate(row)) + "</row>"
+        for i, row in enumerate(rows)
+    )
+    main_ns = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    rel_ns = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(
+            "xl/workbook.xml",
+            f'<workbook xmlns="{main_ns}" xmlns:r="{rel_ns}"><sheets>'
+            '<sheet name="Leads" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        )
+        archive.writestr(
+            "xl/_rels/workbook.xml.rels",
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="worksheets/leads.xml"/></Relationships>'
+        )
+        archive.writestr(
+            "xl/worksheets/leads.xml",
+            f'<worksheet xmlns="{main_ns}"><sheetData>{sheet_rows}</sheetData></worksheet>'
+        )
+    return buffer.getvalue()
+
+
+def test_csv_streaming():
+    print("📥 TESTE - IMPORTAÇÃO CSV")
+    print("=" * 50)
+
+    # 1. Excel brasileiro: cp1252, ponto e vírgula, cabeçalhos com acento
+    content = "Nome;CPF;Observações\nJoão;529.982.247-25;Ligar à tarde\n;;\nMaria;11144477735;\n"
+    rows = list(iter_rows("leads.csv", io.BytesIO(content.encode("cp1252"))))
+    assert rows == [
+        {"nome": "João", "cpf": "529.982.247-25", "observacoes": "Ligar à tarde"},
+        {"nome": "Maria", "cpf": "11144477735", "observacoes": ""},
+    ]
+    print("✅ cp1252 e delimitador ';' detectados, linhas vazias ignoradas")
+
+    # 2. UTF-8 com BOM e vírgula
+    assert sniff_encoding("\ufeffnome".encode("utf-8")) == "utf-8-sig"
+    rows = list(iter_rows("leads.csv", io.BytesIO("\ufeffNome,Telefone\nJosé,11999990000\n".encode("utf-8"))))
+    assert rows == [{"nome": "José", "telefone": "11999990000"}]
+    print("✅ UTF-8 com BOM")
+
+
+def test_xlsx_streaming():
+    print("📊 TESTE - IMPORTAÇÃO XLSX")
+    print("=" * 50)
+
+    content = make_xlsx([
+        ["Nome", "CPF", "Saldo Devedor"],
+        ["Ana", 52998224725, 1500.5],
+        ["Bia", "111.444.777-35", ""],
+    ])
+    rows = list(iter_rows("planilha.xlsx", io.BytesIO(content)))
+    assert rows == [
+        {"nome": "Ana", "cpf": "52998224725", "saldo devedor": "1500.5"},
+        {"nome": "Bia", "cpf": "111.444.777-35", "saldo devedor": ""},
+    ]
+    print("✅ Primeira aba lida, números sem notação científica")
+
+    try:
+        list(iter_rows("planilha.xlsx", io.BytesIO(b"PK\x03\x04corrompido")))
+        assert False, "XLSX corrompido deveria falhar"
+    except ImportFileError:
+        print("✅ XLSX corrompido rejeitado")
+
+    # XML truncado no meio da aba: erro de leitura, não exceção genérica
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(content)) as source, zipfile.ZipFile(buffer, "w") as target:
+        for name in source.namelist():
+            data = source.read(name)
+            target.writestr(name, data[:len(data) // 2] if name.endswith("leads.xml") else data)
+    try:
+        list(iter_rows("planilha.xlsx", io.BytesIO(buffer.getvalue())))
+        assert False, "XLSX truncado deveria falhar"
+    except ImportFileError:
+        print("✅ XLSX truncado rejeitado")
+
+    # Tabela de textos compartilhados acima do teto
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(content)) as source, zipfile.ZipFile(buffer, "w") as target:
+        for name in source.namelist():
+            target.writestr(name, source.read(name))
+        strings = "".join(f"<si><t>texto {i}</t></si>" for i in range(100))
+        target.writestr("xl/sharedStrings.xml",
+                        f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">{strings}</sst>')
+    limit = file_import.XLSX_MAX_SHARED_STRINGS
+    file_import.XLSX_MAX_SHARED_STRINGS = 50
+    try:
+        list(iter_rows("planilha.xlsx", io.BytesIO(buffer.getvalue())))
+        assert False, "textos compartilhados acima do teto deveriam falhar"
+    except ImportFileError:
+        print("✅ Textos compartilhados limitados")
+    finally:
+        file_import.XLSX_MAX_SHARED_STRINGS = limit
+
+
+def test_currency_parsing():
+    print("💰 TESTE - VALORES MONETÁRIOS")
+    print("=" * 50)
+
+    assert parse_brl("R$ 1.234,56") == Decimal("1234.56")
+    assert parse_brl("1234.5") == Decimal("1234.50")
+    assert parse_brl("1.234") == Decimal("1234.00")
+    assert parse_brl("450,5") == Decimal("450.50")
+    assert parse_brl("") is None
+    assert format_brl(Decimal("1234567.8")) == "R$ 1.234.567,80"
+    try:
+        parse_brl("mil reais")
+        assert False, "valor inválido deveria falhar"
+    except ValueError:
+        print("✅ Valores em reais normalizados")
+
+
+if __name__ == "__main__":
+    test_csv_streaming()
+    test_xlsx_streaming()
+    test_currency_parsing()
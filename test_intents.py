@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Teste da classificação de intenções dos agentes (intents.py)
+"""
+
+import time
+
+from intents import IntentMatcher, compile_intents
+
+
+def test_intent_matcher():
+    print("🎯 TESTE - INTENÇÕES DOS AGENTES")
+    print("=" * 50)
+
+    matcher = IntentMatcher([
+        {"id": "cartao", "keywords": ["cartão", "cartão de crédito", "anuidade"]},
+        {"id": "credito", "keywords": ["crédito", "empresti*"]},
+        {"id": "ajuda", "keywords": ["ajud*"]},
+        {"id": "credito", "keywords": ["ignorada"]},
+    ])
+
+    # 1. Sem acento, maiúsculas e espaços extras
+    assert matcher.classify("Quero um CARTAO  de   Crédito")["id"] == "cartao"
+    assert matcher.classify("preciso de um EMPRÉSTIMO")["id"] == "credito"
+    print("✅ Acentos e maiúsculas ignorados, frase com várias palavras")
+
+    # 2. Prefixo só com *, palavra inteira nos demais; prioridade no empate
+    assert matcher.scores("pode me ajudar? e os empréstimos?") == {"ajuda": 1, "credito": 1}
+    assert matcher.classify("pode me ajudar? e os empréstimos?")["id"] == "credito"
+    assert matcher.classify("crédito, crédito ou ajuda?")["id"] == "credito"
+    assert matcher.classify("ajuda com a anuidade, ajuda!")["id"] == "ajuda"
+    assert matcher.classify("creditos") is None and matcher.classify("ignorada") is None
+    print("✅ Prefixos, palavras inteiras e desempate pela ordem declarada")
+
+    # 3. Compilado uma vez por chave
+    assert compile_intents(("p", "t"), [{"id": "a", "keywords": ["x"]}]) is compile_intents(("p", "t"))
+    print("✅ Matcher reaproveitado por personalidade/template")
+
+    # 4. Centenas de intenções numa passada
+    catalogue = [{"id": f"i{n}", "keywords": [f"produto{n}", f"oferta{n}*", f"plano {n}"]} for n in range(500)]
+    big = IntentMatcher(catalogue)
+    message = "Olá, gostaria de saber mais sobre o plano 499 e a ofertA499especial, obrigado! " * 3
+    assert big.classify(message)["id"] == "i499"
+    started = time.perf_counter()
+    for _ in range(2000):
+        big.classify(message)
+    elapsed = (time.perf_counter() - started) / 2000
+    assert elapsed < 0.002, elapsed
+    print(f"✅ 500 intenções (1500 palavras-chave): {elapsed * 1e6:.0f}µs por mensagem")
+
+
+if __name__ == "__main__":
+    test_intent_matcher()
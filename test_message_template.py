@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Teste dos templates de mensagem personalizados (message_template.py)
+"""
+
+import time
+
+from message_template import compile_template
+
+
+def test_message_template():
+    print("✉️ TESTE - TEMPLATES DE MENSAGEM")
+    print("=" * 50)
+
+    # 1. Campos do contato e das colunas importadas
+    template = compile_template("Olá {nome}, sua parcela de {Parcela} vence dia {vencimento|10}.")
+    assert template.personalized
+    assert template.field_names == ["nome", "parcela", "vencimento"]
+    contact = {"name": "Maria", "phone": "11999990000", "customFields": {"parcela": "R$ 350,00"}}
+    assert template.render(contact) == "Olá Maria, sua parcela de R$ 350,00 vence dia 10."
+    print("✅ {nome}, colunas da planilha e valor padrão")
+
+    # 2. Acentos/maiúsculas no nome do campo e chaves literais
+    template = compile_template("{{ok}} {Nº Contrato} {Saldo_Devedor|-}")
+    rendered = template.render({"customFields": {"no contrato": "123", "saldo devedor": ""}})
+    assert rendered == "{ok} 123 -", rendered
+    print("✅ Nomes normalizados como os cabeçalhos e {{ }} literais")
+
+    # 3. Sem campos: texto fixo, sem formatação por contato
+    template = compile_template("Promoção {válida} só hoje }")
+    assert compile_template("Sem campos aqui").render({}) == "Sem campos aqui"
+    assert compile_template("Sem campos aqui") is compile_template("Sem campos aqui")
+    assert template.missing_fields(["Nome", "Telefone"]) == ["valida"]
+    print("✅ Template fixo e campos ausentes na lista")
+
+    # 4. Renderização em massa
+    template = compile_template("Olá {nome}, parcela {parcela} - contrato {contrato}")
+    contacts = [
+        {"name": f"Cliente {i}", "phone": "", "customFields": {"parcela": str(i), "contrato": f"C{i}"}}
+        for i in range(500000)
+    ]
+    started = time.perf_counter()
+    messages = [template.render(contact) for contact in contacts]
+    elapsed = time.perf_counter() - started
+    assert messages[42] == "Olá Cliente 42, parcela 42 - contrato C42"
+    assert elapsed < 5, elapsed
+    print(f"✅ 500k mensagens renderizadas em {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    test_message_template()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Teste da normalização de telefones (phones.py)
+"""
+
+import time
+
+from phones import normalize_many, normalize_phone, parse_phone, to_e164, to_whatsapp_jid
+
+
+def test_parse_phone():
+    print("📞 TESTE - NORMALIZAÇÃO DE TELEFONES")
+    print("=" * 50)
+
+    # 1. Formatos de entrada diferentes chegam ao mesmo número
+    for value in ("(11) 99999-0000", "+55 11 99999-0000", "5511999990000", "011 99999 0000",
+                  "11.99999.0000", "5511999990000@s.whatsapp.net", 11999990000):
+        phone = parse_phone(value)
+        assert phone.valid and phone.national == "11999990000", value
+    assert to_e164("(11) 99999-0000") == "+5511999990000"
+    assert to_whatsapp_jid("(11) 99999-0000") == "5511999990000@s.whatsapp.net"
+    assert to_whatsapp_jid("120363025@g.us") == "120363025@g.us"
+    print("✅ Formatos nacional, E.164 e JID")
+
+    # 2. Regras de DDD e do nono dígito
+    assert parse_phone("(11) 3333-4444").valid and not parse_phone("(11) 3333-4444").mobile
+    assert parse_phone("(20) 99999-0000").error == "DDD inválido"
+    assert parse_phone("(11) 8888-7777").error == "Celular sem o nono dígito"
+    assert parse_phone("(11) 88888-7777").error == "Celular deve começar com 9"
+    assert parse_phone("123").error == "Quantidade de dígitos inválida"
+    assert parse_phone(None).error == "Telefone vazio"
+    assert to_e164("123") is None and to_whatsapp_jid("123") is None
+    # Chave de deduplicação continua sendo os dígitos nacionais
+    assert normalize_phone("+55 (21) 3333-4444") == "2133334444"
+    print("✅ Validação de DDD e celular")
+
+
+def test_normalize_many():
+    values = ["(11) 99999-0000", "55 21 3333-4444", "", None, "linha\nquebrada 11999990000", "(20) 99999-0000"]
+    batch = normalize_many(values)
+    assert batch.national == ["11999990000", "2133334444", "", "", "11999990000", "20999990000"]
+    assert batch.valid == [True, True, False, False, True, False]
+    assert batch.e164()[:2] == ["+5511999990000", "+552133334444"]
+    assert batch.jids()[2] is None
+    assert batch[5].error == "DDD inválido"
+    # Mesmo resultado do caminho item a item
+    assert batch.valid == [parse_phone(value).valid for value in values]
+
+    contacts = [f"(11) 9{i % 100000:04d}-{i % 10000:04d}" for i in range(1000000)]
+    started = time.perf_counter()
+    batch = normalize_many(contacts)
+    elapsed = time.perf_counter() - started
+    assert len(batch) == 1000000
+    print(f"✅ 1M telefones normalizados em lote em {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    test_parse_phone()
+    test_normalize_many()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Teste do registro indexado por id (registry.py)
+"""
+
+import os
+import tempfile
+import time
+
+from pydantic import BaseModel
+
+from database import AgentRepository, CampaignRepository, ConnectionPool, create_schema
+from registry import Registry
+
+
+class Campaign(BaseModel):
+    id: str
+    name: str
+    message: str
+    contacts: list = []
+    status: str = "draft"
+    created_at: str
+    sent_count: int = 0
+    total_count: int = 0
+
+
+def test_registry():
+    print("🗂️ TESTE - REGISTRO INDEXADO")
+    print("=" * 50)
+
+    path = os.path.join(tempfile.mkdtemp(), "autocred_test.db")
+    pool = ConnectionPool(path, size=2)
+    with pool.transaction() as conn:
+        create_schema(conn)
+    repo = CampaignRepository(pool)
+
+    registry = Registry(repo, factory=lambda record: Campaign(**record), indexes=("status",))
+    for i in range(5):
+        registry.add(Campaign(id=f"sms_{i}", name=f"C{i}", message="oi", created_at=f"2024-01-0{i + 1}"))
+
+    # 1. Busca por id e pertinência com o tipo certo (string)
+    assert "sms_3" in registry and "sms_9" not in registry
+    assert registry["sms_3"].name == "C3" and registry.get("sms_9") is None
+    print("✅ Busca por id em O(1)")
+
+    # 2. Índice secundário acompanha as mudanças
+    registry.update("sms_1", {"status": "sent", "sent_count": 10})
+    registry.update("sms_3", {"status": "sent"})
+    assert [c.id for c in registry.find("status", "sent")] == ["sms_1", "sms_3"]
+    assert registry.count_by("status") == {"draft": 3, "sent": 2}
+    assert registry.find_one("status", "failed") is None
+    print("✅ Índice por status atualizado")
+
+    # 3. Persistência: um registro novo carrega o mesmo estado do banco
+    registry.remove("sms_0")
+    reloaded = Registry(repo, factory=lambda record: Campaign(**record), indexes=("status",))
+    assert reloaded.load() == 4
+    assert reloaded["sms_1"].status == "sent" and reloaded["sms_1"].sent_count == 10
+    assert list(reloaded) == ["sms_1", "sms_2", "sms_3", "sms_4"]
+    assert reloaded.count_by("status") == {"draft": 2, "sent": 2}
+    print("✅ Estado sobrevive ao recarregamento")
+
+    # 4. Índices SQLite para status e data de criação
+    items, _ = repo.paginate(filters={"status": "sent"}, sort="created_at")
+    assert [item["id"] for item in items] == ["sms_3", "sms_1"]
+    with pool.connection() as conn:
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM sms_campaigns WHERE status = ? ORDER BY created_at DESC", ("sent",)
+        ))
+    assert "ix_sms_campaigns_status" in plan
+    print("✅ Consulta por status usa o índice")
+
+    pool.close_all()
+
+
+def test_agent_registry():
+    print("🤖 TESTE - REGISTRO DE AGENTES")
+    print("=" * 50)
+
+    path = os.path.join(tempfile.mkdtemp(), "autocred_test.db")
+    pool = ConnectionPool(path, size=2)
+    with pool.transaction() as conn:
+        create_schema(conn)
+    repo = AgentRepository(pool)
+    indexes = {
+        "whatsapp_instance": lambda agent: (agent.get("configuration") or {}).get("whatsapp_instance"),
+        "superagentes_id": lambda agent: agent.get("superagentes_id")
+    }
+
+    agents = Registry(repo, indexes=indexes)
+    with pool.transaction() as conn:
+        for i in range(3000):
+            repo.insert({
+                "id": f"agent-{i}", "name": f"Agente {i}", "description": "", "personality_id": "vendas_consultivo",
+                "custom_prompt": "", "superagentes_id": f"sa_{i}", "status": "ativo", "created_at": "2024-01-01",
+                "created_by": "admin", "configuration": {"whatsapp_instance": f"autocred_agent_{i}"}
+            }, conn)
+    assert agents.load() == 3000
+
+    # 1. Roteamento instância -> agente e busca pelo id do Superagentes
+    started = time.perf_counter()
+    for i in range(3000):
+        assert agents.find_one("whatsapp_instance", f"autocred_agent_{i}")["id"] == f"agent-{i}"
+    elapsed = time.perf_counter() - started
+    assert agents.find_one("superagentes_id", "sa_42")["name"] == "Agente 42"
+    assert elapsed < 0.1, elapsed
+    print(f"✅ 3000 instâncias roteadas em {elapsed * 1000:.1f}ms")
+
+    # 2. Troca de instância reindexa e persiste; exclusão limpa os índices
+    agents.update("agent-7", {"configuration": {"whatsapp_instance": "vendas_sp"}})
+    agents.remove("agent-8")
+    assert agents.find_one("whatsapp_instance", "autocred_agent_7") is None
+    assert agents.find_one("whatsapp_instance", "autocred_agent_8") is None
+    reloaded = Registry(repo, indexes=indexes)
+    reloaded.load()
+    assert reloaded.find_one("whatsapp_instance", "vendas_sp")["id"] == "agent-7"
+    assert "agent-8" not in reloaded and len(reloaded) == 2999
+    print("✅ Mudança de instância e exclusão refletidas no banco e nos índices")
+
+    pool.close_all()
+
+
+if __name__ == "__main__":
+    test_registry()
+    test_agent_registry()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Teste do disparo de campanhas SMS em lotes (sms_dispatch.py)
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from urllib.parse import parse_qs
+
+import httpx
+
+from database import ConnectionPool, DispatchChunkRepository, create_schema
+from sms_dispatch import SMSDispatcher
+
+
+def create_chunks_repo():
+    path = os.path.join(tempfile.mkdtemp(), "autocred_test.db")
+    pool = ConnectionPool(path, size=2)
+    with pool.transaction() as conn:
+        create_schema(conn)
+    return DispatchChunkRepository(pool)
+
+
+def test_sms_dispatch():
+    print("📨 TESTE - DISPARO SMS EM LOTES")
+    print("=" * 50)
+
+    phones = [f"1199{i:07d}" for i in range(1050)]
+    received = []
+    active = 0
+    peak = 0
+    failing = {"3"}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal active, peak
+        query = parse_qs(request.url.query.decode())
+        numbers = query["numbers"][0].split(",")
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        chunk = str(phones.index(numbers[0]) // 100)
+        if chunk in failing:
+            return httpx.Response(503, text="indisponível")
+        received.append(numbers)
+        assert query["msg"] == ["Olá!"] and query["jobdate"] == ["2030-01-01"]
+        return httpx.Response(200, text=f"camp-{chunk}")
+
+    chunks = create_chunks_repo()
+
+    def dispatcher():
+        return SMSDispatcher(
+            "http://sms.local/v1", "token", "9", chunks, chunk_size=100, concurrency=3,
+            rate_limit=0, retries=2, retry_backoff=0, transport=httpx.MockTransport(handler)
+        )
+
+    async def run(engine):
+        try:
+            return await engine.dispatch("camp", len(phones), lambda s, e: phones[s:e], "Olá!",
+                                         {"jobdate": "2030-01-01"})
+        finally:
+            await engine.close()
+
+    # 1. Lotes do tamanho configurado, em paralelo limitado
+    progress = asyncio.run(run(dispatcher()))
+    assert progress["chunks"] == 11
+    assert progress["sent_chunks"] == 10 and progress["failed_chunks"] == 1
+    assert progress["sent_count"] == 950 and not progress["complete"]
+    assert max(len(numbers) for numbers in received) == 100
+    assert peak <= 3
+    print(f"✅ 11 lotes de até 100 números, pico de {peak} requisições simultâneas")
+
+    # 2. Resultado por lote (com as tentativas)
+    failed = [chunk for chunk in chunks.for_campaign("camp") if chunk["status"] == "failed"]
+    assert len(failed) == 1 and failed[0]["chunkIndex"] == 3 and failed[0]["attempts"] == 2
+    assert "503" in failed[0]["error"]
+    print("✅ Lote com falha registrado com erro e tentativas")
+
+    # 3. Retomada: só o lote que falhou é reenviado
+    failing.clear()
+    received.clear()
+    progress = asyncio.run(run(dispatcher()))
+    assert progress["complete"] and progress["sent_count"] == 1050
+    assert received == [phones[300:400]]
+    print("✅ Retomada reenviou apenas o lote pendente")
+
+    # 4. Limite de requisições por segundo
+    received.clear()
+    limited = SMSDispatcher(
+        "http://sms.local/v1", "token", "9", chunks, chunk_size=100, concurrency=5,
+        rate_limit=20, transport=httpx.MockTransport(handler)
+    )
+    started = time.perf_counter()
+    asyncio.run(limited.dispatch("limitada", 500, lambda s, e: phones[s:e], "Olá!", {"jobdate": "2030-01-01"}))
+    elapsed = time.perf_counter() - started
+    assert len(received) == 5 and elapsed >= 0.2
+    print(f"✅ 5 lotes a 20 req/s levaram {elapsed:.2f}s")
+
+
+def test_personalized_dispatch():
+    print("✉️ TESTE - DISPARO PERSONALIZADO")
+    print("=" * 50)
+
+    contacts = [(f"1198{i:07d}", f"Olá {'Ana' if i % 2 else 'Bia'}") for i in range(10)]
+    requests = []
+    fail_ana = True
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        query = parse_qs(request.url.query.decode())
+        if fail_ana and query["msg"] == ["Olá Ana"]:
+            return httpx.Response(400, text="erro")
+        requests.append((query["msg"][0], query["numbers"][0].split(",")))
+        return httpx.Response(200, text=f"id-{len(requests)}")
+
+    chunks = create_chunks_repo()
+
+    async def run():
+        engine = SMSDispatcher("http://sms.local/v1", "token", "9", chunks, chunk_size=10, rate_limit=0,
+                               retries=1, retry_backoff=0, transport=httpx.MockTransport(handler))
+        try:
+            return await engine.dispatch("pers", len(contacts), lambda s, e: iter(contacts[s:e]), "ignorada")
+        finally:
+            await engine.close()
+
+    # 1. Uma requisição por texto distinto; o grupo que falhou fica pendente
+    progress = asyncio.run(run())
+    assert not progress["complete"] and progress["failed_chunks"] == 1
+    assert requests == [("Olá Bia", [phone for phone, _ in contacts[0::2]])]
+    assert chunks.for_campaign("pers")[0]["sentGroups"] == 1
+    print("✅ Lote agrupado por mensagem final, progresso do grupo gravado")
+
+    # 2. Retomada envia só o grupo que faltava e mantém o id do provedor
+    fail_ana = False
+    progress = asyncio.run(run())
+    assert progress["complete"]
+    assert [msg for msg, _ in requests] == ["Olá Bia", "Olá Ana"]
+    chunk = chunks.for_campaign("pers")[0]
+    assert chunk["sentGroups"] == 2 and chunk["providerId"] == "id-1"
+    print("✅ Retomada não reenviou o grupo confirmado")
+
+
+if __name__ == "__main__":
+    test_sms_dispatch()
+    test_personalized_dispatch()
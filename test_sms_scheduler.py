@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Teste do agendador de campanhas SMS (sms_scheduler.py)
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database import ConnectionPool, DispatchChunkRepository, create_schema
+from sms_scheduler import CampaignScheduler, SendWindow, parse_start
+
+
+def create_chunks_repo():
+    path = os.path.join(tempfile.mkdtemp(), "autocred_test.db")
+    pool = ConnectionPool(path, size=2)
+    with pool.transaction() as conn:
+        create_schema(conn)
+    return DispatchChunkRepository(pool)
+
+
+def plan_chunks(chunks, campaign_id, count, size=100):
+    chunks.insert_many([
+        {
+            "id": f"{campaign_id}:{index}", "campaignId": campaign_id, "chunkIndex": index,
+            "start": index * size, "end": (index + 1) * size, "status": "pending",
+            "attempts": 0, "sentGroups": 0
+        }
+        for index in range(count)
+    ])
+
+
+def test_send_window():
+    print("🕘 TESTE - JANELA DE ENVIO")
+    print("=" * 50)
+
+    window = SendWindow({"monday": "09:00-12:00,13:00-18:00", "friday": "09:00-18:00"})
+    monday = datetime(2030, 1, 7, 8, 0)  # segunda-feira
+    assert window.next_open(monday) == datetime(2030, 1, 7, 9, 0)
+    assert window.next_open(datetime(2030, 1, 7, 12, 30)) == datetime(2030, 1, 7, 13, 0)
+    assert window.is_open(datetime(2030, 1, 7, 10, 0))
+    # Depois do expediente de segunda, só na sexta
+    assert window.next_open(datetime(2030, 1, 7, 18, 0)) == datetime(2030, 1, 11, 9, 0)
+    print("✅ Próxima abertura respeita intervalos e dias fechados")
+
+    # 4 lotes de 1h a partir das 10h: 10h, 11h, (almoço) 13h, 14h
+    times = window.spread(datetime(2030, 1, 7, 10, 0), [3600] * 4)
+    assert [moment.hour for moment in times] == [10, 11, 13, 14]
+    assert SendWindow().next_open(monday) == monday
+    print("✅ Lotes espalhados só com a janela aberta")
+
+    assert parse_start("31/01/2030", "08:30") == datetime(2030, 1, 31, 8, 30)
+    assert parse_start("2030-01-31") == datetime(2030, 1, 31)
+    for invalid in ({"funday": "09:00-10:00"}, {"monday": "18:00-09:00"}, {"monday": "closed"}):
+        try:
+            SendWindow(invalid)
+        except ValueError:
+            continue
+        raise AssertionError(f"Janela aceita: {invalid}")
+    print("✅ Datas e janelas inválidas rejeitadas")
+
+
+def test_campaign_scheduler():
+    print("⏰ TESTE - AGENDADOR DE CAMPANHAS")
+    print("=" * 50)
+
+    chunks = create_chunks_repo()
+    plan_chunks(chunks, "camp", 5)
+    released = []
+    finished = []
+
+    async def release(batch):
+        for chunk in batch:
+            released.append((time.perf_counter(), chunk["chunkIndex"]))
+            chunks.update(chunk["id"], {"status": "sent"})
+
+    async def done():
+        finished.append(True)
+
+    # 1. 100 contatos por lote a 60.000/min = um lote a cada 0,1s
+    async def run_all():
+        scheduler = CampaignScheduler(chunks)
+        try:
+            started = time.perf_counter()
+            assert scheduler.schedule("camp", SendWindow(), None, 60000, release, on_done=done) == 5
+            assert scheduler.status("camp")["remaining_chunks"] == 5
+            while not finished:
+                await asyncio.sleep(0.01)
+            return started
+        finally:
+            await scheduler.close()
+
+    started = asyncio.run(run_all())
+    assert [index for _, index in released] == [0, 1, 2, 3, 4]
+    offsets = [moment - started for moment, _ in released]
+    assert offsets[-1] >= 0.38, offsets
+    assert all(chunk["releaseAt"] for chunk in chunks.for_campaign("camp"))
+    print(f"✅ 5 lotes liberados no ritmo pedido em {offsets[-1]:.2f}s")
+
+    # 2. Retomada: lotes enviados não voltam; o plano continua do próximo lote gravado
+    plan_chunks(chunks, "retomada", 4)
+    chunks.update("retomada:0", {"status": "sent"})
+    future = datetime.now() + timedelta(hours=2)
+    chunks.set_release_times({"retomada:1": future.isoformat()})
+    released.clear()
+
+    async def resume():
+        scheduler = CampaignScheduler(chunks)
+        try:
+            assert scheduler.schedule("retomada", SendWindow(), None, 6000, release) == 3
+            status = scheduler.status("retomada")
+            assert status["next_release"] == future.isoformat()
+            planned = [chunk["releaseAt"] for chunk in chunks.for_campaign("retomada")[1:]]
+            assert planned[0] == future.isoformat() and planned == sorted(planned)
+            assert scheduler.stats()["queued"] == 3
+
+            # Replanejada para depois: entradas do plano cancelado não contam como próxima liberação
+            plan_chunks(chunks, "adiada", 2)
+            scheduler.schedule("adiada", SendWindow(), future - timedelta(hours=1), 6000, release)
+            scheduler.cancel("adiada")
+            later = future + timedelta(hours=2)
+            scheduler.schedule("adiada", SendWindow(), later, 6000, release)
+            assert scheduler.status("adiada")["next_release"] == later.isoformat()
+            assert scheduler.stats()["next_release"] == future.isoformat()
+        finally:
+            await scheduler.close()
+
+    asyncio.run(resume())
+    assert not released
+    print("✅ Retomada preserva o plano e não reenvia lotes confirmados")
+
+
+if __name__ == "__main__":
+    test_send_window()
+    test_campaign_scheduler()
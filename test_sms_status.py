@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Teste do poller de status das campanhas SMS (sms_status.py)
+"""
+
+import asyncio
+import time
+from urllib.parse import parse_qs
+
+import httpx
+
+from sms_status import SMSStatusPoller
+
+
+def test_sms_status_poller():
+    print("📊 TESTE - POLLER DE STATUS SMS")
+    print("=" * 50)
+
+    calls = {}
+    active = 0
+    peak = 0
+    answers = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal active, peak
+        query = parse_qs(request.url.query.decode())
+        assert query["action"] == ["GetCampanha"]
+        provider_id = query["idCamp"][0]
+        calls[provider_id] = calls.get(provider_id, 0) + 1
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if provider_id == "fora":
+            return httpx.Response(502, text="erro")
+        return httpx.Response(200, text=answers.get(provider_id, "Em andamento"))
+
+    def poller():
+        return SMSStatusPoller("http://sms.local/v1", "token", interval=0.05, max_interval=0.4,
+                               batch_size=5, stable_polls=2, transport=httpx.MockTransport(handler))
+
+    # 1. Lotes limitados e campanhas terminais saem da lista
+    async def run_batches():
+        engine = poller()
+        try:
+            for i in range(12):
+                engine.watch(f"c{i}", f"p{i}", final=True)
+            answers["p0"] = "Campanha finalizada"
+            await asyncio.sleep(0.6)
+            return engine.stats(), engine.get("c0"), engine.get("c5"), engine.is_watching("c0")
+        finally:
+            await engine.close()
+
+    stats, finished, stable, watching = asyncio.run(run_batches())
+    assert peak <= 5, peak
+    assert finished["terminal"] and not watching and calls["p0"] == 1
+    assert stable["api_status"] == "Em andamento" and stable["terminal"]
+    assert stats["watching"] == 0
+    print(f"✅ 12 campanhas em lotes de até 5 ({peak} simultâneas), terminais pararam de ser consultadas")
+
+    # 2. Backoff: resposta igual dobra o intervalo; erro mantém a última resposta boa
+    async def run_backoff():
+        engine = poller()
+        try:
+            engine.watch("ativa", "ativa")
+            engine.watch("erro", "fora")
+            await asyncio.sleep(0.5)
+            return engine.get("ativa"), engine.get("erro"), calls["ativa"], engine.is_watching("ativa")
+        finally:
+            await engine.close()
+
+    active_status, failing, active_calls, still_watching = asyncio.run(run_backoff())
+    # 0,05 + 0,1 + 0,2 (+ 0,4): 4 ou 5 consultas em 0,5s em vez de 10
+    assert 3 <= active_calls <= 5, active_calls
+    assert active_status["next_interval"] == 0.4 and still_watching and not active_status["terminal"]
+    assert failing["error"] and failing["api_status"] is None
+    print(f"✅ Backoff adaptativo: {active_calls} consultas em 0,5s; campanha não finalizada continua acompanhada")
+
+    # 3. Leitura do cache
+    async def read_cache():
+        engine = poller()
+        try:
+            await engine.refresh("cache", "p1")
+            started = time.perf_counter()
+            for _ in range(10000):
+                engine.get("cache")
+            return (time.perf_counter() - started) / 10000
+        finally:
+            await engine.close()
+
+    per_read = asyncio.run(read_cache())
+    assert per_read < 0.0001
+    print(f"✅ Status lido do cache em {per_read * 1e6:.1f}µs")
+
+
+if __name__ == "__main__":
+    test_sms_status_poller()
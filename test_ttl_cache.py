@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Teste do cache com TTL e despejo LRU (ttl_cache.py)
+"""
+
+import time
+
+from ttl_cache import TTLCache
+
+
+def test_ttl_cache():
+    print("⏱️ TESTE - CACHE TTL/LRU")
+    print("=" * 50)
+
+    # 1. Entrada expira após o TTL
+    cache = TTLCache("qr", maxsize=10, ttl=0.05)
+    cache["agent_1"] = {"qrcode": "data:image/png;base64,AAAA"}
+    assert cache.get("agent_1")["qrcode"].endswith("AAAA")
+    time.sleep(0.06)
+    assert cache.get("agent_1") is None and "agent_1" not in cache
+    assert cache.stats()["expirations"] == 1
+    print("✅ QR Code expira após o TTL")
+
+    # 2. Limite de tamanho despeja o menos usado recentemente
+    cache = TTLCache("conexoes", maxsize=2, ttl=None)
+    cache["a"] = 1
+    cache["b"] = 2
+    cache.get("a")
+    cache["c"] = 3
+    assert set(cache) == {"a", "c"} and cache.stats()["evictions"] == 1
+    print("✅ LRU despeja a entrada menos usada")
+
+    # 3. TTL deslizante renova a cada leitura; TTL por entrada sobrepõe o padrão
+    cache = TTLCache("estado", maxsize=10, ttl=0.08, sliding=True)
+    cache["agent_1"] = "open"
+    cache.set("agent_2", "close", ttl=None)
+    for _ in range(3):
+        time.sleep(0.04)
+        assert cache.get("agent_1") == "open"
+    time.sleep(0.1)
+    assert "agent_1" not in cache and cache["agent_2"] == "close"
+    print("✅ TTL deslizante e TTL por entrada")
+
+    # 4. Métricas e snapshot serializável
+    stats = cache.stats()
+    assert stats["hits"] == 4 and stats["misses"] == 0 and stats["size"] == 1
+    assert cache.snapshot() == {"agent_2": "close"}
+    print(f"✅ Métricas: {stats}")
+
+
+if __name__ == "__main__":
+    test_ttl_cache()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Teste da fila de ingestão de webhooks - lotes, backpressure e ordem por instância
+"""
+
+import asyncio
+
+from webhook_queue import WebhookDeduper, WebhookQueue, webhook_event_key, webhook_event_time
+
+
+def test_batches_and_order():
+    """Eventos da mesma instância chegam em ordem, agrupados em lotes"""
+    async def run():
+        received = []
+        batch_sizes = []
+
+        async def handler(batch):
+            batch_sizes.append(len(batch))
+            received.extend(batch)
+
+        queue = WebhookQueue(handler, maxsize=1000, workers=3, batch_size=50)
+        for i in range(300):
+            assert queue.enqueue({"instance": f"agent_{i % 5}", "seq": i}, key=f"agent_{i % 5}")
+        await queue.drain()
+        stats = queue.stats()
+        await queue.stop()
+        return received, batch_sizes, stats
+
+    received, batch_sizes, stats = asyncio.run(run())
+    assert len(received) == 300
+    assert max(batch_sizes) <= 50
+    assert len(batch_sizes) < 300, "eventos enfileirados juntos devem sair em lote"
+    for instance in range(5):
+        seqs = [event["seq"] for event in received if event["instance"] == f"agent_{instance}"]
+        assert seqs == sorted(seqs)
+    assert stats["processed"] == 300 and stats["depth"] == 0
+    print(f"✅ 300 eventos em {len(batch_sizes)} lotes, ordem por instância mantida")
+
+
+def test_backpressure():
+    """Fila cheia recusa o evento em vez de bloquear o endpoint"""
+    async def run():
+        release = asyncio.Event()
+
+        async def handler(batch):
+            await release.wait()
+
+        queue = WebhookQueue(handler, maxsize=4, workers=1, batch_size=1)
+        accepted = [queue.enqueue({"seq": i}, key="agent_1") for i in range(10)]
+        await asyncio.sleep(0)
+        # O worker tirou um evento da fila: cabe mais um
+        accepted.append(queue.enqueue({"seq": 10}, key="agent_1"))
+        stats = queue.stats()
+        release.set()
+        await queue.stop()
+        return accepted, stats, queue.stats()
+
+    accepted, stats, final = asyncio.run(run())
+    assert accepted[:4] == [True] * 4 and accepted[4:10] == [False] * 6
+    assert accepted[10] is True
+    assert stats["rejected"] == 6 and stats["max_depth"] == 4
+    assert final["processed"] == 5
+    print("✅ Backpressure: 6 eventos recusados com a fila cheia")
+
+
+def test_handler_errors():
+    """Erro no handler conta no lote e não derruba o worker"""
+    async def run():
+        calls = []
+
+        async def handler(batch):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise RuntimeError("falha")
+
+        queue = WebhookQueue(handler, maxsize=10, workers=1, batch_size=10)
+        queue.enqueue({"seq": 1})
+        await queue.drain()
+        queue.enqueue({"seq": 2})
+        await queue.drain()
+        await queue.stop()
+        return calls, queue.stats()
+
+    calls, stats = asyncio.run(run())
+    assert len(calls) == 2
+    assert stats["errors"] == 1 and stats["processed"] == 1
+    print("✅ Worker segue vivo depois de um lote com erro")
+
+
+def test_dedupe_keys():
+    """Mesmo evento reenviado gera a mesma chave; eventos diferentes não colidem"""
+    message = {"event": "MESSAGES_UPSERT", "instance": "agent_1", "data": {"key": {"id": "ABC"}}}
+    assert webhook_event_key(message) == webhook_event_key(dict(message))
+    other = {"event": "MESSAGES_UPSERT", "instance": "agent_2", "data": {"key": {"id": "ABC"}}}
+    assert webhook_event_key(message) != webhook_event_key(other)
+
+    delivered = {"event": "MESSAGES_UPDATE", "instance": "agent_1", "data": {"key": {"id": "ABC"}, "status": "DELIVERY_ACK"}}
+    read = {"event": "MESSAGES_UPDATE", "instance": "agent_1", "data": {"key": {"id": "ABC"}, "status": "READ"}}
+    assert webhook_event_key(delivered) != webhook_event_key(read)
+
+    first = {"event": "CONNECTION_UPDATE", "instance": "agent_1", "date_time": "2024-05-01T10:00:00.100Z", "data": {"state": "connecting"}}
+    second = {"event": "CONNECTION_UPDATE", "instance": "agent_1", "date_time": "2024-05-01T10:00:01.200Z", "data": {"state": "open"}}
+    assert webhook_event_key(first) != webhook_event_key(second)
+    # Mesmo momento (timestamp em segundos), estados diferentes: eventos distintos
+    connecting = {"event": "CONNECTION_UPDATE", "instance": "agent_1", "data": {"state": "connecting", "timestamp": 1714557600}}
+    opened = {"event": "CONNECTION_UPDATE", "instance": "agent_1", "data": {"state": "open", "timestamp": 1714557600}}
+    assert webhook_event_key(connecting) != webhook_event_key(opened)
+    assert webhook_event_key(opened) == webhook_event_key(dict(opened))
+
+    # Sem id nem data: o corpo bruto identifica o evento
+    assert webhook_event_key({"event": "X"}, b'{"a": 1}') == webhook_event_key({"event": "X"}, b'{"a": 1}')
+    assert webhook_event_key({"event": "X"}, b'{"a": 1}') != webhook_event_key({"event": "X"}, b'{"a": 2}')
+
+    assert webhook_event_time(first) < webhook_event_time(second)
+    assert webhook_event_time({"data": {"timestamp": 1714557600}}) == 1714557600
+    assert webhook_event_time({"data": {"timestamp": 1714557600000}}) == 1714557600
+    assert webhook_event_time({"data": {}}) is None
+    print("✅ Chaves de deduplicação e momento dos eventos")
+
+
+def test_deduper_window():
+    """Conjunto limitado: reenvio é detectado, entradas antigas saem pelo LRU"""
+    deduper = WebhookDeduper(maxsize=3, window=60)
+    keys = [webhook_event_key({"event": "E", "instance": "a", "id": i}) for i in range(4)]
+    assert not deduper.seen(keys[0])
+    deduper.mark(keys[0])
+    assert deduper.seen(keys[0])
+    for key in keys[1:]:
+        deduper.mark(key)
+    # keys[0] foi despejado pelo limite de tamanho
+    assert not deduper.seen(keys[0])
+    assert deduper.seen(keys[3])
+    stats = deduper.stats()
+    assert stats["duplicates"] == 2 and stats["size"] == 3 and stats["evictions"] == 1
+
+    expiring = WebhookDeduper(maxsize=10, window=0)
+    expiring.mark(keys[1])
+    assert not expiring.seen(keys[1])
+    print("✅ Deduper com limite de tamanho e janela de tempo")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando fila de webhooks...")
+    test_batches_and_order()
+    test_backpressure()
+    test_handler_errors()
+    test_dedupe_keys()
+    test_deduper_window()
+    print("🎉 Todos os testes da fila de webhooks passaram!")
@@ -0,0 +1,138 @@
+"""
+⏱️ AutoCred TTL Cache - Cache limitado com expiração por entrada e despejo LRU
+
+Usado no lugar dos dicts que cresciam para sempre (QR Codes, conexões WhatsApp):
+cada entrada expira após o seu TTL, o total de entradas é limitado (a menos
+usada recentemente sai primeiro) e hits/misses/despejos ficam contados.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Optional
+
+_MISSING = object()
+
+
+class TTLCache(MutableMapping):
+    """Mapeamento com TTL por entrada, limite de tamanho (LRU) e métricas
+
+    sliding=True renova o TTL a cada leitura - bom para estado de conexão que deve
+    sobreviver enquanto é consultado; QR Codes usam TTL fixo (expiram no WhatsApp).
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: Optional[float], sliding: bool = False):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sliding = sliding
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()  # chave -> (valor, expira_em, ttl)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        return time.monotonic() + ttl if ttl is not None else None
+
+    def _lookup(self, key: Any) -> Any:
+        """Valor vivo da chave (marcando uso recente) ou _MISSING - não conta métricas"""
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at, ttl = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        if self.sliding and ttl is not None:
+            self._data[key] = (value, self._expires_at(ttl), ttl)
+        return value
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = _MISSING):
+        """Grava com o TTL padrão do cache ou um TTL específico da entrada"""
+        ttl = self.ttl if ttl is _MISSING else ttl
+        with self._lock:
+            self._data[key] = (value, self._expires_at(ttl), ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def __getitem__(self, key: Any) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Any, value: Any):
+        self.set(key, value)
+
+    def __delitem__(self, key: Any):
+        with self._lock:
+            del self._data[key]
+
+    def __contains__(self, key: Any) -> bool:
+        with self._lock:
+            return self._lookup(key) is not _MISSING
+
+    def purge(self) -> int:
+        """Remove as entradas expiradas - retorna quantas saíram"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                key for key, (_, expires_at, _) in self._data.items()
+                if expires_at is not None and expires_at <= now
+            ]
+            for key in expired:
+                del self._data[key]
+            self.expirations += len(expired)
+            return len(expired)
+
+    def __iter__(self) -> Iterator[Any]:
+        with self._lock:
+            self.purge()
+            return iter(list(self._data))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.purge()
+            return len(self._data)
+
+    def items(self):
+        return self.snapshot().items()
+
+    def values(self):
+        return self.snapshot().values()
+
+    def snapshot(self) -> Dict[Any, Any]:
+        """Cópia das entradas vivas (para respostas JSON), sem afetar LRU nem métricas"""
+        with self._lock:
+            self.purge()
+            return {key: value for key, (value, _, _) in self._data.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
@@ -0,0 +1,196 @@
+"""
+📬 AutoCred Webhook Queue - Ingestão assíncrona dos webhooks da Evolution API
+
+O endpoint só valida e enfileira (resposta imediata); um pool de workers esvazia
+as filas limitadas em lotes. Cada instância cai sempre na mesma fila/worker, então
+os eventos de uma instância são processados na ordem de chegada. Com a fila cheia
+o endpoint responde 503 + Retry-After e a Evolution reenvia depois - a latência do
+webhook fica estável nos picos.
+
+A Evolution também reenvia eventos quando o webhook demora: o WebhookDeduper guarda
+um digest de 16 bytes por evento já aceito (conjunto LRU com janela de tempo), então
+uma tempestade de reenvios é respondida sem tocar na fila.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ttl_cache import TTLCache
+
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "100"))
+WEBHOOK_DEDUPE_SIZE = int(os.getenv("WEBHOOK_DEDUPE_SIZE", "100000"))
+WEBHOOK_DEDUPE_WINDOW = float(os.getenv("WEBHOOK_DEDUPE_WINDOW", "900"))
+
+
+class WebhookQueue:
+    """Filas limitadas (uma por worker) que entregam lotes de eventos ao handler"""
+
+    def __init__(self, handler: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+                 maxsize: int = WEBHOOK_QUEUE_SIZE, workers: int = WEBHOOK_WORKERS,
+                 batch_size: int = WEBHOOK_BATCH_SIZE):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.worker_count = workers
+        self.batch_size = batch_size
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.enqueued = 0
+        self.rejected = 0
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.last_batch_ms = 0.0
+
+    def start(self):
+        """Cria as filas e os workers no event loop atual (idempotente)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._workers:
+            return
+        self._loop = loop
+        shard_size = max(1, self.maxsize // self.worker_count)
+        self._queues = [asyncio.Queue(maxsize=shard_size) for _ in range(self.worker_count)]
+        self._workers = [
+            loop.create_task(self._worker(queue), name=f"webhook-worker-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+        print(f"📬 Fila de webhooks iniciada: {self.worker_count} workers, capacidade {self.maxsize}")
+
+    def enqueue(self, event: Dict[str, Any], key: str = "") -> bool:
+        """Enfileira sem esperar na fila da chave - False quando ela está cheia (backpressure)"""
+        self.start()
+        queue = self._queues[zlib.crc32(key.encode("utf-8")) % len(self._queues)]
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        return True
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            started = time.perf_counter()
+            try:
+                await self.handler(batch)
+                self.processed += len(batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Erro ao processar lote de webhooks ({len(batch)} eventos): {e}")
+            finally:
+                self.batches += 1
+                self.last_batch_ms = round((time.perf_counter() - started) * 1000, 3)
+                for _ in batch:
+                    queue.task_done()
+
+    async def drain(self, timeout: float = 10):
+        """Aguarda as filas esvaziarem (desligamento e testes)"""
+        if self._queues:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+
+    async def stop(self, timeout: float = 10):
+        try:
+            await self.drain(timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Fila de webhooks encerrada com {self.depth} eventos pendentes")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "maxsize": self.maxsize,
+            "max_depth": self.max_depth,
+            "workers": len(self._workers),
+            "batch_size": self.batch_size,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "last_batch_ms": self.last_batch_ms
+        }
+
+
+def webhook_event_time(data: Dict[str, Any]) -> Optional[float]:
+    """Momento do evento na Evolution (epoch) - `date_time` da v2 ou `timestamp` do payload"""
+    payload = data.get("data") if isinstance(data.get("data"), dict) else {}
+    value = data.get("date_time") or payload.get("date_time") or payload.get("timestamp")
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) or str(value).replace(".", "", 1).isdigit():
+        number = float(value)
+        # Epoch em milissegundos
+        return number / 1000 if number > 1e11 else number
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def webhook_event_key(data: Dict[str, Any], body: bytes = b"") -> bytes:
+    """Identidade do evento: id da mensagem, senão instância+evento+momento+estado, senão o corpo"""
+    payload = data.get("data") if isinstance(data.get("data"), dict) else {}
+    key = payload.get("key") if isinstance(payload.get("key"), dict) else {}
+    event_id = data.get("id") or payload.get("id") or payload.get("keyId") or key.get("id")
+    if event_id:
+        identity = f"{data.get('instance')}|{data.get('event')}|id:{event_id}"
+        if payload.get("status"):
+            # MESSAGES_UPDATE repete o id da mensagem a cada mudança de status
+            identity += f"|{payload.get('status')}"
+    else:
+        moment = data.get("date_time") or payload.get("date_time") or payload.get("timestamp")
+        if not moment:
+            return hashlib.blake2b(body, digest_size=16).digest()
+        # Dois CONNECTION_UPDATE no mesmo segundo (connecting -> open) só diferem no estado
+        state = payload.get("state") or payload.get("status") or ""
+        identity = f"{data.get('instance')}|{data.get('event')}|{moment}|{state}"
+    return hashlib.blake2b(identity.encode("utf-8"), digest_size=16).digest()
+
+
+class WebhookDeduper:
+    """Conjunto LRU limitado e com janela de tempo dos eventos já aceitos"""
+
+    def __init__(self, maxsize: int = WEBHOOK_DEDUPE_SIZE, window: float = WEBHOOK_DEDUPE_WINDOW):
+        self._seen = TTLCache("webhook_dedupe", maxsize, window)
+        self.duplicates = 0
+        self.out_of_order = 0
+
+    def seen(self, key: bytes) -> bool:
+        if key in self._seen:
+            self.duplicates += 1
+            return True
+        return False
+
+    def mark(self, key: bytes):
+        """Marca só depois do evento ter entrado na fila (503 não conta como entregue)"""
+        self._seen.set(key, True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._seen.stats(),
+            "duplicates": self.duplicates,
+            "out_of_order": self.out_of_order
+        }